@@ -5,11 +5,16 @@ Pluggable AI conflict detection & resolution helpers.
 
 Design:
 - detect_conflicts(application_id) -> list of created LandConflict records (or empty list)
+- detect_conflicts_batch(application_ids) -> {application_id: [created conflict ids]}
+- both also record public/institutional facilities (facility_index) near the application
+  polygon in application.ai_analysis_result['nearby_facilities']
 - resolve_conflict(conflict_id, action, resolved_by=None) -> updates record and returns it
 
 This module uses a safe local heuristic by default (string matching, owner duplicates,
-and geometric intersection via geoalchemy2->shapely when geometries exist). It is
-designed to be pluggable so an external ML/LLM provider can be added later.
+and geometric intersection via geoalchemy2->shapely when geometries exist). Spatial
+overlaps come from spatial_index.find_parcel_overlaps (PostGIS in SQL, or the
+process-level STRtree) instead of a scan over every parcel. It is designed to be
+pluggable so an external ML/LLM provider can be added later.
 """
 from datetime import datetime
 import math
@@ -18,10 +23,13 @@ import logging
 import sys
 
 
-from geoalchemy2.shape import to_shape
 from shapely.geometry import shape
+from sqlalchemy import insert, or_
 
+from facility_index import annotate_proximity
+from geometry_cache import application_geometry
 from models import db, LandApplication, LandParcel, LandConflict, AuditLog
+from spatial_index import find_parcel_overlaps, find_parcel_overlaps_many
 
 
 
@@ -43,6 +51,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Applications handled per spatial join / bulk insert in detect_conflicts_batch.
+BATCH_CHUNK_SIZE = 500
+
 
 def detect_conflicts(application_id):
     """Detect potential conflicts for an application.
@@ -84,7 +95,7 @@ def detect_conflicts(application_id):
         app_geom = None
         try:
             if application.coordinates is not None:
-                app_geom = to_shape(application.coordinates)
+                app_geom = application_geometry(application).geom
             else:
                 logger.warning('Application %s has no coordinates for spatial analysis', application_id)
         except Exception as e:
@@ -93,46 +104,35 @@ def detect_conflicts(application_id):
 
         if app_geom:
             print(f"[ai_conflict] Application has geometry; running spatial checks")
-            parcels = LandParcel.query.filter(LandParcel.coordinates != None).all()
-            for p in parcels:
-                try:
-                    if p.coordinates is None:
-                        continue
-                    parcel_geom = to_shape(p.coordinates)
-                    if parcel_geom.intersects(app_geom):
-                        inter = parcel_geom.intersection(app_geom)
-                        # compute overlap relative to parcel area
-                        overlap_pct = 0.0
-                        try:
-                            if parcel_geom.area > 0:
-                                overlap_pct = float(inter.area / parcel_geom.area)
-                        except Exception:
-                            overlap_pct = 0.0
-
-                        # confidence increases with overlap percentage
-                        confidence = min(0.95, 0.2 + overlap_pct * 0.9)
-                        candidates.append((p, 'spatial_overlap', confidence, overlap_pct))
-                        print(f"[ai_conflict] spatial overlap with parcel id={p.id} overlap_pct={overlap_pct} confidence={confidence}")
-                except Exception:
-                    logger.exception('Error processing parcel geometry id=%s', getattr(p, 'id', None))
-
-        # Deduplicate candidates by parcel id and pick the highest-confidence reason
-        best = {}
-        for entry in candidates:
-            parcel = entry[0]
-            reason = entry[1]
-            confidence = entry[2]
-            overlap_pct = entry[3] if len(entry) > 3 else None
-            pid = parcel.id
-            prev = best.get(pid)
-            score = confidence
-            if prev is None or score > prev['confidence']:
-                best[pid] = {
-                    'parcel': parcel,
-                    'reason': reason,
-                    'confidence': score,
-                    'overlap_pct': overlap_pct
-                }
+            # PostGIS computes the overlap figures in SQL; otherwise the STRtree does it
+            overlaps = find_parcel_overlaps(app_geom, application_id=application.id)
+            parcels_by_id = {}
+            if overlaps:
+                hit_ids = [o['parcel_id'] for o in overlaps]
+                parcels_by_id = {p.id: p for p in LandParcel.query.filter(LandParcel.id.in_(hit_ids)).all()}
+            print(f"[ai_conflict] spatial lookup returned {len(overlaps)} intersecting parcels")
+            for o in overlaps:
+                p = parcels_by_id.get(o['parcel_id'])
+                if p is None:
+                    # deleted since the index was built
+                    continue
+                # overlap relative to parcel area
+                overlap_pct = o['overlap_pct'] or 0.0
+
+                # confidence increases with overlap percentage
+                confidence = min(0.95, 0.2 + overlap_pct * 0.9)
+                candidates.append((p, 'spatial_overlap', confidence, overlap_pct, o['overlap_area']))
+                print(f"[ai_conflict] spatial overlap with parcel id={p.id} overlap_pct={overlap_pct} "
+                      f"overlap_m2={o['overlap_area']:.1f} confidence={confidence}")
+
+            # 4) Public / institutional facilities close to the plot
+            nearby = annotate_proximity([app_geom])[0]
+            if nearby:
+                print(f"[ai_conflict] {len(nearby)} public/institutional facilities within range: "
+                      f"{', '.join(f['name'] for f in nearby)}")
+            _record_proximity(application, nearby)
+
+        best = _pick_best(candidates)
 
         # Persist LandConflict rows
         for pid, info in best.items():
@@ -140,84 +140,7 @@ def detect_conflicts(application_id):
             if info['confidence'] < 0.15:
                 continue
 
-            parcel = info['parcel']
-            reason = info['reason']
-            confidence = info['confidence']
-            overlap_pct = info.get('overlap_pct')
-            
-            # Build detailed description based on conflict type
-            details = []
-            
-            if reason == 'spatial_overlap':
-                details.append(f"⚠️ GEOGRAPHIC OVERLAP DETECTED")
-                details.append(f"\nThe boundaries of this application physically overlap with an existing registered parcel.")
-                details.append(f"\n📍 Conflicting Parcel: {parcel.parcel_number}")
-                details.append(f"👤 Current Owner: {parcel.owner_name or 'Unknown'}")
-                details.append(f"📞 Owner Phone: {parcel.owner_phone or 'N/A'}")
-                details.append(f"📧 Owner Email: {parcel.owner_email or 'N/A'}")
-                if overlap_pct:
-                    details.append(f"\n📊 Overlap Percentage: {overlap_pct * 100:.2f}% of the existing parcel")
-                details.append(f"📐 Parcel Size: {parcel.size or 'N/A'} hectares")
-                details.append(f"📍 Parcel Location: {parcel.location or 'N/A'}")
-                details.append(f"\n🔍 WHAT THIS MEANS:")
-                details.append(f"- Your application boundaries overlap with land already registered to {parcel.owner_name or 'another person'}")
-                details.append(f"- This could be a boundary error, survey mistake, or potential land dispute")
-                details.append(f"\n✅ REQUIRED ACTIONS:")
-                details.append(f"1. Verify your land boundaries are correct")
-                details.append(f"2. Check if you have proof of ownership for this specific area")
-                details.append(f"3. Contact {parcel.owner_name or 'the registered owner'} if this is a known boundary adjustment")
-                details.append(f"4. Provide updated survey documents showing correct boundaries")
-                
-            elif reason == 'owner_duplicate':
-                details.append(f"⚠️ DUPLICATE OWNER NRC DETECTED")
-                details.append(f"\nThe same National Registration Card (NRC) number is already associated with another parcel.")
-                details.append(f"\n📍 Existing Parcel: {parcel.parcel_number}")
-                details.append(f"👤 Owner Name on Record: {parcel.owner_name or 'Unknown'}")
-                details.append(f"🆔 NRC Number: {application.nrc_number}")
-                details.append(f"📍 Existing Parcel Location: {parcel.location or 'N/A'}")
-                details.append(f"📐 Existing Parcel Size: {parcel.size or 'N/A'} hectares")
-                details.append(f"\n🔍 WHAT THIS MEANS:")
-                details.append(f"- You already have a registered parcel in the system")
-                details.append(f"- This might be a legitimate second parcel registration")
-                details.append(f"- Or this could be a correction/update to your existing parcel")
-                details.append(f"\n✅ REQUIRED ACTIONS:")
-                details.append(f"1. Confirm this is a NEW parcel (not an update to parcel {parcel.parcel_number})")
-                details.append(f"2. If updating existing parcel, please contact the registry office")
-                details.append(f"3. Provide proof this is a separate land acquisition")
-                details.append(f"4. Ensure all documentation shows the new parcel location clearly")
-                
-            elif reason == 'location_match':
-                details.append(f"⚠️ SIMILAR LOCATION DETECTED")
-                details.append(f"\nYour application location matches or is very similar to an existing parcel location.")
-                details.append(f"\n📍 Your Location: {application.land_location}")
-                details.append(f"📍 Existing Parcel: {parcel.parcel_number}")
-                details.append(f"📍 Existing Location: {parcel.location or 'N/A'}")
-                details.append(f"👤 Current Owner: {parcel.owner_name or 'Unknown'}")
-                details.append(f"📐 Parcel Size: {parcel.size or 'N/A'} hectares")
-                details.append(f"\n🔍 WHAT THIS MEANS:")
-                details.append(f"- The location description you provided matches an existing registration")
-                details.append(f"- This could be the same plot/area or adjacent property")
-                details.append(f"\n✅ REQUIRED ACTIONS:")
-                details.append(f"1. Verify your location description is accurate and specific")
-                details.append(f"2. Provide more details to distinguish your parcel (street number, plot number)")
-                details.append(f"3. Confirm you're not attempting to register the same land as parcel {parcel.parcel_number}")
-                details.append(f"4. Submit updated location information if there was an error")
-            
-            description = "\n".join(details)
-            
-            title = f"⚠️ {reason.replace('_', ' ').title()}: {parcel.parcel_number}"
-            
-            conflict = LandConflict(
-                application_id=application.id,
-                conflicting_parcel_id=info['parcel'].id,
-                description=description,
-                detected_by_ai=True,
-                conflict_type=info['reason'],
-                title=title,
-                severity='medium' if info['confidence'] < 0.7 else 'high',
-                overlap_percentage=info.get('overlap_pct'),
-                confidence_score=info['confidence']
-            )
+            conflict = LandConflict(**_conflict_fields(application, info))
             db.session.add(conflict)
             created.append(conflict)
             print(f"[ai_conflict] created conflict candidate for parcel id={info['parcel'].id} reason={info['reason']} confidence={info['confidence']}")
@@ -255,6 +178,245 @@ def detect_conflicts(application_id):
         raise
 
 
+def detect_conflicts_batch(application_ids, chunk_size=BATCH_CHUNK_SIZE):
+    """Detect potential conflicts for many applications at once.
+
+    Runs the same heuristics as detect_conflicts, but per chunk of applications it does
+    one NRC query, one location query, one spatial join against all parcels, and one
+    bulk INSERT of the resulting LandConflict rows followed by a single commit.
+
+    Returns: dict mapping application id -> list of created LandConflict ids.
+    """
+    application_ids = list(dict.fromkeys(application_ids))
+    summary = {}
+    for start in range(0, len(application_ids), chunk_size):
+        chunk = application_ids[start:start + chunk_size]
+        try:
+            summary.update(_detect_conflicts_chunk(chunk))
+        except Exception as e:
+            print(f"[ai_conflict] ERROR detect_conflicts_batch for chunk starting at {chunk[0]}: {e}")
+            logger.exception('Failed to detect conflicts for applications %s..%s', chunk[0], chunk[-1])
+            db.session.rollback()
+            raise
+    return summary
+
+
+def _detect_conflicts_chunk(application_ids):
+    """Detect and persist conflicts for one chunk of detect_conflicts_batch."""
+    print(f"[ai_conflict] detect_conflicts_batch START for {len(application_ids)} applications")
+    applications = LandApplication.query.filter(LandApplication.id.in_(application_ids)).all()
+    candidates = {a.id: [] for a in applications}
+
+    # 1) Owner NRC duplicates, one query for the whole chunk
+    nrcs = {a.nrc_number for a in applications if a.nrc_number}
+    if nrcs:
+        by_nrc = {}
+        for p in LandParcel.query.filter(LandParcel.owner_nrc.in_(nrcs)).all():
+            by_nrc.setdefault(p.owner_nrc, []).append(p)
+        for a in applications:
+            for p in by_nrc.get(a.nrc_number, []):
+                candidates[a.id].append((p, 'owner_duplicate', 0.6))
+
+    # 2) Location textual match (substring), one OR-ed query then matched per application
+    locations = {a.land_location for a in applications if a.land_location}
+    if locations:
+        text_matches = LandParcel.query.filter(
+            or_(*[LandParcel.location.ilike(f"%{loc}%") for loc in locations])
+        ).all()
+        for a in applications:
+            if not a.land_location:
+                continue
+            needle = a.land_location.lower()
+            for p in text_matches:
+                if p.location and needle in p.location.lower():
+                    candidates[a.id].append((p, 'location_match', 0.4))
+
+    # 3) Spatial join of all application geometries against the parcels
+    with_geom = [a for a in applications if a.coordinates is not None]
+    geoms = []
+    for a in with_geom:
+        try:
+            geoms.append(application_geometry(a).geom)
+        except Exception as e:
+            logger.error('Failed to parse geometry for application %s: %s', a.id, e)
+            geoms.append(None)
+    overlaps = find_parcel_overlaps_many([a.id for a in with_geom], geoms)
+    if overlaps:
+        hit_ids = {o['parcel_id'] for o in overlaps}
+        parcels_by_id = {p.id: p for p in LandParcel.query.filter(LandParcel.id.in_(hit_ids)).all()}
+        for o in overlaps:
+            p = parcels_by_id.get(o['parcel_id'])
+            if p is None:
+                continue
+            overlap_pct = o['overlap_pct'] or 0.0
+            confidence = min(0.95, 0.2 + overlap_pct * 0.9)
+            candidates[o['application_id']].append((p, 'spatial_overlap', confidence, overlap_pct, o['overlap_area']))
+    print(f"[ai_conflict] batch spatial join returned {len(overlaps)} intersecting pairs")
+
+    # 4) Public / institutional facilities close to each plot
+    for a, nearby in zip(with_geom, annotate_proximity(geoms)):
+        _record_proximity(a, nearby)
+
+    # Build every LandConflict row in memory
+    rows = []
+    for a in applications:
+        for info in _pick_best(candidates[a.id]).values():
+            if info['confidence'] < 0.15:
+                continue
+            fields = _conflict_fields(a, info)
+            fields['created_at'] = datetime.utcnow()
+            rows.append(fields)
+
+    created = {a.id: [] for a in applications}
+    if rows:
+        result = db.session.execute(
+            insert(LandConflict).returning(LandConflict.id, LandConflict.application_id),
+            rows
+        )
+        for conflict_id, aid in result:
+            created[aid].append(conflict_id)
+
+    best_conf = {}
+    for r in rows:
+        best_conf[r['application_id']] = max(best_conf.get(r['application_id'], 0.0), r['confidence_score'])
+    for a in applications:
+        a.ai_processed = True
+        if created[a.id]:
+            a.ai_conflict_score = best_conf[a.id]
+            a.status = 'conflict'
+        else:
+            a.ai_conflict_score = 0.0
+        db.session.add(AuditLog(
+            user_id=None,
+            action='ai_detect_conflicts',
+            table_name='land_applications',
+            record_id=a.id,
+            new_values={'created_conflicts': created[a.id]},
+            timestamp=datetime.utcnow()
+        ))
+
+    db.session.commit()
+    print(f"[ai_conflict] detect_conflicts_batch END created={len(rows)}")
+    return created
+
+
+def _record_proximity(application, nearby):
+    """Store the facility proximity annotation in application.ai_analysis_result."""
+    result = dict(application.ai_analysis_result or {})
+    result['nearby_facilities'] = nearby
+    result['near_public_facility'] = bool(nearby)
+    # reassign rather than mutate so the JSON column is marked dirty
+    application.ai_analysis_result = result
+
+
+def _pick_best(candidates):
+    """Deduplicate candidates by parcel id and pick the highest-confidence reason."""
+    best = {}
+    for entry in candidates:
+        parcel = entry[0]
+        reason = entry[1]
+        confidence = entry[2]
+        overlap_pct = entry[3] if len(entry) > 3 else None
+        overlap_area = entry[4] if len(entry) > 4 else None
+        pid = parcel.id
+        prev = best.get(pid)
+        score = confidence
+        if prev is None or score > prev['confidence']:
+            best[pid] = {
+                'parcel': parcel,
+                'reason': reason,
+                'confidence': score,
+                'overlap_pct': overlap_pct,
+                'overlap_area': overlap_area
+            }
+    return best
+
+
+def _conflict_fields(application, info):
+    """Build the LandConflict column values for the best candidate of one parcel."""
+    parcel = info['parcel']
+    reason = info['reason']
+    confidence = info['confidence']
+    overlap_pct = info.get('overlap_pct')
+    overlap_area = info.get('overlap_area')
+
+    # Build detailed description based on conflict type
+    details = []
+
+    if reason == 'spatial_overlap':
+        details.append(f"⚠️ GEOGRAPHIC OVERLAP DETECTED")
+        details.append(f"\nThe boundaries of this application physically overlap with an existing registered parcel.")
+        details.append(f"\n📍 Conflicting Parcel: {parcel.parcel_number}")
+        details.append(f"👤 Current Owner: {parcel.owner_name or 'Unknown'}")
+        details.append(f"📞 Owner Phone: {parcel.owner_phone or 'N/A'}")
+        details.append(f"📧 Owner Email: {parcel.owner_email or 'N/A'}")
+        if overlap_pct:
+            details.append(f"\n📊 Overlap Percentage: {overlap_pct * 100:.2f}% of the existing parcel")
+        if overlap_area:
+            details.append(f"📏 Overlap Area: {overlap_area:,.0f} m² ({overlap_area / 10000:.3f} hectares)")
+        details.append(f"📐 Parcel Size: {parcel.size or 'N/A'} hectares")
+        details.append(f"📍 Parcel Location: {parcel.location or 'N/A'}")
+        details.append(f"\n🔍 WHAT THIS MEANS:")
+        details.append(f"- Your application boundaries overlap with land already registered to {parcel.owner_name or 'another person'}")
+        details.append(f"- This could be a boundary error, survey mistake, or potential land dispute")
+        details.append(f"\n✅ REQUIRED ACTIONS:")
+        details.append(f"1. Verify your land boundaries are correct")
+        details.append(f"2. Check if you have proof of ownership for this specific area")
+        details.append(f"3. Contact {parcel.owner_name or 'the registered owner'} if this is a known boundary adjustment")
+        details.append(f"4. Provide updated survey documents showing correct boundaries")
+
+    elif reason == 'owner_duplicate':
+        details.append(f"⚠️ DUPLICATE OWNER NRC DETECTED")
+        details.append(f"\nThe same National Registration Card (NRC) number is already associated with another parcel.")
+        details.append(f"\n📍 Existing Parcel: {parcel.parcel_number}")
+        details.append(f"👤 Owner Name on Record: {parcel.owner_name or 'Unknown'}")
+        details.append(f"🆔 NRC Number: {application.nrc_number}")
+        details.append(f"📍 Existing Parcel Location: {parcel.location or 'N/A'}")
+        details.append(f"📐 Existing Parcel Size: {parcel.size or 'N/A'} hectares")
+        details.append(f"\n🔍 WHAT THIS MEANS:")
+        details.append(f"- You already have a registered parcel in the system")
+        details.append(f"- This might be a legitimate second parcel registration")
+        details.append(f"- Or this could be a correction/update to your existing parcel")
+        details.append(f"\n✅ REQUIRED ACTIONS:")
+        details.append(f"1. Confirm this is a NEW parcel (not an update to parcel {parcel.parcel_number})")
+        details.append(f"2. If updating existing parcel, please contact the registry office")
+        details.append(f"3. Provide proof this is a separate land acquisition")
+        details.append(f"4. Ensure all documentation shows the new parcel location clearly")
+
+    elif reason == 'location_match':
+        details.append(f"⚠️ SIMILAR LOCATION DETECTED")
+        details.append(f"\nYour application location matches or is very similar to an existing parcel location.")
+        details.append(f"\n📍 Your Location: {application.land_location}")
+        details.append(f"📍 Existing Parcel: {parcel.parcel_number}")
+        details.append(f"📍 Existing Location: {parcel.location or 'N/A'}")
+        details.append(f"👤 Current Owner: {parcel.owner_name or 'Unknown'}")
+        details.append(f"📐 Parcel Size: {parcel.size or 'N/A'} hectares")
+        details.append(f"\n🔍 WHAT THIS MEANS:")
+        details.append(f"- The location description you provided matches an existing registration")
+        details.append(f"- This could be the same plot/area or adjacent property")
+        details.append(f"\n✅ REQUIRED ACTIONS:")
+        details.append(f"1. Verify your location description is accurate and specific")
+        details.append(f"2. Provide more details to distinguish your parcel (street number, plot number)")
+        details.append(f"3. Confirm you're not attempting to register the same land as parcel {parcel.parcel_number}")
+        details.append(f"4. Submit updated location information if there was an error")
+
+    description = "\n".join(details)
+
+    title = f"⚠️ {reason.replace('_', ' ').title()}: {parcel.parcel_number}"
+
+    return dict(
+        application_id=application.id,
+        conflicting_parcel_id=info['parcel'].id,
+        description=description,
+        detected_by_ai=True,
+        conflict_type=info['reason'],
+        title=title,
+        severity='medium' if info['confidence'] < 0.7 else 'high',
+        overlap_percentage=info.get('overlap_pct'),
+        confidence_score=info['confidence']
+    )
+
+
 def log_audit(action, table_name, record_id, old_values=None, new_values=None):
     """Logs an audit event to the AuditLog model."""
     try:
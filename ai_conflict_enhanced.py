@@ -4,19 +4,20 @@ ai_conflict_enhanced.py
 Enhanced AI conflict detection using document content analysis.
 """
 import logging
-import os
-import pickle
-from collections import defaultdict
 from datetime import datetime
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sqlalchemy import insert, select
+from sqlalchemy.orm import joinedload
 
-from document_processing import extract_document_text
+from document_index import document_index
 from models import db, Document, LandApplication, LandConflict, AuditLog
+from text_cache import document_texts
 
 logger = logging.getLogger(__name__)
 
+SIMILARITY_THRESHOLD = 0.8  # cosine similarity above which two documents conflict
+INSERT_CHUNK_SIZE = 500
+
 
 def log_audit(action, table_name, record_id, old_values=None, new_values=None):
     """Logs an audit event to the AuditLog model."""
@@ -43,7 +44,11 @@ def detect_conflicts_from_documents(application_id):
 
     - Extracts text from all documents in the new application.
     - Compares against documents from all other applications.
-    - Uses TF-IDF and cosine similarity to find potential document duplicates.
+    - Uses TF-IDF and cosine similarity against the persistent document index
+      (document_index.py) to find potential document duplicates.
+    - Reports the best match per other application; the matched documents, their
+      applications and parcels are loaded in one query and the conflicts are written
+      with a single bulk insert.
     """
     try:
         application = LandApplication.query.get(application_id)
@@ -52,105 +57,117 @@ def detect_conflicts_from_documents(application_id):
             return []
 
         # 1. Extract text from the new application's documents
-        new_docs_text = {}
-        for doc in application.documents:
-            text = extract_document_text(doc.file_path, doc.mime_type)
-            if text:
-                new_docs_text[doc.id] = text
+        new_docs_text = {
+            doc_id: text for doc_id, text in document_texts(application.documents).items() if text
+        }
 
         if not new_docs_text:
             logger.info(f"No text could be extracted from documents for application {application_id}")
             return []
 
-        # 2. Get all documents from other applications
-        other_docs = Document.query.filter(Document.application_id != application_id).all()
-        if not other_docs:
-            logger.info("No other documents in the system to compare against.")
-            return []
+        # 2. Make sure the new documents are in the persistent TF-IDF index; documents
+        #    of other applications were added when they were uploaded
+        document_index.add_documents(application.documents)
+
+        # 3. Vectorize the new documents and find the indexed documents of other
+        #    applications above the similarity threshold
+        new_doc_ids = list(new_docs_text.keys())
+        new_docs_matrix = document_index.transform(list(new_docs_text.values()))
+        query_rows, match_doc_ids, scores = document_index.top_matches(
+            new_docs_matrix, SIMILARITY_THRESHOLD, exclude_application_id=application_id
+        )
 
-        # 3. Group documents by application to avoid intra-application conflicts
-        docs_by_app = defaultdict(list)
-        for doc in other_docs:
-            docs_by_app[doc.application_id].append(doc)
-
-        # 4. Vectorize and compare
-        vectorizer_path = 'tfidf_vectorizer.pkl'
-        all_texts = list(new_docs_text.values()) + [extract_document_text(d.file_path, d.mime_type) for app_docs in
-                                                    docs_by_app.values() for d in app_docs]
-        
-        if os.path.exists(vectorizer_path):
-            with open(vectorizer_path, 'rb') as f:
-                vectorizer = pickle.load(f)
-            tfidf_matrix = vectorizer.transform(all_texts)
-        else:
-            vectorizer = TfidfVectorizer(stop_words='english')
-            tfidf_matrix = vectorizer.fit_transform(all_texts)
-
-        # Split the matrix back into new_docs and other_docs
-        num_new_docs = len(new_docs_text)
-        new_docs_matrix = tfidf_matrix[:num_new_docs]
-        other_docs_matrix = tfidf_matrix[num_new_docs:]
-
-        # Calculate cosine similarity
-        cosine_similarities = cosine_similarity(new_docs_matrix, other_docs_matrix)
-
-        # 5. Identify conflicts
+        # 4. Keep the best match per other application (a template reused across many
+        #    documents would otherwise report the same pair once per document)
+        other_docs = {}
+        id_list = sorted({int(i) for i in match_doc_ids})
+        for start in range(0, len(id_list), INSERT_CHUNK_SIZE):
+            other_docs.update({
+                d.id: d for d in Document.query
+                .options(joinedload(Document.application).joinedload(LandApplication.land_parcel))
+                .filter(Document.id.in_(id_list[start:start + INSERT_CHUNK_SIZE]))
+            })
+        by_application = {}
+        for i, other_doc_id, similarity in zip(query_rows, match_doc_ids, scores):
+            conflicting_doc = other_docs.get(int(other_doc_id))
+            if conflicting_doc is None:
+                continue
+            current = by_application.get(conflicting_doc.application_id)
+            if current is None or similarity > current[2]:
+                by_application[conflicting_doc.application_id] = (new_doc_ids[i], conflicting_doc, float(similarity))
+
+        # Pairs already reported (by this detector or duplicate_detector) are not repeated
+        existing = [
+            description or '' for (description,) in db.session.execute(
+                select(LandConflict.description)
+                .where(LandConflict.application_id == application_id)
+                .where(LandConflict.conflict_type == 'document_duplicate')
+                .where(LandConflict.status == 'unresolved')
+            )
+        ]
+
+        # 5. Build the conflict rows in memory
+        new_docs = {doc.id: doc for doc in application.documents}
+        now = datetime.utcnow()
+        values = []
+        for new_doc_id, conflicting_doc, similarity in sorted(
+                by_application.values(), key=lambda m: m[2], reverse=True):
+            new_doc = new_docs[new_doc_id]
+            conflicting_app = conflicting_doc.application
+            if any(conflicting_app.reference_number in d for d in existing):
+                continue
+
+            # Build detailed description
+            details = []
+            details.append(f"⚠️ DUPLICATE DOCUMENT DETECTED")
+            details.append(f"\nAI has detected that one of your documents is highly similar to a document from another application.")
+            details.append(f"\n📄 Your Document: {new_doc.original_filename}")
+            details.append(f"📂 Document Type: {new_doc.document_type}")
+            details.append(f"\n🔄 MATCHING DOCUMENT:")
+            details.append(f"📄 Conflicting Document: {conflicting_doc.original_filename}")
+            details.append(f"📂 Document Type: {conflicting_doc.document_type}")
+            details.append(f"📊 Similarity Score: {similarity * 100:.1f}%")
+            details.append(f"\n📃 FROM APPLICATION:")
+            details.append(f"📝 Reference: {conflicting_app.reference_number}")
+            details.append(f"👤 Applicant: {conflicting_app.applicant_name}")
+            details.append(f"🆔 NRC: {conflicting_app.nrc_number}")
+            details.append(f"📍 Location: {conflicting_app.land_location}")
+            details.append(f"📅 Submitted: {conflicting_app.submitted_at.strftime('%Y-%m-%d')}")
+            details.append(f"\n🔍 WHAT THIS MEANS:")
+            details.append(f"- The same or very similar document was uploaded for another application")
+            details.append(f"- This could indicate:")
+            details.append(f"  • Document reuse (same document used for multiple applications)")
+            details.append(f"  • Fraudulent activity (copying someone else's documents)")
+            details.append(f"  • Legitimate duplicate if you're the same person on both applications")
+            details.append(f"\n❗ SEVERITY: This is flagged as HIGH RISK due to {similarity * 100:.1f}% similarity")
+            details.append(f"\n✅ REQUIRED ACTIONS:")
+            details.append(f"1. Verify all documents you uploaded are YOUR original documents")
+            details.append(f"2. Check if you previously applied as '{conflicting_app.applicant_name}'")
+            details.append(f"3. If this is a legitimate duplicate, provide written explanation")
+            details.append(f"4. If documents were obtained fraudulently, this application will be rejected")
+            details.append(f"5. Contact the registry immediately if you believe this is an error")
+            
+            description = "\n".join(details)
+            
+            values.append({
+                'application_id': application_id,
+                'conflicting_parcel_id': conflicting_app.land_parcel.id if conflicting_app.land_parcel else None,
+                'description': description,
+                'status': 'unresolved',
+                'detected_by_ai': True,
+                'created_at': now,
+                'conflict_type': 'document_duplicate',
+                'title': f"⚠️ Document Duplicate: {new_doc.document_type}",
+                'severity': 'high',
+                'confidence_score': similarity,
+            })
+
+        # 6. Write them in one bulk insert per chunk
         conflicts = []
-        other_docs_flat = [d for app_docs in docs_by_app.values() for d in app_docs]
-
-        for i, new_doc_id in enumerate(new_docs_text.keys()):
-            for j, similarity in enumerate(cosine_similarities[i]):
-                if similarity > 0.8:  # Similarity threshold
-                    conflicting_doc = other_docs_flat[j]
-                    new_doc = Document.query.get(new_doc_id)
-                    conflicting_app = conflicting_doc.application
-                    
-                    # Build detailed description
-                    details = []
-                    details.append(f"⚠️ DUPLICATE DOCUMENT DETECTED")
-                    details.append(f"\nAI has detected that one of your documents is highly similar to a document from another application.")
-                    details.append(f"\n📄 Your Document: {new_doc.original_filename}")
-                    details.append(f"📂 Document Type: {new_doc.document_type}")
-                    details.append(f"\n🔄 MATCHING DOCUMENT:")
-                    details.append(f"📄 Conflicting Document: {conflicting_doc.original_filename}")
-                    details.append(f"📂 Document Type: {conflicting_doc.document_type}")
-                    details.append(f"📊 Similarity Score: {similarity * 100:.1f}%")
-                    details.append(f"\n📃 FROM APPLICATION:")
-                    details.append(f"📝 Reference: {conflicting_app.reference_number}")
-                    details.append(f"👤 Applicant: {conflicting_app.applicant_name}")
-                    details.append(f"🆔 NRC: {conflicting_app.nrc_number}")
-                    details.append(f"📍 Location: {conflicting_app.land_location}")
-                    details.append(f"📅 Submitted: {conflicting_app.submitted_at.strftime('%Y-%m-%d')}")
-                    details.append(f"\n🔍 WHAT THIS MEANS:")
-                    details.append(f"- The same or very similar document was uploaded for another application")
-                    details.append(f"- This could indicate:")
-                    details.append(f"  • Document reuse (same document used for multiple applications)")
-                    details.append(f"  • Fraudulent activity (copying someone else's documents)")
-                    details.append(f"  • Legitimate duplicate if you're the same person on both applications")
-                    details.append(f"\n❗ SEVERITY: This is flagged as HIGH RISK due to {similarity * 100:.1f}% similarity")
-                    details.append(f"\n✅ REQUIRED ACTIONS:")
-                    details.append(f"1. Verify all documents you uploaded are YOUR original documents")
-                    details.append(f"2. Check if you previously applied as '{conflicting_app.applicant_name}'")
-                    details.append(f"3. If this is a legitimate duplicate, provide written explanation")
-                    details.append(f"4. If documents were obtained fraudulently, this application will be rejected")
-                    details.append(f"5. Contact the registry immediately if you believe this is an error")
-                    
-                    description = "\n".join(details)
-                    
-                    conflict = LandConflict(
-                        application_id=application_id,
-                        conflicting_parcel_id=conflicting_doc.application.land_parcel.id if conflicting_doc.application.land_parcel else None,
-                        description=description,
-                        status='unresolved',
-                        detected_by_ai=True,
-                        created_at=datetime.utcnow(),
-                        conflict_type='document_duplicate',
-                        title=f"⚠️ Document Duplicate: {new_doc.document_type}",
-                        severity='high',
-                        confidence_score=similarity
-                    )
-                    conflicts.append(conflict)
-                    db.session.add(conflict)
+        for start in range(0, len(values), INSERT_CHUNK_SIZE):
+            conflicts.extend(db.session.scalars(
+                insert(LandConflict).returning(LandConflict), values[start:start + INSERT_CHUNK_SIZE]
+            ).all())
 
         if conflicts:
             application.status = 'conflict'
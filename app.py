@@ -36,17 +36,29 @@ from werkzeug.utils import secure_filename
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 
 from shapely.geometry import shape
-from geoalchemy2.shape import from_shape, to_shape
+from geoalchemy2.shape import from_shape
 from sqlalchemy import func, or_
 from models import db, User, LandApplication, Document, LandParcel, LandConflict, SystemSettings, AuditLog, NotificationLog
 from ai_conflict import detect_conflicts, resolve_conflict
+from spatial_index import (
+    parcel_index, find_parcel_overlaps, live_parcel_overlaps, LIVE_MAX_RESULTS, LIVE_SIMPLIFY_TOLERANCE
+)
+from geometry_cache import geometry_cache, application_geometry
+from geometry_normalize import normalize_geometry
+from geometry_tiers import display_geojson, parse_detail
+import vector_tiles
+import renditions
+from document_index import document_index
+from parcel_adjacency import update_parcel_adjacency, neighbours_many
 from ai_conflict_enhanced import detect_conflicts_from_documents
-from document_processing import extract_document_text
+from text_cache import document_texts
 from validation_utils import (
     validate_nrc, validate_tpin, validate_phone, validate_email,
     validate_all_application_data, quick_validate, normalize_identifier
 )
 from duplicate_detector import detect_all_duplicates, check_identity_duplicate
+from reanalysis import reanalyze_application
+from document_extraction import extract_application_documents
 import json
 import time
 import secrets
@@ -496,6 +508,21 @@ def review_application(app_id):
     except Exception:
         conflicts_details = []
     
+    # Owners of parcels bordering this application's parcel and the parcels it conflicts with
+    adjacent_parcels = []
+    try:
+        own_ids = [p.id for p in LandParcel.query.filter_by(application_id=app_id).all()]
+        conflict_ids = [c.conflicting_parcel_id for c in conflicts if c.conflicting_parcel_id]
+        seen = set(own_ids) | set(conflict_ids)
+        for pid, items in neighbours_many(own_ids + conflict_ids).items():
+            for n in items:
+                if n['parcel_id'] not in seen:
+                    seen.add(n['parcel_id'])
+                    adjacent_parcels.append(n)
+    except Exception:
+        current_app.logger.exception('Failed to load adjacent parcels for application %s', app_id)
+        adjacent_parcels = []
+
     # Get other recent applications (limit to 3)
     other_applications = LandApplication.query.filter(
         LandApplication.id != app_id,
@@ -515,6 +542,7 @@ def review_application(app_id):
         application=application,
         documents=documents,
         conflicts=conflicts_details,
+        adjacent_parcels=adjacent_parcels,
         other_applications=other_applications
     )
 
@@ -527,14 +555,14 @@ def ai_training_data():
         return redirect(url_for('admin_dashboard'))
 
     all_docs = Document.query.all()
+    texts = document_texts(all_docs)
     training_data = []
     for doc in all_docs:
-        text = extract_document_text(doc.file_path, doc.mime_type)
         training_data.append({
             'document_id': doc.id,
             'application_id': doc.application_id,
             'document_type': doc.document_type,
-            'text': text
+            'text': texts[doc.id]
         })
 
     return render_template('ai_training_data.html', training_data=training_data)
@@ -549,16 +577,15 @@ def retrain_ai():
 
     try:
         from sklearn.feature_extraction.text import TfidfVectorizer
-        import pickle
 
         all_docs = Document.query.all()
-        all_texts = [extract_document_text(doc.file_path, doc.mime_type) for doc in all_docs]
+        all_texts = list(document_texts(all_docs).values())
 
         vectorizer = TfidfVectorizer(stop_words='english')
         vectorizer.fit(all_texts)
 
-        with open('tfidf_vectorizer.pkl', 'wb') as f:
-            pickle.dump(vectorizer, f)
+        # saves the vectorizer and re-vectorizes the stored document index with it
+        document_index.rebuild(vectorizer)
 
         flash('AI model retrained successfully.', 'success')
     except Exception as e:
@@ -586,16 +613,20 @@ def run_ai_analysis(app_id):
     """Trigger AI conflict detection for a specific application.
 
     Admins only. This will create LandConflict rows and mark the application as processed.
+    Only detectors whose inputs changed since their last run are rerun; pass force=1 to
+    rerun all of them.
     """
     if current_user.role not in ['admin', 'super_admin']:
         flash('Access denied.', 'danger')
         return redirect(url_for('admin_dashboard'))
 
     application = LandApplication.query.get_or_404(app_id)
-    created = detect_conflicts(application.id)
-    created.extend(detect_conflicts_from_documents(application.id))
+    summary = reanalyze_application(application.id, force=request.args.get('force') == '1')
+    created = sum(summary['created'].values())
     if created:
-        flash(f'AI detected {len(created)} potential conflict(s).', 'warning')
+        flash(f'AI detected {created} potential conflict(s).', 'warning')
+    elif not summary['ran']:
+        flash('AI analysis is up to date: nothing changed since the last run.', 'info')
     else:
         flash('AI analysis completed: no conflicts detected.', 'success')
 
@@ -607,9 +638,13 @@ def run_ai_analysis(app_id):
 def api_get_conflicts():
     """Return existing LandConflict rows for an application as JSON.
 
-    Query params: application_id=int
+    Query params: application_id=int, detail=low|medium|high|full (default full)
     Returns: list of conflicts with optional parcel GeoJSON when available.
     """
+    try:
+        detail = parse_detail(request.args.get('detail'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         application_id = request.args.get('application_id', type=int)
         if not application_id:
@@ -627,8 +662,7 @@ def api_get_conflicts():
             parcel_geo = None
             if parcel and getattr(parcel, 'coordinates', None) is not None:
                 try:
-                    geom = to_shape(parcel.coordinates)
-                    parcel_geo = geom.__geo_interface__
+                    parcel_geo = display_geojson(parcel, detail)
                 except Exception:
                     parcel_geo = None
 
@@ -658,7 +692,14 @@ def api_geometry_conflicts():
     """Accepts { geometry: GeoJSON } and returns a list of parcels that intersect it.
 
     This is used by the registration page to check drawn geometries in real-time.
+    With { live: true } the check is latency-bounded: at most max_results parcels
+    (1-500, largest overlap first; below 1 is a 400) with outlines simplified to
+    simplify_tolerance degrees (0 for unsimplified outlines), and the
+    X-Total-Overlaps header carries the full count. { detail: low|medium|high|full }
+    picks a precomputed outline tier instead (default: full, or the live outlines).
+    Every response reports its server-side time in a Server-Timing header.
     """
+    started = time.perf_counter()
     try:
         payload = request.get_json(force=True)
     except Exception:
@@ -669,44 +710,94 @@ def api_geometry_conflicts():
         return jsonify({'error': 'Missing geometry'}), 400
 
     try:
-        # convert to shapely
-        incoming = shape(geom)
+        # convert to shapely, in the same canonical form as stored geometries
+        incoming = normalize_geometry(shape(geom))
     except Exception:
         return jsonify({'error': 'Invalid geometry'}), 400
 
+    live = bool(payload.get('live'))
+    try:
+        max_results = payload.get('max_results')
+        max_results = int(LIVE_MAX_RESULTS if max_results is None else max_results)
+        tolerance = payload.get('simplify_tolerance')
+        tolerance = max(0.0, float(LIVE_SIMPLIFY_TOLERANCE if tolerance is None else tolerance))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid max_results or simplify_tolerance'}), 400
+    if max_results < 1:
+        return jsonify({'error': 'max_results must be at least 1'}), 400
+    max_results = min(max_results, 500)
+    requested_detail = payload.get('detail') or request.args.get('detail')
+    try:
+        detail = parse_detail(requested_detail)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     results = []
     try:
-        parcels = LandParcel.query.filter(LandParcel.coordinates != None).all()
-        for p in parcels:
-            try:
-                if p.coordinates is None:
-                    continue
-                parcel_geom = to_shape(p.coordinates)
-                if parcel_geom.intersects(incoming):
-                    inter = parcel_geom.intersection(incoming)
-                    overlap_pct = None
-                    try:
-                        if parcel_geom.area > 0:
-                            overlap_pct = float(inter.area / parcel_geom.area)
-                    except Exception:
-                        overlap_pct = None
-
-                    results.append({
-                        'parcel_id': p.id,
-                        'parcel_number': p.parcel_number,
-                        'owner_name': p.owner_name,
-                        'overlap_pct': overlap_pct,
-                        'geojson': parcel_geom.__geo_interface__
-                    })
-            except Exception:
-                current_app.logger.exception('Error testing parcel geometry id=%s', getattr(p, 'id', None))
+        if live:
+            overlaps, total = live_parcel_overlaps(incoming, max_results=max_results, tolerance=tolerance)
+        else:
+            overlaps = find_parcel_overlaps(incoming)
+            total = len(overlaps)
+        parcels_by_id = {}
+        if overlaps:
+            parcel_query = LandParcel.query.filter(LandParcel.id.in_([o['parcel_id'] for o in overlaps]))
+            if detail != 'full':
+                parcel_query = parcel_query.options(db.undefer(LandParcel.display_geometry))
+            parcels_by_id = {p.id: p for p in parcel_query.all()}
+        for o in overlaps:
+            p = parcels_by_id.get(o['parcel_id'])
+            if p is None:
+                continue
+            results.append({
+                'parcel_id': p.id,
+                'parcel_number': p.parcel_number,
+                'owner_name': p.owner_name,
+                'overlap_pct': o['overlap_pct'],
+                'overlap_area_m2': o['overlap_area'],
+                'geojson': o['geojson'] if live and not requested_detail else display_geojson(p, detail)
+            })
 
-        return jsonify(results)
+        response = jsonify(results)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response.headers['Server-Timing'] = f'overlap;dur={elapsed_ms:.1f}'
+        response.headers['X-Total-Overlaps'] = str(total)
+        return response
     except Exception:
         current_app.logger.exception('Geometry conflict check failed')
         return jsonify([]), 500
 
 
+@app.route('/api/geometry_cache_stats')
+@login_required
+def api_geometry_cache_stats():
+    """Hit/miss counters of the decoded-geometry cache, for sizing GEOMETRY_CACHE_SIZE."""
+    if current_user.role not in ['admin', 'super_admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(geometry_cache.stats())
+
+
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt')
+@login_required
+def vector_tile(layer, z, x, y):
+    """Mapbox Vector Tile of registered parcels or open applications for the maps."""
+    if layer == 'applications' and current_user.role not in ['admin', 'super_admin']:
+        abort(403)
+    if not vector_tiles.valid_tile(layer, z, x, y):
+        abort(404)
+    try:
+        data = vector_tiles.get_tile(layer, z, x, y)
+    except Exception:
+        current_app.logger.exception('Failed to render tile %s/%s/%s/%s', layer, z, x, y)
+        abort(500)
+    if data is None:
+        # no PostGIS: nothing to draw
+        return '', 204
+    response = current_app.response_class(data, mimetype=vector_tiles.MVT_MIME_TYPE)
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
 @app.route('/admin/conflict/<int:conflict_id>/resolve', methods=['POST'])
 @login_required
 def admin_resolve_conflict(conflict_id):
@@ -969,6 +1060,32 @@ def view_document(user_id, app_id, filename):
         abort(500)
 
 
+@app.route('/documents/<int:doc_id>/rendition/<kind>')
+@login_required
+def document_rendition(doc_id, kind):
+    """First-page thumbnail ('thumb') or low-resolution preview ('preview') of a document."""
+    doc = Document.query.get_or_404(doc_id)
+    if current_user.role not in ['admin', 'super_admin'] and current_user.id != doc.application.user_id:
+        abort(403)
+    if kind not in renditions.RENDITIONS:
+        abort(404)
+
+    fmt = renditions.choose_format(request.headers.get('Accept'))
+    try:
+        path = renditions.get_rendition(doc, kind, fmt)
+    except Exception:
+        current_app.logger.exception('Failed to render %s of document %s', kind, doc_id)
+        abort(500)
+    if path is None:
+        # not a PDF or image, or the file is gone
+        abort(404)
+    response = send_file(path, mimetype=renditions.mime_type(fmt))
+    # renditions are keyed by file content and documents never change
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.vary.add('Accept')
+    return response
+
+
 @app.route('/add_comment/<int:app_id>', methods=['POST'])
 @login_required
 def add_comment(app_id):
@@ -1012,6 +1129,10 @@ def approve_application(app_id):
 
     db.session.commit()
 
+    # approved/rejected applications drop out of the applications tile layer
+    if application.coordinates is not None:
+        vector_tiles.invalidate_geometry('applications', application_geometry(application).geom)
+
     log_audit(
         "approve_application", "land_applications", app_id,
         {"status": old_status},
@@ -1242,7 +1363,7 @@ def register_land():
             # Parse geometry
             try:
                 geom_dict = json.loads(geometry_json)
-                geom = shape(geom_dict)
+                geom = normalize_geometry(shape(geom_dict))
                 geom_wkb = from_shape(geom, srid=4326)
             except Exception as e:
                 current_app.logger.exception('Failed to parse geometry')
@@ -1400,30 +1521,36 @@ def register_land():
             # Commit all changes
             db.session.commit()
 
+            # Make the new parcel visible to spatial conflict checks in this process
+            parcel_index.add_parcels([parcel])
+            vector_tiles.invalidate_geometry('parcels', geom)
+            vector_tiles.invalidate_geometry('applications', geom)
+            try:
+                update_parcel_adjacency([parcel])
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception('Failed to update parcel adjacency for parcel %s', parcel.id)
+
             # START COMPREHENSIVE DUPLICATE DETECTION
             try:
                 def _bg_detect(aid):
                     with app.app_context():
                         try:
-                            # Run all detection methods
-                            from ai_conflict import detect_conflicts
-                            from ai_conflict_enhanced import detect_conflicts_from_documents
-                            from duplicate_detector import detect_all_duplicates
-                            
                             print(f"[BG DETECTION] Starting for app {aid}")
-                            
-                            # 1. Spatial conflicts
-                            spatial_conflicts = detect_conflicts(aid)
-                            print(f"[BG DETECTION] Spatial: {len(spatial_conflicts)} conflicts")
-                            
-                            # 2. Document similarity
-                            doc_conflicts = detect_conflicts_from_documents(aid)
-                            print(f"[BG DETECTION] Documents: {len(doc_conflicts)} conflicts")
-                            
-                            # 3. Duplicate detection
-                            dup_conflicts = detect_all_duplicates(aid)
-                            print(f"[BG DETECTION] Duplicates: {len(dup_conflicts)} conflicts")
-                            
+
+                            # Read text and identifiers of the uploads once, into the Document rows
+                            statuses = extract_application_documents(aid)
+                            print(f"[BG DETECTION] Documents extracted: {dict(statuses)}")
+                            new_docs = Document.query.filter_by(application_id=aid).all()
+                            renditions.generate_renditions(new_docs)
+                            document_index.add_documents(new_docs)
+
+                            # Spatial/owner, document similarity and duplicate detectors;
+                            # a new application has no fingerprints yet, so all of them run
+                            summary = reanalyze_application(aid)
+                            for name, count in summary['created'].items():
+                                print(f"[BG DETECTION] {name}: {count} conflicts")
+
                             print(f"[BG DETECTION] Complete for app {aid}")
                         except Exception as e:
                             print(f"[BG DETECTION] ERROR: {e}")
@@ -1498,17 +1625,35 @@ def edit_application(app_id):
             application.rejection_reason = None
 
             # Update geometry if it has changed
+            old_geom = application_geometry(application).geom if application.coordinates is not None else None
+            new_geom = None
             geometry_json = request.form.get('land_geometry')
             if geometry_json:
                 try:
                     geom_dict = json.loads(geometry_json)
-                    geom = shape(geom_dict)
+                    geom = normalize_geometry(shape(geom_dict))
                     application.coordinates = from_shape(geom, srid=4326)
                     application.land_size = float(request.form.get('land_size', 0))
+                    new_geom = geom
                 except Exception as e:
                     current_app.logger.error(f"Could not update geometry for app {app_id}: {e}")
             
             db.session.commit()
+            geometry_cache.invalidate('application', application.id)
+            # status went back to pending, so the tiles showing this application change
+            vector_tiles.invalidate_geometry('applications', old_geom)
+            vector_tiles.invalidate_geometry('applications', new_geom)
+
+            # Re-run only the detectors whose inputs the edit changed
+            def _bg_reanalyze(aid):
+                with app.app_context():
+                    try:
+                        summary = reanalyze_application(aid)
+                        print(f"[BG REANALYSIS] app {aid}: ran {summary['ran']}, carried forward {summary['skipped']}")
+                    except Exception:
+                        app.logger.exception('Re-analysis failed for application %s', aid)
+
+            threading.Thread(target=_bg_reanalyze, args=(application.id,), daemon=True).start()
             
             flash('Application updated successfully. It is now pending review again.', 'success')
             return redirect(url_for('application_status'))
@@ -1602,9 +1747,17 @@ def get_conflict_applications():
 @app.route('/api/get_application_geometry/<int:app_id>')
 @login_required
 def get_application_geometry(app_id):
-    """Get geometry data for an application and its conflicts for map display."""
+    """Get geometry data for an application and its conflicts for map display.
+
+    Query params: detail=low|medium|high|full (default full)
+    """
     if current_user.role not in ['admin', 'super_admin']:
         return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        detail = parse_detail(request.args.get('detail'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
         application = LandApplication.query.get_or_404(app_id)
@@ -1617,8 +1770,7 @@ def get_application_geometry(app_id):
         # Get application geometry
         if application.coordinates:
             try:
-                geom = to_shape(application.coordinates)
-                result['geometry'] = geom.__geo_interface__
+                result['geometry'] = display_geojson(application, detail)
             except Exception as e:
                 current_app.logger.error(f'Failed to convert application geometry: {e}')
         
@@ -1629,11 +1781,10 @@ def get_application_geometry(app_id):
                 try:
                     parcel = db.session.get(LandParcel, conflict.conflicting_parcel_id)
                     if parcel and parcel.coordinates:
-                        parcel_geom = to_shape(parcel.coordinates)
                         result['conflicts'].append({
                             'parcel_number': parcel.parcel_number,
                             'owner_name': parcel.owner_name,
-                            'geojson': parcel_geom.__geo_interface__
+                            'geojson': display_geojson(parcel, detail)
                         })
                 except Exception as e:
                     current_app.logger.error(f'Failed to convert parcel geometry: {e}')
@@ -1665,6 +1816,10 @@ def reject_application(app_id):
 
     db.session.commit()
 
+    # approved/rejected applications drop out of the applications tile layer
+    if application.coordinates is not None:
+        vector_tiles.invalidate_geometry('applications', application_geometry(application).geom)
+
     log_audit(
         "reject_application", "land_applications", app_id,
         {"status": old_status},
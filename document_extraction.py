@@ -0,0 +1,66 @@
+"""
+document_extraction.py
+
+Upload-time extraction stage: each document's text and identifiers are read once and the
+results are stored on its Document row, so detectors read compact columns instead of files.
+
+Design:
+- extract_documents(docs) fills Document.extraction_status, text_length, page_count,
+  extracted_identifiers (normalized NRC/TPIN/phone/email lists) and extracted_at; the text
+  itself comes from text_cache, so each distinct file is OCR'd at most once and the full
+  text stays available to the TF-IDF detector
+- register_land runs extract_application_documents() in its background thread before the
+  detectors, so the upload request is not blocked and detection finds the columns filled
+- extraction_status is 'pending' until the stage has run, then 'done', 'empty' (no text
+  could be read) or 'failed'
+- duplicate_detector.document_identifiers() uses extracted_identifiers for documents whose
+  extraction ran and only falls back to the file for the rest
+- scripts/add_document_extraction_columns.py adds the columns and backfills old documents
+"""
+import logging
+from collections import Counter
+from datetime import datetime
+
+from document_processing import document_page_count
+from duplicate_detector import extract_identifiers_from_text, normalize_identifiers
+from models import db, Document
+from text_cache import document_texts
+
+logger = logging.getLogger(__name__)
+
+
+def extract_documents(docs):
+    """Extract and store text metadata for Documents; returns a Counter of resulting statuses."""
+    docs = list(docs)
+    statuses = Counter()
+    if not docs:
+        return statuses
+    try:
+        texts = document_texts(docs)
+    except Exception:
+        logger.exception('Text extraction failed for documents %s', [d.id for d in docs])
+        texts = {}
+
+    now = datetime.utcnow()
+    for doc in docs:
+        text = texts.get(doc.id)
+        try:
+            if text is None:
+                raise RuntimeError('no extraction result')
+            doc.page_count = document_page_count(doc.file_path, doc.mime_type)
+            doc.text_length = len(text)
+            doc.extracted_identifiers = normalize_identifiers(extract_identifiers_from_text(text))
+            doc.extraction_status = 'done' if text.strip() else 'empty'
+        except Exception as e:
+            logger.warning('Could not extract document %s: %s', doc.id, e)
+            doc.extraction_status = 'failed'
+        doc.extracted_at = now
+        statuses[doc.extraction_status] += 1
+    db.session.commit()
+    return statuses
+
+
+def extract_application_documents(application_id):
+    """Run the extraction stage for every document of an application."""
+    docs = Document.query.filter_by(application_id=application_id).order_by(Document.id).all()
+    return extract_documents(docs)
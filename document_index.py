@@ -0,0 +1,329 @@
+"""
+document_index.py
+
+Persistent, append-only TF-IDF index of every uploaded document.
+
+Design:
+- each document is vectorized once, with the fixed vectorizer in VECTORIZER_PATH (the one
+  /admin/retrain_ai trains), and appended as an L2-normalized row of a CSR matrix
+- the CSR arrays live in DOC_INDEX_DIR as raw binary files that only ever grow: data
+  (float32), indices (int32), indptr (int64), plus doc_ids and app_ids (int64) mapping rows
+  to Document and LandApplication ids. Appending writes only the new rows; readers
+  np.memmap the files, so the matrix is never loaded or copied into memory
+- doc_ids is written last and defines how many rows are complete, so a crash half-way
+  through an append leaves the index readable; the next append truncates the leftovers
+- a query is a sparse product of the query vectors with the stored matrix (rows are
+  normalized, so the product is the cosine similarity), computed in row chunks by
+  sparse_topk.chunked_top_k so that only matches above the threshold, at most top_k per
+  query, are ever kept; rows of the querying application and deleted documents are skipped
+- meta.json records the vectorizer's SHA-256; when retrain_ai replaces the vectorizer the
+  index no longer matches and is rebuilt from the text cache on next use (or right away
+  by retrain_ai / scripts/build_document_index.py). The loaded vectorizer is kept until
+  the file's mtime or size changes, so only a replaced file is hashed again
+- deleting a Document adds its id to meta.json's deleted list once the session commits;
+  its row stays in the arrays, unmatched, until the next rebuild
+- terms the vectorizer has not seen are ignored until the next retrain
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import Document
+from sparse_topk import chunked_top_k
+from text_cache import document_texts
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DOC_INDEX_DIR = os.environ.get('DOC_INDEX_DIR', os.path.join(os.getcwd(), 'doc_index'))
+VECTORIZER_PATH = os.environ.get('TFIDF_VECTORIZER_PATH', 'tfidf_vectorizer.pkl')
+
+# file name -> dtype
+ARRAYS = {
+    'data': np.float32,
+    'indices': np.int32,
+    'indptr': np.int64,
+    'app_ids': np.int64,
+    'doc_ids': np.int64,
+}
+BUILD_BATCH_SIZE = 200
+TOP_K = 50  # most matches reported per query document
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read(path, dtype):
+    """Memory-map a raw array file (empty array if missing or empty)."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return np.zeros(0, dtype=dtype)
+    count = size // np.dtype(dtype).itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+class DocumentIndex:
+    """Append-only CSR matrix of document vectors stored under one directory."""
+
+    def __init__(self, directory=DOC_INDEX_DIR, vectorizer_path=VECTORIZER_PATH):
+        self.directory = directory
+        self.vectorizer_path = vectorizer_path
+        self._lock = threading.RLock()
+        self._vectorizer = None
+        self._vectorizer_sha = None
+        self._vectorizer_stat = None
+
+    # --- storage -----------------------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _meta(self):
+        try:
+            with open(self._path('meta.json'), encoding='utf-8') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, meta):
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self._path('meta.json'))
+
+    def _file_lock(self, shared=False):
+        """Lock across processes (e.g. several gunicorn workers): exclusive for writers,
+        shared for readers opening the arrays, so nobody maps a half-replaced index."""
+        os.makedirs(self.directory, exist_ok=True)
+        fh = open(self._path('.lock'), 'a+b')
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return fh
+
+    def _arrays(self):
+        """(matrix, doc_ids, app_ids, deleted doc ids) of the complete rows, memory-mapped."""
+        meta = self._meta() or {}
+        doc_ids = _read(self._path('doc_ids'), np.int64)
+        app_ids = _read(self._path('app_ids'), np.int64)
+        indptr = _read(self._path('indptr'), np.int64)
+        rows = min(len(doc_ids), len(app_ids), max(len(indptr) - 1, 0))
+        nnz = int(indptr[rows]) if rows else 0
+        data = _read(self._path('data'), np.float32)[:nnz]
+        indices = _read(self._path('indices'), np.int32)[:nnz]
+        indptr = np.asarray(indptr[:rows + 1]) if rows else np.zeros(1, dtype=np.int64)
+        if nnz < np.iinfo(np.int32).max:
+            # matching index dtypes keep scipy from copying the mapped indices
+            indptr = indptr.astype(np.int32)
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(rows, meta.get('n_features', 0)), copy=False)
+        return matrix, doc_ids[:rows], app_ids[:rows], set(meta.get('deleted', []))
+
+    def _append(self, matrix, doc_ids, app_ids):
+        """Append CSR rows; the caller holds the file lock."""
+        indptr = _read(self._path('indptr'), np.int64)
+        done = _read(self._path('doc_ids'), np.int64)
+        rows = min(len(done), max(len(indptr) - 1, 0))
+        nnz = int(indptr[rows]) if rows else 0
+        del indptr, done  # release the maps before truncating
+
+        # drop whatever a crashed append left behind
+        sizes = {'data': nnz, 'indices': nnz, 'indptr': rows + 1, 'app_ids': rows, 'doc_ids': rows}
+        for name, count in sizes.items():
+            path = self._path(name)
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            os.truncate(path, count * np.dtype(ARRAYS[name]).itemsize)
+        if rows == 0:
+            np.zeros(1, dtype=np.int64).tofile(self._path('indptr'))
+
+        matrix = matrix.tocsr()
+        matrix.sort_indices()
+        new = {
+            'data': matrix.data.astype(np.float32),
+            'indices': matrix.indices.astype(np.int32),
+            'indptr': (matrix.indptr[1:].astype(np.int64) + nnz),
+            'app_ids': np.asarray(app_ids, dtype=np.int64),
+            'doc_ids': np.asarray(doc_ids, dtype=np.int64),  # last: marks the rows complete
+        }
+        for name, values in new.items():
+            with open(self._path(name), 'ab') as fh:
+                fh.write(values.tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+
+    # --- vectorizer ----------------------------------------------------------------
+
+    def vectorizer(self):
+        """The fitted vectorizer from VECTORIZER_PATH (None if it does not exist yet)."""
+        try:
+            st = os.stat(self.vectorizer_path)
+        except OSError:
+            return None
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat != self._vectorizer_stat:
+            sha = _file_sha256(self.vectorizer_path)
+            if sha != self._vectorizer_sha:
+                with open(self.vectorizer_path, 'rb') as f:
+                    self._vectorizer = pickle.load(f)
+                self._vectorizer_sha = sha
+            self._vectorizer_stat = stat
+        return self._vectorizer
+
+    def transform(self, texts):
+        """L2-normalized TF-IDF rows for texts."""
+        return normalize(self.vectorizer().transform(texts)).astype(np.float32)
+
+    def is_current(self):
+        meta = self._meta()
+        return (
+            meta is not None
+            and self.vectorizer() is not None
+            and meta.get('vectorizer_sha256') == self._vectorizer_sha
+        )
+
+    # --- building and updating ---------------------------------------------------------
+
+    def rebuild(self, vectorizer=None):
+        """Re-vectorize every document; fits and saves a vectorizer if there is none."""
+        with self._lock:
+            docs = Document.query.order_by(Document.id).all()
+            texts = document_texts(docs)
+            if vectorizer is None and self.vectorizer() is None:
+                vectorizer = TfidfVectorizer(stop_words='english')
+                vectorizer.fit([texts[d.id] for d in docs] or [''])
+            if vectorizer is not None:
+                with open(self.vectorizer_path, 'wb') as f:
+                    pickle.dump(vectorizer, f)
+            vectorizer = self.vectorizer()
+
+            lock = self._file_lock()
+            try:
+                tmp_dir = self.directory + '.building'
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                building = DocumentIndex(tmp_dir, self.vectorizer_path)
+                os.makedirs(tmp_dir)
+                building._write_meta({
+                    'vectorizer_sha256': self._vectorizer_sha,
+                    'n_features': len(vectorizer.vocabulary_),
+                    'deleted': [],
+                })
+                for start in range(0, len(docs), BUILD_BATCH_SIZE):
+                    batch = docs[start:start + BUILD_BATCH_SIZE]
+                    building._append(self.transform([texts[d.id] for d in batch]),
+                                     [d.id for d in batch], [d.application_id for d in batch])
+                for name in list(ARRAYS) + ['meta.json']:
+                    if os.path.exists(building._path(name)):
+                        os.replace(building._path(name), self._path(name))
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            finally:
+                lock.close()
+            logger.info('Document index rebuilt with %d documents', len(docs))
+            return len(docs)
+
+    def ensure_current(self):
+        """Rebuild when the index is missing or was built with another vectorizer."""
+        with self._lock:
+            if not self.is_current():
+                self.rebuild()
+
+    def add_documents(self, docs):
+        """Append the documents that are not indexed yet; returns how many were added."""
+        with self._lock:
+            self.ensure_current()
+            lock = self._file_lock()
+            try:
+                _, doc_ids, _, _ = self._arrays()
+                present = set(doc_ids.tolist())
+                missing = [d for d in docs if d.id not in present]
+                if not missing:
+                    return 0
+                texts = document_texts(missing)
+                self._append(self.transform([texts[d.id] for d in missing]),
+                             [d.id for d in missing], [d.application_id for d in missing])
+                return len(missing)
+            finally:
+                lock.close()
+
+    def remove_documents(self, doc_ids):
+        """Mark documents as deleted; their rows are dropped at the next rebuild."""
+        with self._lock:
+            lock = self._file_lock()
+            try:
+                meta = self._meta()
+                if meta is None:
+                    return
+                meta['deleted'] = sorted(set(meta.get('deleted', [])) | set(int(i) for i in doc_ids))
+                self._write_meta(meta)
+            finally:
+                lock.close()
+
+    # --- querying ---------------------------------------------------------------------
+
+    def top_matches(self, query_vectors, threshold, top_k=TOP_K, exclude_application_id=None):
+        """(query rows, doc_ids, similarities) of the stored documents whose cosine similarity
+        with a query vector is above threshold, at most top_k per query, best first.
+
+        Documents of exclude_application_id and deleted documents are not matched.
+        """
+        lock = self._file_lock(shared=True)
+        try:
+            # maps stay valid after the lock is released, even if a rebuild replaces the files
+            matrix, doc_ids, app_ids, deleted = self._arrays()
+        finally:
+            lock.close()
+        mask = np.ones(matrix.shape[0], dtype=bool)
+        if exclude_application_id is not None:
+            mask &= app_ids != exclude_application_id
+        if deleted:
+            mask &= ~np.isin(doc_ids, np.fromiter(deleted, dtype=np.int64))
+        rows, cols, values = chunked_top_k(query_vectors, matrix, threshold, top_k, row_mask=mask)
+        return rows, np.asarray(doc_ids[cols]), values
+
+
+document_index = DocumentIndex()
+
+
+@event.listens_for(Document, 'after_delete')
+def _document_deleted(mapper, connection, target):
+    # the arrays are files outside the transaction, so wait for the commit
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('document_index_deleted', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _remove_deleted_documents(session):
+    deleted = session.info.pop('document_index_deleted', None)
+    if deleted:
+        try:
+            document_index.remove_documents(deleted)
+        except OSError:
+            logger.warning('Could not mark deleted documents in the document index', exc_info=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_deleted_documents(session):
+    session.info.pop('document_index_deleted', None)
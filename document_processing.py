@@ -4,71 +4,132 @@
 document_processing.py
 
 Extract text from documents for AI analysis.
+
+PDFs are read page by page with PyMuPDF (iter_pdf_pages): pages with a text layer are
+yielded directly, and only pages without one are rendered and OCR'd on the shared
+ocr_engine pool, a few pages ahead of the reader. Callers that only need the first
+pages (e.g. identifier lookup) can stop iterating and the remaining pages are never
+read or OCR'd.
 """
 import os
 import pytesseract
-from PIL import Image
-from PyPDF2 import PdfReader
 import docx
 import logging
+from collections import deque
+
+from image_preprocess import OCR_PREPROCESS, profile_for
+from ocr_engine import ocr_engine, open_pdf
 
 # Configure Tesseract path
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
-# Configure Poppler path for pdf2image
-POPPLER_PATH = r'C:\Program Files\poppler-25.07.0\Library\bin'
-
 logger = logging.getLogger(__name__)
 
-def extract_document_text(file_path, mime_type):
+# Bump whenever a change here alters the text produced for the same file, so text_cache
+# stops serving results of the previous extractor.
+EXTRACTOR_VERSION = '3'
+
+PDF_MIME_TYPES = ('application/pdf',)
+IMAGE_MIME_TYPES = ('image/jpeg', 'image/png', 'image/jpg')
+DOCX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+
+def iter_document_pages(file_path, mime_type, document_type=None):
     """
-    Extract text from a document.
-    
-    Supports:
-    - PDF files
-    - Image files (JPEG, PNG) with OCR
-    - Word documents (.docx)
+    Yield the text of a document page by page (a single chunk for images and Word files).
+
+    document_type (Document.document_type) selects the image preprocessing profile.
+
+    Stopping early skips the work for the remaining pages. Errors are logged and end
+    the iteration, like extract_document_text returning "".
     """
     try:
         if not os.path.exists(file_path):
             logger.error(f"File not found: {file_path}")
-            return ""
-        
+            return
+
         # PDF files
-        if mime_type == 'application/pdf' or file_path.endswith('.pdf'):
-            text = extract_pdf_text(file_path)
-            if text.strip():
-                return text
-            # If no text, try OCR
-            return extract_pdf_images_text(file_path)
-        
+        if mime_type in PDF_MIME_TYPES or file_path.endswith('.pdf'):
+            yield from iter_pdf_pages(file_path)
+
         # Image files
-        elif mime_type in ['image/jpeg', 'image/png', 'image/jpg'] or \
-             file_path.endswith(('.jpg', '.jpeg', '.png')):
-            return extract_image_text(file_path)
-        
+        elif mime_type in IMAGE_MIME_TYPES or file_path.endswith(('.jpg', '.jpeg', '.png')):
+            yield extract_image_text(file_path, document_type)
+
         # Word documents
-        elif mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' or \
-             file_path.endswith('.docx'):
-            return extract_docx_text(file_path)
-        
+        elif mime_type == DOCX_MIME_TYPE or file_path.endswith('.docx'):
+            yield extract_docx_text(file_path)
+
         else:
             logger.warning(f"Unsupported file type: {mime_type}")
-            return ""
-    
+
     except Exception as e:
         logger.exception(f"Error extracting text from {file_path}: {e}")
-        return ""
+
+
+def extract_document_text(file_path, mime_type, document_type=None):
+    """
+    Extract text from a document.
+    
+    Supports:
+    - PDF files (text layer, OCR for pages without one)
+    - Image files (JPEG, PNG) with OCR
+    - Word documents (.docx)
+    """
+    return "\n".join(iter_document_pages(file_path, mime_type, document_type))
+
+
+def document_page_count(file_path, mime_type):
+    """Number of pages of a PDF; 1 for other supported files."""
+    if mime_type in PDF_MIME_TYPES or file_path.endswith('.pdf'):
+        with open_pdf(file_path) as pdf:
+            return pdf.page_count
+    return 1
+
+
+def iter_pdf_pages(file_path, ocr=True, prefetch=None):
+    """
+    Yield the text of each PDF page in order.
+
+    Pages without a text layer are OCR'd when ocr is true; up to prefetch of them
+    (default: one per OCR worker) are queued ahead of the page being yielded, and
+    queued pages are cancelled if the caller stops early.
+    """
+    prefetch = prefetch or max(1, ocr_engine.workers)
+    pending = deque()  # page text, or (page number, OCR future)
+    try:
+        with open_pdf(file_path) as pdf:
+            for index, page in enumerate(pdf):
+                text = page.get_text()
+                if text.strip() or not ocr:
+                    pending.append(text)
+                else:
+                    pending.append((index + 1, ocr_engine.submit_pdf_page(file_path, index + 1)))
+                ocr_queued = sum(1 for item in pending if not isinstance(item, str))
+                while pending and (isinstance(pending[0], str) or ocr_queued > prefetch):
+                    item = pending.popleft()
+                    if not isinstance(item, str):
+                        ocr_queued -= 1
+                    yield _page_text(item, file_path)
+        while pending:
+            yield _page_text(pending.popleft(), file_path)
+    finally:
+        for item in pending:
+            if not isinstance(item, str):
+                item[1].cancel()
+
+
+def _page_text(item, file_path):
+    if isinstance(item, str):
+        return item
+    page_number, future = item
+    return ocr_engine.text(future, file_path, page_number)
 
 
 def extract_pdf_text(file_path):
-    """Extract text from PDF using PyPDF2."""
+    """Extract the text layer of a PDF (no OCR)."""
     try:
-        reader = PdfReader(file_path)
-        text = []
-        for page in reader.pages:
-            text.append(page.extract_text())
-        return "\n".join(text)
+        return "\n".join(iter_pdf_pages(file_path, ocr=False))
     except Exception as e:
         logger.error(f"Error extracting PDF text: {e}")
         return ""
@@ -76,25 +137,19 @@ def extract_pdf_text(file_path):
 
 def extract_pdf_images_text(file_path):
     """Extract text from images in PDF using OCR."""
-    # This requires pdf2image and tesseract
+    # Every page is OCR'd, in parallel on the shared ocr_engine pool
     try:
-        from pdf2image import convert_from_path
-        # Use the configured Poppler path
-        images = convert_from_path(file_path, poppler_path=POPPLER_PATH)
-        text = []
-        for img in images:
-            text.append(pytesseract.image_to_string(img))
-        return "\n".join(text)
+        return ocr_engine.ocr_pdf(file_path)
     except Exception as e:
         logger.error(f"Error extracting PDF images: {e}")
         return ""
 
 
-def extract_image_text(file_path):
-    """Extract text from image using OCR."""
+def extract_image_text(file_path, document_type=None):
+    """Extract text from image using OCR, after preprocessing for the document type."""
     try:
-        img = Image.open(file_path)
-        return pytesseract.image_to_string(img)
+        profile = profile_for(document_type) if OCR_PREPROCESS else None
+        return ocr_engine.ocr_image(file_path, profile)
     except Exception as e:
         logger.error(f"Error extracting image text: {e}")
         return ""
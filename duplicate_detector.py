@@ -4,6 +4,8 @@ duplicate_detector.py
 Advanced duplicate detection system that checks for duplicates across different formats.
 Detects:
 1. Exact file duplicates (same hash)
+   Near-duplicate documents (reused or lightly edited text, via minhash_index)
+   Re-scanned or re-photographed documents (perceptual hashes, via image_hash_index)
 2. Content duplicates (same person/property info in different file formats)
 3. Identity duplicates (same NRC/TPIN across different applications)
 4. Spatial duplicates (overlapping land parcels)
@@ -15,10 +17,16 @@ from datetime import datetime
 from difflib import SequenceMatcher
 
 from models import db, Document, LandApplication, LandParcel, LandConflict
-from document_processing import extract_document_text
+from document_processing import iter_document_pages
+from image_hash_index import find_similar_images
+from minhash_index import find_near_duplicates
+from text_cache import cached_texts, document_hash, store_text
 from validation_utils import normalize_identifier
 
 
+IDENTIFIER_TYPES = ('nrc', 'tpin', 'phone', 'email')
+
+
 def extract_identifiers_from_text(text: str) -> Dict[str, List[str]]:
     """
     Extract NRC numbers, TPINs, phone numbers, and emails from document text.
@@ -55,6 +63,91 @@ def extract_identifiers_from_text(text: str) -> Dict[str, List[str]]:
     return identifiers
 
 
+def normalize_identifiers(ids: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Normalized, de-duplicated and sorted form of extract_identifiers_from_text output."""
+    return {
+        key: sorted({normalize_identifier(v, key) for v in ids.get(key, [])} - {''})
+        for key in IDENTIFIER_TYPES
+    }
+
+
+def extract_identifiers_from_pages(pages, stop_when=('nrc', 'tpin')) -> Dict[str, List[str]]:
+    """
+    Merge the identifiers found in an iterable of page texts.
+
+    Stops reading pages once every identifier type in stop_when has been found, closing
+    the iterable so a page generator (document_processing.iter_document_pages) skips
+    the remaining pages. Pass stop_when=() to read everything.
+    """
+    found = {key: set() for key in IDENTIFIER_TYPES}
+    try:
+        for text in pages:
+            for key, values in extract_identifiers_from_text(text).items():
+                found[key].update(values)
+            if stop_when and all(found[key] for key in stop_when):
+                break
+    finally:
+        close = getattr(pages, 'close', None)
+        if close is not None:
+            close()
+    return {key: list(values) for key, values in found.items()}
+
+
+class _PageRecorder:
+    """Iterate over page texts, keeping them and noting whether the last page was reached."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.texts = []
+        self.complete = False
+
+    def __iter__(self):
+        for text in self.pages:
+            self.texts.append(text)
+            yield text
+        self.complete = True
+
+    def close(self):
+        close = getattr(self.pages, 'close', None)
+        if close is not None:
+            close()
+
+
+def document_identifiers(docs, stop_when=('nrc', 'tpin')) -> Dict[int, Dict[str, List[str]]]:
+    """
+    Normalized identifiers per document id.
+
+    Read from the Document columns filled at upload (document_extraction.py) when
+    available, else from the text cache, else by streaming the file's pages until
+    stop_when is satisfied. A file streamed to the end is stored in the text cache.
+    """
+    docs = list(docs)
+    result = {}
+    unextracted = []
+    for doc in docs:
+        if doc.extraction_status in ('done', 'empty') and doc.extracted_identifiers is not None:
+            result[doc.id] = {key: list(doc.extracted_identifiers.get(key, [])) for key in IDENTIFIER_TYPES}
+        else:
+            unextracted.append(doc)
+
+    hashes = {doc.id: document_hash(doc) for doc in unextracted}
+    texts = cached_texts({h for h in hashes.values() if h})
+    for doc in unextracted:
+        text = texts.get(hashes[doc.id])
+        if text is not None:
+            ids = extract_identifiers_from_text(text)
+        else:
+            pages = _PageRecorder(iter_document_pages(doc.file_path, doc.mime_type, doc.document_type))
+            ids = extract_identifiers_from_pages(pages, stop_when)
+            if pages.complete and hashes[doc.id]:
+                # same form as text_cache.document_texts stores
+                text = "\n".join(pages.texts).replace('\x00', '')
+                texts[hashes[doc.id]] = text
+                store_text(hashes[doc.id], text)
+        result[doc.id] = normalize_identifiers(ids)
+    return result
+
+
 def calculate_text_similarity(text1: str, text2: str) -> float:
     """
     Calculate similarity ratio between two texts using SequenceMatcher.
@@ -108,8 +201,7 @@ def check_content_duplicate(application_id: int) -> List[Dict]:
         if not application or not application.documents:
             return conflicts
         
-        # Extract text and identifiers from all documents
-        app_texts = []
+        # Extract identifiers from all documents
         app_identifiers = {
             'nrc': set(),
             'tpin': set(),
@@ -117,14 +209,11 @@ def check_content_duplicate(application_id: int) -> List[Dict]:
             'email': set()
         }
         
-        for doc in application.documents:
-            text = extract_document_text(doc.file_path, doc.mime_type)
-            if text:
-                app_texts.append(text)
-                # Extract identifiers
-                ids = extract_identifiers_from_text(text)
-                for key in app_identifiers:
-                    app_identifiers[key].update(ids[key])
+        # Identifiers stored at upload, or read in full from documents not extracted yet
+        # (every type is matched against other applications, and the full text is cached)
+        for ids in document_identifiers(application.documents, stop_when=()).values():
+            for key in app_identifiers:
+                app_identifiers[key].update(ids[key])
         
         # Add application's own identifiers
         if application.nrc_number:
@@ -141,6 +230,13 @@ def check_content_duplicate(application_id: int) -> List[Dict]:
             LandApplication.id != application_id,
             LandApplication.user_id.isnot(None)
         ).all()
+
+        # A conflict needs an NRC or TPIN match (phone and email together score below the
+        # threshold), so uncached files of other applications are only read until both have
+        # been found; one cache lookup covers every other application's documents
+        other_doc_identifiers = document_identifiers(
+            doc for other_app in other_applications for doc in other_app.documents
+        )
         
         for other_app in other_applications:
             match_score = 0.0
@@ -165,11 +261,18 @@ def check_content_duplicate(application_id: int) -> List[Dict]:
             
             # Extract from documents
             for doc in other_app.documents:
-                text = extract_document_text(doc.file_path, doc.mime_type)
-                if text:
-                    ids = extract_identifiers_from_text(text)
-                    for key in other_identifiers:
-                        other_identifiers[key].update(ids[key])
+                ids = other_doc_identifiers[doc.id]
+                for key in other_identifiers:
+                    other_identifiers[key].update(ids[key])
+            
+            if not any(app_identifiers[key] & other_identifiers[key] for key in ('nrc', 'tpin')):
+                continue
+            
+            # Matching application: read its documents in full so phone numbers and emails
+            # on later pages are scored too (files already read to the end come from the cache)
+            for ids in document_identifiers(other_app.documents, stop_when=()).values():
+                for key in other_identifiers:
+                    other_identifiers[key].update(ids[key])
             
             # Calculate matches
             for key in ['nrc', 'tpin', 'phone', 'email']:
@@ -242,11 +345,45 @@ def check_identity_duplicate(nrc: str, tpin: str, exclude_app_id: Optional[int]
     return duplicates
 
 
+def _add_document_duplicate(application_id: int, dup_doc: Document, description: str, title: str,
+                            severity: str, score: float) -> Optional[LandConflict]:
+    """
+    Add a document_duplicate conflict against dup_doc's application to the session,
+    unless an unresolved one against that application already exists.
+    """
+    dup_app = dup_doc.application
+    existing = LandConflict.query.filter_by(
+        application_id=application_id,
+        conflict_type='document_duplicate',
+        status='unresolved'
+    ).filter(
+        LandConflict.description.like(f'%{dup_app.reference_number}%')
+    ).first()
+    if existing:
+        return None
+
+    conflict = LandConflict(
+        application_id=application_id,
+        conflicting_parcel_id=dup_app.land_parcel.id if dup_app.land_parcel else None,
+        description=description,
+        status='unresolved',
+        detected_by_ai=True,
+        created_at=datetime.utcnow(),
+        conflict_type='document_duplicate',
+        title=title,
+        severity=severity,
+        confidence_score=score
+    )
+    db.session.add(conflict)
+    return conflict
+
+
 def detect_all_duplicates(application_id: int) -> List[LandConflict]:
     """
     Comprehensive duplicate detection for an application.
     Checks:
-    1. File hash duplicates
+    1. File hash duplicates, then near-duplicate text (MinHash/LSH) and
+       near-identical images (perceptual hashes)
     2. Content duplicates across formats
     3. Identity duplicates (NRC/TPIN)
     
@@ -268,32 +405,55 @@ def detect_all_duplicates(application_id: int) -> List[LandConflict]:
                 for dup_doc in hash_duplicates:
                     # Only create conflict if from different application
                     if dup_doc.application_id != application_id:
-                        dup_app = dup_doc.application
-                        
-                        # Check if conflict already exists
-                        existing = LandConflict.query.filter_by(
-                            application_id=application_id,
-                            conflict_type='document_duplicate',
-                            status='unresolved'
-                        ).filter(
-                            LandConflict.description.like(f'%{dup_app.reference_number}%')
-                        ).first()
-                        
-                        if not existing:
-                            conflict = LandConflict(
-                                application_id=application_id,
-                                conflicting_parcel_id=dup_app.land_parcel.id if dup_app.land_parcel else None,
-                                description=build_duplicate_description('document', doc, dup_doc, dup_app),
-                                status='unresolved',
-                                detected_by_ai=True,
-                                created_at=datetime.utcnow(),
-                                conflict_type='document_duplicate',
-                                title=f"⚠️ Duplicate Document: {doc.document_type}",
-                                severity='high',
-                                confidence_score=1.0  # Exact hash match = 100% confidence
-                            )
-                            db.session.add(conflict)
+                        conflict = _add_document_duplicate(
+                            application_id, dup_doc,
+                            build_duplicate_description('document', doc, dup_doc, dup_doc.application),
+                            f"⚠️ Duplicate Document: {doc.document_type}",
+                            'high',
+                            1.0  # Exact hash match = 100% confidence
+                        )
+                        if conflict:
                             created_conflicts.append(conflict)
+
+        # Near-duplicate text: the same document re-typed, re-scanned or lightly edited
+        for doc, dup_doc, similarity in find_near_duplicates(application.documents,
+                                                             exclude_application_id=application_id):
+            conflict = _add_document_duplicate(
+                application_id, dup_doc,
+                build_similar_document_description(
+                    doc, dup_doc, dup_doc.application,
+                    "🔍 NEAR-DUPLICATE DOCUMENT DETECTED",
+                    "AI has detected that the text of your document is almost the same as a document "
+                    "in another application, although the files are different (for example a re-scan, "
+                    "re-typed copy or edited version).",
+                    f"📊 TEXT SIMILARITY: {similarity:.0%} of word sequences shared"
+                ),
+                f"⚠️ Near-Duplicate Document: {doc.document_type}",
+                'high' if similarity >= 0.9 else 'medium',
+                round(similarity, 4)
+            )
+            if conflict:
+                created_conflicts.append(conflict)
+
+        # Same image: the document scanned or photographed again (no OCR needed)
+        for doc, dup_doc, distance in find_similar_images(application.documents,
+                                                          exclude_application_id=application_id):
+            conflict = _add_document_duplicate(
+                application_id, dup_doc,
+                build_similar_document_description(
+                    doc, dup_doc, dup_doc.application,
+                    "📷 SAME DOCUMENT IMAGE DETECTED",
+                    "AI has detected that your document looks the same as a document in another "
+                    "application, although the files are different (for example a new scan or photo "
+                    "of the same paper).",
+                    f"📊 IMAGE DIFFERENCE: {distance} of 64 fingerprint bits"
+                ),
+                f"⚠️ Same Document Image: {doc.document_type}",
+                'high',
+                round(1 - distance / 64, 4)
+            )
+            if conflict:
+                created_conflicts.append(conflict)
         
         # 2. Check content duplicates
         content_conflicts = check_content_duplicate(application_id)
@@ -405,6 +565,31 @@ def build_duplicate_description(dup_type: str, doc1: Document, doc2: Document, o
     return "\n".join(lines)
 
 
+def build_similar_document_description(doc1: Document, doc2: Document, other_app: LandApplication,
+                                       heading: str, summary: str, measure: str) -> str:
+    """Build detailed description for a document that resembles one in another application
+    without being the same file (near-identical text or image)."""
+    lines = []
+    lines.append(heading)
+    lines.append(f"\n{summary}")
+    lines.append("\n📄 YOUR DOCUMENT:")
+    lines.append(f"• Filename: {doc1.original_filename}")
+    lines.append(f"• Type: {doc1.document_type}")
+    lines.append("\n🔄 MATCHING DOCUMENT FROM:")
+    lines.append(f"• Application: {other_app.reference_number}")
+    lines.append(f"• Applicant: {other_app.applicant_name}")
+    lines.append(f"• Location: {other_app.land_location}")
+    lines.append(f"• Document: {doc2.original_filename}")
+    lines.append(f"• Type: {doc2.document_type}")
+    lines.append(f"\n{measure}")
+    lines.append("\n✅ REQUIRED ACTION:")
+    lines.append("1. Compare both documents side by side before approving either application")
+    lines.append("2. Ask the applicant to explain, or for the original paper document, "
+                 "if they differ in owner or land")
+
+    return "\n".join(lines)
+
+
 def build_content_duplicate_description(app1: LandApplication, app2: LandApplication, details: List[str]) -> str:
     """Build detailed description for content duplicate."""
     lines = []
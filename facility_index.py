@@ -0,0 +1,221 @@
+"""
+facility_index.py
+
+KD-tree over the schools, hospitals, offices and companies in the collected data CSVs,
+for flagging applications that sit close to public or institutional land.
+
+Design:
+- load_facilities() reads schools.csv, sample-data-Companies.csv (lat/lng columns) and
+  "companies in ndola.csv" (GPS_Coordinates "lat,lng") from FACILITY_DATA_DIR
+- FacilityIndex projects the points to metres (geometry_metrics.METRIC_SRID) once and
+  builds a scipy cKDTree, lazily on the first query; a lookup is one ball query around
+  the polygon's centroid with radius = distance + the polygon's reach, followed by an
+  exact polygon-to-point distance on the few points it returns
+- annotate_proximity(geoms) returns, per geometry, the facilities within
+  FACILITY_PROXIMITY_M; detect_conflicts stores them in ai_analysis_result
+"""
+import csv
+import logging
+import os
+import threading
+
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+from geometry_metrics import to_metric
+
+logger = logging.getLogger(__name__)
+
+FACILITY_DATA_DIR = os.environ.get(
+    'FACILITY_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'collected data')
+)
+
+# Applications whose boundary comes within this many metres of a facility are annotated.
+FACILITY_PROXIMITY_M = float(os.environ.get('FACILITY_PROXIMITY_M', '100'))
+
+# Facility kinds treated as public or institutional land regardless of ownership status.
+INSTITUTIONAL_KINDS = {
+    'School', 'Hospital', 'Clinic', 'Medical Centre', 'Government Office',
+    'Religious Institution', 'College/Training Centre', 'University Unit', 'NGO',
+}
+
+# Google-Maps style category keywords -> facility kind
+_CATEGORY_KINDS = [
+    ('school', 'School'),
+    ('educational', 'College/Training Centre'),
+    ('hospital', 'Hospital'),
+    ('clinic', 'Clinic'),
+    ('church', 'Religious Institution'),
+    ('non-governmental', 'NGO'),
+    ('non-profit', 'NGO'),
+    ('government', 'Government Office'),
+]
+
+
+def _kind_from_category(category):
+    category = (category or '').lower()
+    for keyword, kind in _CATEGORY_KINDS:
+        if keyword in category:
+            return kind
+    return 'Company'
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_places_csv(path):
+    """schools.csv / sample-data-Companies.csv: name, address, lat, lng, category_name..."""
+    with open(path, newline='', encoding='utf-8-sig') as fh:
+        for row in csv.DictReader(fh):
+            lat, lng = _float(row.get('lat')), _float(row.get('lng'))
+            if lat is None or lng is None:
+                continue
+            kind = _kind_from_category(row.get('category_name') or row.get('primary_category_name'))
+            yield {
+                'name': row.get('name'),
+                'kind': kind,
+                'ownership': None,
+                'lat': lat,
+                'lng': lng,
+                'source': os.path.basename(path),
+            }
+
+
+def _read_entities_csv(path):
+    """companies in ndola.csv: Entity_Name, Entity_Type, GPS_Coordinates "lat,lng", Ownership_Status."""
+    with open(path, newline='', encoding='utf-8-sig') as fh:
+        for row in csv.DictReader(fh):
+            parts = (row.get('GPS_Coordinates') or '').split(',')
+            if len(parts) != 2:
+                continue
+            lat, lng = _float(parts[0]), _float(parts[1])
+            if lat is None or lng is None:
+                continue
+            yield {
+                'name': row.get('Entity_Name'),
+                'kind': row.get('Entity_Type') or 'Company',
+                'ownership': row.get('Ownership_Status'),
+                'lat': lat,
+                'lng': lng,
+                'source': os.path.basename(path),
+            }
+
+
+FACILITY_SOURCES = [
+    ('schools.csv', _read_places_csv),
+    ('sample-data-Companies.csv', _read_places_csv),
+    ('companies in ndola.csv', _read_entities_csv),
+]
+
+
+def load_facilities(data_dir=FACILITY_DATA_DIR):
+    """All facilities from the collected data CSVs, with an 'institutional' flag."""
+    facilities = []
+    for filename, reader in FACILITY_SOURCES:
+        path = os.path.join(data_dir, filename)
+        if not os.path.exists(path):
+            logger.warning('Facility data file not found: %s', path)
+            continue
+        try:
+            facilities.extend(reader(path))
+        except Exception:
+            logger.exception('Failed to read facility data from %s', path)
+    for f in facilities:
+        f['institutional'] = (
+            f['kind'] in INSTITUTIONAL_KINDS or f['ownership'] in ('Public', 'Institutional')
+        )
+    return facilities
+
+
+class FacilityIndex:
+    """cKDTree over facility points in projected metres, built on first use."""
+
+    def __init__(self, data_dir=FACILITY_DATA_DIR):
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._tree = None
+        self._facilities = []
+
+    def _ensure_built(self):
+        if self._tree is not None:
+            return
+        with self._lock:
+            if self._tree is not None:
+                return
+            facilities = load_facilities(self.data_dir)
+            if facilities:
+                points = to_metric(shapely.points([(f['lng'], f['lat']) for f in facilities]))
+                xy = shapely.get_coordinates(points)
+            else:
+                xy = np.empty((0, 2))
+            self._facilities = facilities
+            self._xy = xy
+            self._tree = cKDTree(xy)
+            logger.info('Built facility index over %d facilities', len(facilities))
+
+    def reload(self):
+        """Drop the tree so the CSVs are read again on the next query."""
+        with self._lock:
+            self._tree = None
+
+    def near(self, geom, distance_m=FACILITY_PROXIMITY_M, institutional_only=True):
+        """Facilities within distance_m metres of an EPSG:4326 geometry, nearest first."""
+        return self.near_many([geom], distance_m, institutional_only)[0]
+
+    def near_many(self, geoms, distance_m=FACILITY_PROXIMITY_M, institutional_only=True):
+        """near() for a list of geometries; None entries get an empty list."""
+        self._ensure_built()
+        results = [[] for _ in geoms]
+        if not len(self._facilities):
+            return results
+        for i, geom in enumerate(geoms):
+            if geom is None or geom.is_empty:
+                continue
+            projected = to_metric(geom)
+            centre = shapely.get_coordinates(projected.centroid)[0]
+            # every point of the polygon lies within `reach` of its centroid
+            reach = np.sqrt(((shapely.get_coordinates(projected) - centre) ** 2).sum(axis=1)).max()
+            hits = self._tree.query_ball_point(centre, distance_m + reach)
+            if not hits:
+                continue
+            hits = np.asarray(hits)
+            dist = shapely.distance(projected, shapely.points(self._xy[hits]))
+            for j in np.argsort(dist):
+                if dist[j] > distance_m:
+                    break
+                f = self._facilities[hits[j]]
+                if institutional_only and not f['institutional']:
+                    continue
+                results[i].append({
+                    'name': f['name'],
+                    'kind': f['kind'],
+                    'ownership': f['ownership'],
+                    'distance_m': round(float(dist[j]), 1),
+                    'source': f['source'],
+                })
+        return results
+
+    def __len__(self):
+        self._ensure_built()
+        return len(self._facilities)
+
+
+# Shared by every request handled in this process.
+facility_index = FacilityIndex()
+
+
+def annotate_proximity(geoms, distance_m=FACILITY_PROXIMITY_M):
+    """Per geometry, the public/institutional facilities within distance_m metres.
+
+    Never raises: a missing or unreadable data directory yields empty annotations.
+    """
+    try:
+        return facility_index.near_many(geoms, distance_m)
+    except Exception:
+        logger.exception('Facility proximity check failed')
+        return [[] for _ in geoms]
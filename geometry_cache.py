@@ -0,0 +1,107 @@
+"""
+geometry_cache.py
+
+Bounded LRU cache of decoded geometries for parcels and applications.
+
+Design:
+- entries are keyed by (kind, object id) and carry a version, a short hash of the
+  stored WKB; a lookup whose WKB hash differs is a miss and replaces the entry, so an
+  edited geometry is never served stale even without an explicit invalidate()
+- each entry holds the Shapely geometry, its prepared form (shapely.prepared.prep)
+  and its __geo_interface__ dict, so repeated GeoJSON responses skip WKB parsing
+- get() hands out a shallow copy of the geojson dict (its coordinates are nested
+  tuples), so a caller adding keys before jsonify never changes the cached entry
+- hit/miss/eviction counters are exposed through stats() for sizing the cache
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import shapely
+from shapely.prepared import prep
+
+# Maximum number of decoded geometries kept per process.
+GEOMETRY_CACHE_SIZE = int(os.environ.get('GEOMETRY_CACHE_SIZE', '10000'))
+
+CachedGeometry = namedtuple('CachedGeometry', ['geom', 'prepared', 'geojson'])
+
+
+def _with_own_geojson(cached):
+    return cached._replace(geojson=dict(cached.geojson))
+
+
+class GeometryCache:
+    """Thread-safe LRU of CachedGeometry entries."""
+
+    def __init__(self, maxsize=GEOMETRY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, kind, obj_id, coordinates):
+        """Return the CachedGeometry for a stored geometry, decoding it on a miss."""
+        if coordinates is None:
+            return None
+        wkb = bytes(coordinates.data)
+        version = hashlib.blake2b(wkb, digest_size=8).hexdigest()
+        key = (kind, obj_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _with_own_geojson(entry[1])
+            self.misses += 1
+
+        geom = shapely.from_wkb(wkb)
+        cached = CachedGeometry(geom, prep(geom), geom.__geo_interface__)
+        with self._lock:
+            self._entries[key] = (version, cached)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return _with_own_geojson(cached)
+
+    def invalidate(self, kind, obj_id):
+        """Drop the entry for one object (call after its geometry changes)."""
+        with self._lock:
+            if self._entries.pop((kind, obj_id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for sizing the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+# Shared by every request handled in this process.
+geometry_cache = GeometryCache()
+
+
+def parcel_geometry(parcel):
+    """CachedGeometry for a LandParcel, or None when it has no coordinates."""
+    return geometry_cache.get('parcel', parcel.id, parcel.coordinates)
+
+
+def application_geometry(application):
+    """CachedGeometry for a LandApplication, or None when it has no coordinates."""
+    return geometry_cache.get('application', application.id, application.coordinates)
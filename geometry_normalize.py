@@ -0,0 +1,81 @@
+"""
+geometry_normalize.py
+
+Canonical form for parcel and application polygons, applied on ingest.
+
+Design:
+- normalize_geometries(geoms) works on whole arrays with Shapely 2 vectorized functions:
+  make_valid repairs self-intersections, set_precision snaps every vertex to a fixed grid
+  (NORMALIZE_GRID_SIZE degrees) and drops the duplicate vertices that snapping creates,
+  and orient_polygons puts exterior rings counter-clockwise and holes clockwise (the
+  GeoJSON right-hand rule)
+- the geometry columns are POLYGON, so when repair splits a shape into several parts only
+  the largest polygon is kept; inputs that collapse to nothing come back as None
+- normalize_geometry(geom) is the single-geometry form used by register_land,
+  edit_application and the importer; scripts/normalize_geometries.py rewrites existing rows
+"""
+import logging
+import os
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from shapely.geometry.polygon import orient
+
+logger = logging.getLogger(__name__)
+
+# 1e-7 degrees is about a centimetre around Ndola, far below survey accuracy.
+NORMALIZE_GRID_SIZE = float(os.environ.get('NORMALIZE_GRID_SIZE', '1e-7'))
+
+
+def _largest_polygon(geom):
+    """The largest Polygon part of a repaired geometry, or None."""
+    if geom is None or geom.is_empty:
+        return None
+    if isinstance(geom, Polygon):
+        return geom
+    parts = [g for g in shapely.get_parts(geom) if isinstance(g, Polygon) and not g.is_empty]
+    if not parts:
+        # a GeometryCollection may nest multipolygons
+        parts = [g for g in shapely.get_parts(shapely.get_parts(geom)) if isinstance(g, Polygon)]
+    if not parts:
+        return None
+    return max(parts, key=lambda g: g.area)
+
+
+def _orient(geoms):
+    if hasattr(shapely, 'orient_polygons'):  # Shapely >= 2.1
+        return shapely.orient_polygons(geoms, exterior_cw=False)
+    return np.array([orient(g, sign=1.0) if g is not None else None for g in geoms], dtype=object)
+
+
+def normalize_geometries(geoms, grid_size=NORMALIZE_GRID_SIZE):
+    """Canonical Polygons for an array of geometries (None where nothing usable is left)."""
+    geoms = np.asarray(geoms, dtype=object)
+    out = shapely.make_valid(geoms)
+
+    # make_valid returns multi-part results for bow-ties and overlapping rings
+    non_polygon = np.nonzero(shapely.get_type_id(out) != shapely.GeometryType.POLYGON)[0]
+    for i in non_polygon.tolist():
+        if out[i] is not None:
+            logger.warning('Geometry %d repaired into %s; keeping its largest polygon', i, out[i].geom_type)
+        out[i] = _largest_polygon(out[i])
+
+    out = shapely.set_precision(out, grid_size)
+    # snapping can collapse slivers or turn a polygon multi-part again
+    non_polygon = np.nonzero(shapely.get_type_id(out) != shapely.GeometryType.POLYGON)[0]
+    for i in non_polygon.tolist():
+        out[i] = _largest_polygon(out[i])
+
+    out = _orient(out)
+    empty = shapely.is_missing(out) | shapely.is_empty(out)
+    out[empty] = None
+    return out
+
+
+def normalize_geometry(geom, grid_size=NORMALIZE_GRID_SIZE):
+    """Canonical Polygon for one geometry; raises ValueError when nothing usable is left."""
+    result = normalize_geometries([geom], grid_size)[0]
+    if result is None:
+        raise ValueError('Geometry is empty or degenerate after normalization')
+    return result
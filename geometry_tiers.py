@@ -0,0 +1,88 @@
+"""
+geometry_tiers.py
+
+Precomputed simplified GeoJSON for map display, at a few levels of detail.
+
+Design:
+- every parcel and application stores display_geometry, a JSON object with one GeoJSON
+  geometry per tier in DETAIL_TIERS ('low', 'medium', 'high'); each tier is simplified
+  with preserve_topology and its coordinates rounded to the tier's precision, so the
+  response is both smaller and ready to serialize without touching the WKB
+- 'full' is the stored geometry itself, served from geometry_cache
+- tiers are rebuilt by before_insert/before_update listeners whenever coordinates change
+  (models.py imports this module, so every writer registers them);
+  scripts/build_geometry_tiers.py adds the column and fills it for existing rows
+- display endpoints take ?detail=low|medium|high|full (parse_detail) and call
+  display_geojson(obj, detail)
+"""
+import numpy as np
+import shapely
+from sqlalchemy import event, inspect
+
+from geometry_cache import application_geometry, parcel_geometry
+from models import LandApplication, LandParcel
+import spatial_cells  # module import: models imports both modules, in either order
+
+# tier -> (simplification tolerance in degrees, coordinate grid in degrees)
+# 1e-4 degrees is ~11 m around Ndola, 2e-5 ~2 m, 5e-6 ~0.5 m
+DETAIL_TIERS = {
+    'low': (1e-4, 1e-5),
+    'medium': (2e-5, 1e-6),
+    'high': (5e-6, 1e-7),
+}
+DETAIL_LEVELS = tuple(DETAIL_TIERS) + ('full',)
+DEFAULT_DETAIL = 'full'
+
+
+def build_tiers(geoms):
+    """{tier: GeoJSON dict} for each geometry in an array (None for missing ones)."""
+    geoms = np.asarray(geoms, dtype=object)
+    tiers = [{} for _ in geoms]
+    for name, (tolerance, grid) in DETAIL_TIERS.items():
+        simplified = shapely.simplify(geoms, tolerance, preserve_topology=True)
+        simplified = shapely.set_precision(simplified, grid)
+        for out, g, original in zip(tiers, simplified, geoms):
+            # tiny parcels can collapse at coarse tiers; fall back to the original outline
+            if g is None or g.is_empty:
+                g = original
+            out[name] = g.__geo_interface__ if g is not None else None
+    return [t if g is not None else None for t, g in zip(tiers, geoms)]
+
+
+def parse_detail(value):
+    """Validate a detail= query parameter; raises ValueError for unknown tiers."""
+    if value is None or value == '':
+        return DEFAULT_DETAIL
+    value = value.lower()
+    if value not in DETAIL_LEVELS:
+        raise ValueError(f"detail must be one of {', '.join(DETAIL_LEVELS)}")
+    return value
+
+
+def display_geojson(obj, detail=DEFAULT_DETAIL):
+    """GeoJSON for a LandParcel or LandApplication at the requested tier."""
+    if obj is None or obj.coordinates is None:
+        return None
+    if detail != 'full':
+        tiers = obj.display_geometry or {}
+        if tiers.get(detail) is not None:
+            return tiers[detail]
+    # full detail, or a row whose tiers were never built
+    cached = parcel_geometry(obj) if isinstance(obj, LandParcel) else application_geometry(obj)
+    return cached.geojson if cached is not None else None
+
+
+def _set_display_geometry(mapper, connection, target):
+    state = inspect(target)
+    if state.persistent and not state.attrs.coordinates.history.has_changes():
+        return
+    try:
+        target.display_geometry = build_tiers([spatial_cells._to_shape(target.coordinates)])[0]
+    except Exception:
+        # endpoints fall back to the full geometry
+        target.display_geometry = None
+
+
+for _model in (LandParcel, LandApplication):
+    event.listen(_model, 'before_insert', _set_display_geometry)
+    event.listen(_model, 'before_update', _set_display_geometry)
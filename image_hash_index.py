@@ -0,0 +1,186 @@
+"""
+image_hash_index.py
+
+Perceptual hashes of uploaded images and first PDF pages, for finding the same document
+scanned or photographed again without running OCR.
+
+Design:
+- each document gets a 64-bit pHash (sign of the low 8x8 DCT coefficients of a 32x32 gray
+  image against their median) and a 64-bit dHash (sign of horizontal gradients of a 9x8
+  gray image), stored as signed BIGINTs in document_image_hashes. Both survive rescaling,
+  recompression and small lighting changes, which change the file hash completely
+- hashes are computed from the cached PNG thumbnail (renditions.get_rendition), so a PDF
+  is rendered once for both the review page and the hash, and nothing is OCR'd
+- search is multi-index hashing: the pHash is split into four 16-bit quarters, each an
+  indexed column. Two hashes within MAX_DISTANCE bits differ by at most MAX_DISTANCE // 4
+  bits in at least one quarter, so one query with the (few hundred) quarter values within
+  that radius finds every candidate; each candidate is then checked with the full pHash
+  distance and confirmed with the dHash distance
+- blank or almost uniform pages get NULL hashes (every blank page looks alike)
+- rows are written on their own connection; deleting a Document removes its row in the
+  same flush
+- duplicate_detector hashes an application's documents when it checks them; run
+  scripts/build_image_hash_index.py once to hash documents uploaded before this existed
+"""
+import logging
+import os
+from itertools import combinations
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import delete, event, insert, or_, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import db, Document, DocumentImageHash
+from renditions import get_rendition, supports_rendition
+
+logger = logging.getLogger(__name__)
+
+MAX_DISTANCE = int(os.environ.get('IMAGE_HASH_MAX_DISTANCE', '8'))  # pHash bits
+DHASH_MAX_DISTANCE = int(os.environ.get('DHASH_MAX_DISTANCE', '14'))
+BLANK_STD = 3.0  # gray levels; flatter images are treated as blank
+QUARTERS = 4
+
+_N = 32
+_DCT = np.cos(np.pi * np.outer(np.arange(_N), 2 * np.arange(_N) + 1) / (2 * _N))
+_QUARTER_COLUMNS = [DocumentImageHash.phash_q0, DocumentImageHash.phash_q1,
+                    DocumentImageHash.phash_q2, DocumentImageHash.phash_q3]
+
+
+def _pack(bits):
+    """64 booleans -> signed 64-bit int (as stored in a BIGINT column)."""
+    value = int(np.packbits(bits).view('>u8')[0])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _gray(img, size):
+    return np.asarray(img.convert('L').resize(size, Image.Resampling.LANCZOS), dtype=np.float64)
+
+
+def phash(img):
+    pixels = _gray(img, (_N, _N))
+    coeffs = (_DCT @ pixels @ _DCT.T)[:8, :8].flatten()
+    return _pack(coeffs > np.median(coeffs[1:]))  # the DC term would skew the median
+
+
+def dhash(img):
+    pixels = _gray(img, (9, 8))
+    return _pack((pixels[:, 1:] > pixels[:, :-1]).flatten())
+
+
+def image_hashes(img):
+    """(phash, dhash) of a PIL image, or (None, None) if it is blank."""
+    if _gray(img, (64, 64)).std() < BLANK_STD:
+        return None, None
+    return phash(img), dhash(img)
+
+
+def hamming(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+
+def quarters(value):
+    """The four 16-bit quarters of a 64-bit hash, low bits first."""
+    value &= 0xFFFFFFFFFFFFFFFF
+    return [(value >> (16 * k)) & 0xFFFF for k in range(QUARTERS)]
+
+
+def _flips(radius):
+    """XOR masks of the 16-bit values within radius bits."""
+    return [sum(1 << bit for bit in bits) for d in range(radius + 1) for bits in combinations(range(16), d)]
+
+
+# --- index maintenance ---------------------------------------------------------------------
+
+def _store(document_id, hashes):
+    p, d = hashes
+    values = dict(document_id=document_id, phash=p, dhash=d)
+    if p is not None:
+        values.update({f'phash_q{k}': q for k, q in enumerate(quarters(p))})
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(delete(DocumentImageHash).where(DocumentImageHash.document_id == document_id))
+            conn.execute(insert(DocumentImageHash).values(**values))
+    except IntegrityError:
+        pass  # hashed concurrently by another worker
+    except SQLAlchemyError:
+        logger.warning('Could not store image hashes for document %s', document_id, exc_info=True)
+
+
+def document_image_hashes(doc):
+    """(phash, dhash) of a Document's image or first PDF page; None if it has no rendition."""
+    path = get_rendition(doc, 'thumb', 'png')
+    if path is None:
+        return None
+    with Image.open(path) as img:
+        return image_hashes(img)
+
+
+def index_documents(docs, force=False):
+    """Hash the image and PDF Documents that have no row yet (all of them with force); returns how many."""
+    docs = [d for d in docs if supports_rendition(d)]
+    if not force and docs:
+        present = set(db.session.execute(
+            select(DocumentImageHash.document_id)
+            .where(DocumentImageHash.document_id.in_([d.id for d in docs]))
+        ).scalars())
+        docs = [d for d in docs if d.id not in present]
+    count = 0
+    for doc in docs:
+        try:
+            hashes = document_image_hashes(doc)
+        except Exception as e:
+            logger.warning('Could not hash document %s: %s', doc.id, e)
+            continue
+        if hashes is not None:
+            _store(doc.id, hashes)
+            count += 1
+    return count
+
+
+@event.listens_for(Document, 'after_delete')
+def _document_deleted(mapper, connection, target):
+    # databases without enforced foreign keys (SQLite) would otherwise keep the row
+    connection.execute(delete(DocumentImageHash).where(DocumentImageHash.document_id == target.id))
+
+
+# --- lookup ------------------------------------------------------------------------------
+
+def find_similar_images(docs, max_distance=MAX_DISTANCE, exclude_application_id=None):
+    """[(document, other document, pHash distance)] for visually near-identical documents, closest first.
+
+    Documents of exclude_application_id, and byte-identical files (same file_hash, which
+    check_file_hash_duplicate reports), are not returned.
+    """
+    docs = list(docs)
+    index_documents(docs)
+    by_id = {d.id: d for d in docs}
+    if not by_id:
+        return []
+    own = db.session.execute(
+        select(DocumentImageHash.document_id, DocumentImageHash.phash, DocumentImageHash.dhash)
+        .where(DocumentImageHash.document_id.in_(list(by_id)))
+        .where(DocumentImageHash.phash.isnot(None))
+    ).all()
+
+    flips = _flips(max_distance // QUARTERS)
+    matches = []
+    for document_id, p, d in own:
+        doc = by_id[document_id]
+        near = [column.in_([q ^ f for f in flips]) for column, q in zip(_QUARTER_COLUMNS, quarters(p))]
+        query = (
+            select(Document, DocumentImageHash.phash, DocumentImageHash.dhash)
+            .join(DocumentImageHash, DocumentImageHash.document_id == Document.id)
+            .where(or_(*near))
+            .where(Document.id != document_id)
+        )
+        if exclude_application_id is not None:
+            query = query.where(Document.application_id != exclude_application_id)
+        for other, other_p, other_d in db.session.execute(query):
+            if doc.file_hash and other.file_hash == doc.file_hash:
+                continue
+            distance = hamming(p, other_p)
+            if distance <= max_distance and hamming(d, other_d) <= DHASH_MAX_DISTANCE:
+                matches.append((doc, other, distance))
+    matches.sort(key=lambda m: m[2])
+    return matches
@@ -0,0 +1,106 @@
+"""
+image_preprocess.py
+
+Prepares photos and scans for tesseract, which is both faster and more accurate on a
+modest-resolution, upright, black-on-white image than on a multi-megapixel colour photo.
+
+Design:
+- preprocess_image(img, profile) runs, in order: EXIF orientation fix, downscale so the
+  document's long side is at most target_dpi * long_side_in pixels (never upscaled),
+  grayscale, optional adaptive binarization and optional deskew
+- binarization is Bradley's local-mean threshold (Pillow's C box blur gives the local
+  mean), so it copes with the uneven lighting of phone photos in O(pixels)
+- deskew scores small rotations (+-DESKEW_MAX_DEG) of a reduced copy by the sharpness of
+  the horizontal projection profile and rotates the full image by the best one
+- PROFILES holds the settings per kind of document; profile_for(document_type) maps
+  Document.document_type labels (or upload field keys) to a profile
+- scripts/benchmark_ocr_preprocessing.py measures OCR time and identifier recall with and
+  without this stage; OCR_PREPROCESS=0 turns it off
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps
+
+OCR_PREPROCESS = os.environ.get('OCR_PREPROCESS', '1') != '0'
+
+# long_side_in is the physical long side of what is photographed, in inches
+Profile = namedtuple('Profile', ['target_dpi', 'long_side_in', 'binarize', 'deskew'])
+
+PROFILES = {
+    # A4 pages: letters, certificates, deeds, agreements
+    'document': Profile(target_dpi=300, long_side_in=11.7, binarize=True, deskew=True),
+    # ID cards are small but usually photographed with a margin around them
+    'id_card': Profile(target_dpi=300, long_side_in=6.0, binarize=True, deskew=True),
+    # survey maps: thin lines and coloured areas suffer from thresholding and rotation
+    'map': Profile(target_dpi=200, long_side_in=16.5, binarize=False, deskew=False),
+}
+DEFAULT_PROFILE = 'document'
+
+PROFILE_BY_TYPE = {
+    'nrc copy': 'id_card',
+    'seller id': 'id_card',
+    'buyer id': 'id_card',
+    'borrower id': 'id_card',
+    'survey map': 'map',
+}
+
+BINARIZE_T = 0.15  # a pixel is ink when darker than (1 - t) * local mean
+DESKEW_MAX_DEG = 5.0
+DESKEW_STEP_DEG = 0.5
+DESKEW_WORK_SIZE = 800
+
+
+def profile_for(document_type):
+    """Profile name for a Document.document_type label or upload field key."""
+    key = (document_type or '').strip().lower().replace('_', ' ')
+    return PROFILE_BY_TYPE.get(key, DEFAULT_PROFILE)
+
+
+def _downscale(img, max_side):
+    scale = max_side / max(img.size)
+    if scale >= 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+
+def binarize(gray, t=BINARIZE_T):
+    """Bradley adaptive threshold of an 'L' image; returns an 'L' image of 0/255."""
+    radius = max(7, max(gray.size) // 64)  # window about 1/32 of the long side
+    local_mean = np.asarray(gray.filter(ImageFilter.BoxBlur(radius)), dtype=np.float32)
+    ink = np.asarray(gray, dtype=np.float32) < local_mean * (1.0 - t)
+    return Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+
+
+def skew_angle(gray, max_deg=DESKEW_MAX_DEG, step=DESKEW_STEP_DEG):
+    """Rotation in degrees that makes text lines horizontal (0.0 for a blank image)."""
+    small = _downscale(gray, DESKEW_WORK_SIZE)
+    ink = 255 - np.asarray(small, dtype=np.uint8)
+    if not ink.any():
+        return 0.0
+    ink_img = Image.fromarray(ink)
+    best_angle, best_score = 0.0, None
+    for angle in np.arange(-max_deg, max_deg + step / 2, step):
+        rotated = np.asarray(ink_img.rotate(float(angle), resample=Image.Resampling.NEAREST), dtype=np.float64)
+        profile = rotated.sum(axis=1)
+        score = float(np.square(np.diff(profile)).sum())
+        if best_score is None or score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def preprocess_image(img, profile=DEFAULT_PROFILE):
+    """OCR-ready copy of a PIL image according to a profile name or Profile."""
+    settings = PROFILES[profile] if isinstance(profile, str) else profile
+    img = ImageOps.exif_transpose(img)
+    img = _downscale(img, settings.target_dpi * settings.long_side_in)
+    gray = img.convert('L')
+    if settings.binarize:
+        gray = binarize(gray)
+    if settings.deskew:
+        angle = skew_angle(gray)
+        if abs(angle) >= DESKEW_STEP_DEG:
+            gray = gray.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+    return gray
@@ -0,0 +1,247 @@
+"""
+minhash_index.py
+
+MinHash signatures and an LSH banding index for finding reused or lightly edited documents
+without comparing every pair of documents.
+
+Design:
+- a document's text (from text_cache) is reduced to the set of its SHINGLE_SIZE-word shingles,
+  each hashed to 32 bits; NUM_PERM universal hash functions turn the set into a MinHash
+  signature of NUM_PERM uint32 values, stored as raw bytes in document_signatures
+- the fraction of equal signature values estimates the Jaccard similarity of two shingle
+  sets. The signature is cut into BANDS bands of ROWS_PER_BAND values and each band is
+  hashed to a 64-bit bucket in document_lsh_buckets; documents sharing any bucket are
+  candidates. A lookup is one indexed IN query on the buckets, so its cost depends on the
+  number of candidates, not on the size of the corpus
+- with 32 bands of 4 rows, pairs with Jaccard 0.7 become candidates ~99.9% of the time and
+  pairs below 0.3 rarely do; candidates are then verified with the exact Jaccard similarity
+  of their shingle sets, and only pairs at or above NEAR_DUPLICATE_THRESHOLD are reported
+- the hash functions come from a fixed seed, so signatures written by any process compare;
+  SIGNATURE_VERSION must be bumped when SHINGLE_SIZE, NUM_PERM, BANDS or the seed change,
+  after which older signatures are recomputed on next use
+- rows are written on their own connection (as text_cache does), so the caller's session is
+  never committed here; deleting a Document removes its rows in the same flush
+- documents without text get an empty signature and no buckets, so they are not re-read
+- duplicate_detector indexes an application's documents when it checks them; run
+  scripts/build_minhash_index.py once to index documents uploaded before this existed
+"""
+import hashlib
+import logging
+import os
+import re
+import zlib
+
+import numpy as np
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from models import db, Document, DocumentLshBucket, DocumentSignature
+from text_cache import document_texts
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_VERSION = '1'
+SHINGLE_SIZE = 4  # words per shingle
+NUM_PERM = 128
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', '0.7'))
+MINHASH_SEED = 7919
+QUERY_CHUNK_SIZE = 500
+HASH_CHUNK_SIZE = 2048  # shingles hashed at once; bounds the temporary array to 2 MB
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_rng = np.random.default_rng(MINHASH_SEED)
+_A = _rng.integers(1, _MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _MERSENNE_PRIME, NUM_PERM, dtype=np.uint64)
+_WORD_RE = re.compile(r'\w+')
+
+
+def shingle_hashes(text):
+    """Sorted unique 32-bit hashes of the text's word shingles (lowercased)."""
+    words = _WORD_RE.findall((text or '').lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint32)
+    ids = np.fromiter((zlib.crc32(w.encode('utf-8')) for w in words), dtype=np.uint64, count=len(words))
+    k = min(SHINGLE_SIZE, len(ids))
+    n = len(ids) - k + 1
+    hashes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        hashes = (hashes * np.uint64(1000003) + ids[j:j + n]) & _MAX_HASH
+    return np.unique(hashes.astype(np.uint32))
+
+
+def minhash(hashes):
+    """MinHash signature (NUM_PERM uint32 values) of a non-empty array of shingle hashes."""
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    values = np.asarray(hashes, dtype=np.uint64)
+    for start in range(0, len(values), HASH_CHUNK_SIZE):
+        chunk = values[start:start + HASH_CHUNK_SIZE, None]
+        # uint64 products wrap around; that is fine for hashing
+        permuted = ((chunk * _A + _B) % _MERSENNE_PRIME) & _MAX_HASH
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def band_buckets(signature):
+    """The BANDS bucket keys (signed 64-bit ints) of a signature."""
+    values = np.asarray(signature, dtype='<u4')
+    buckets = []
+    for band in range(BANDS):
+        rows = values[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(band.to_bytes(2, 'little') + rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def jaccard(a, b):
+    """Exact Jaccard similarity of two sorted unique hash arrays."""
+    if not len(a) or not len(b):
+        return 0.0
+    shared = np.intersect1d(a, b, assume_unique=True).size
+    return shared / (len(a) + len(b) - shared)
+
+
+# --- index maintenance ---------------------------------------------------------------------
+
+def _store(document_id, hashes):
+    signature = minhash(hashes) if len(hashes) else None
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(delete(DocumentLshBucket).where(DocumentLshBucket.document_id == document_id))
+            conn.execute(delete(DocumentSignature).where(DocumentSignature.document_id == document_id))
+            conn.execute(insert(DocumentSignature).values(
+                document_id=document_id,
+                signature_version=SIGNATURE_VERSION,
+                minhash=signature.astype('<u4').tobytes() if signature is not None else b'',
+                shingle_count=len(hashes),
+            ))
+            if signature is not None:
+                conn.execute(insert(DocumentLshBucket), [
+                    {'bucket': bucket, 'document_id': document_id} for bucket in set(band_buckets(signature))
+                ])
+    except IntegrityError:
+        pass  # indexed concurrently by another worker
+    except SQLAlchemyError:
+        logger.warning('Could not store MinHash signature for document %s', document_id, exc_info=True)
+
+
+def _signatures(document_ids):
+    """{document id: signature bytes} of the current-version signatures of document_ids."""
+    document_ids = list(document_ids)
+    found = {}
+    for start in range(0, len(document_ids), QUERY_CHUNK_SIZE):
+        chunk = document_ids[start:start + QUERY_CHUNK_SIZE]
+        found.update(db.session.execute(
+            select(DocumentSignature.document_id, DocumentSignature.minhash)
+            .where(DocumentSignature.document_id.in_(chunk))
+            .where(DocumentSignature.signature_version == SIGNATURE_VERSION)
+        ).all())
+    return found
+
+
+def index_documents(docs, force=False):
+    """Sign the Documents that have no current signature (all of them with force); returns how many."""
+    docs = list(docs)
+    if not force:
+        present = _signatures(d.id for d in docs)
+        docs = [d for d in docs if d.id not in present]
+    if not docs:
+        return 0
+    texts = document_texts(docs)
+    for doc in docs:
+        _store(doc.id, shingle_hashes(texts[doc.id]))
+    return len(docs)
+
+
+def remove_documents(document_ids, connection=None):
+    """Drop the signatures and buckets of deleted documents."""
+    document_ids = [int(i) for i in document_ids]
+    if not document_ids:
+        return
+    statements = [
+        delete(DocumentLshBucket).where(DocumentLshBucket.document_id.in_(document_ids)),
+        delete(DocumentSignature).where(DocumentSignature.document_id.in_(document_ids)),
+    ]
+    if connection is not None:
+        for statement in statements:
+            connection.execute(statement)
+        return
+    with db.engine.begin() as conn:
+        for statement in statements:
+            conn.execute(statement)
+
+
+@event.listens_for(Document, 'after_delete')
+def _document_deleted(mapper, connection, target):
+    # databases without enforced foreign keys (SQLite) would otherwise keep the rows
+    remove_documents([target.id], connection)
+
+
+# --- lookup ------------------------------------------------------------------------------
+
+def candidates(signatures):
+    """{document id: set of candidate document ids} sharing at least one LSH bucket."""
+    buckets = {}
+    for document_id, raw in signatures.items():
+        if raw:
+            for bucket in band_buckets(np.frombuffer(raw, dtype='<u4')):
+                buckets.setdefault(bucket, set()).add(document_id)
+
+    keys = list(buckets)
+    found = {document_id: set() for document_id in signatures}
+    for start in range(0, len(keys), QUERY_CHUNK_SIZE):
+        rows = db.session.execute(
+            select(DocumentLshBucket.bucket, DocumentLshBucket.document_id)
+            .where(DocumentLshBucket.bucket.in_(keys[start:start + QUERY_CHUNK_SIZE]))
+        ).all()
+        for bucket, other_id in rows:
+            for document_id in buckets[bucket]:
+                if other_id != document_id:
+                    found[document_id].add(other_id)
+    return found
+
+
+def find_near_duplicates(docs, threshold=NEAR_DUPLICATE_THRESHOLD, exclude_application_id=None):
+    """[(document, other document, Jaccard similarity)] for the near-duplicates of docs, best first.
+
+    Documents of exclude_application_id, and byte-identical files (same file_hash, which
+    check_file_hash_duplicate reports), are not returned.
+    """
+    docs = list(docs)
+    index_documents(docs)
+    by_candidate = candidates(_signatures(d.id for d in docs))
+    candidate_ids = set().union(*by_candidate.values()) if by_candidate else set()
+    if not candidate_ids:
+        return []
+
+    others = {}
+    ids = sorted(candidate_ids)
+    for start in range(0, len(ids), QUERY_CHUNK_SIZE):
+        for other in Document.query.filter(Document.id.in_(ids[start:start + QUERY_CHUNK_SIZE])):
+            if exclude_application_id is None or other.application_id != exclude_application_id:
+                others[other.id] = other
+
+    checked = [d for d in docs if by_candidate.get(d.id, set()) & set(others)]
+    texts = document_texts(checked + list(others.values()))
+    shingles = {}
+
+    def _shingles(doc_id):
+        if doc_id not in shingles:
+            shingles[doc_id] = shingle_hashes(texts[doc_id])
+        return shingles[doc_id]
+
+    matches = []
+    for doc in checked:
+        for other_id in by_candidate[doc.id]:
+            other = others.get(other_id)
+            if other is None or (doc.file_hash and other.file_hash == doc.file_hash):
+                continue
+            similarity = jaccard(_shingles(doc.id), _shingles(other_id))
+            if similarity >= threshold:
+                matches.append((doc, other, similarity))
+    matches.sort(key=lambda m: m[2], reverse=True)
+    logger.debug('MinHash: %d documents, %d candidates, %d near-duplicates',
+                 len(docs), len(others), len(matches))
+    return matches
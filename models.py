@@ -76,6 +76,12 @@ class LandApplication(db.Model):
 
     # Geospatial data
     coordinates = db.Column(Geometry('POLYGON', srid=4326))
+    # quadkey anchor cells for the non-PostGIS prefilter, see spatial_cells.py
+    cell_key = db.Column(db.String(24), index=True)
+    cell_key_coarse = db.Column(db.String(24), index=True)
+    # simplified GeoJSON per display tier, see geometry_tiers.py; deferred so that
+    # ordinary queries (list pages) do not load it
+    display_geometry = db.deferred(db.Column(db.JSON))
 
     # Application Status
     status = db.Column(db.String(20), default='pending')  # pending, approved, rejected, under_review
@@ -86,6 +92,8 @@ class LandApplication(db.Model):
     ai_duplicate_score = db.Column(db.Float, default=0.0)
     ai_analysis_result = db.Column(db.JSON)
     ai_processed = db.Column(db.Boolean, default=False)
+    # input fingerprints per detector at its last run, see reanalysis.py
+    analysis_fingerprints = db.Column(db.JSON)
 
     # Processing Information
     processing_fee = db.Column(db.Float, default=500.0)  # in ZMW
@@ -162,6 +170,66 @@ class Document(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Filled in after upload by document_extraction.py
+    extraction_status = db.Column(db.String(20), default='pending')  # pending, done, empty, failed
+    text_length = db.Column(db.Integer)
+    page_count = db.Column(db.Integer)
+    extracted_identifiers = db.Column(db.JSON)  # {'nrc': [...], 'tpin': [...], 'phone': [...], 'email': [...]}, normalized
+    extracted_at = db.Column(db.DateTime)
+
+
+class ExtractedText(db.Model):
+    """Text extracted from one distinct file, keyed by content hash and extractor version."""
+    __tablename__ = 'extracted_texts'
+    __table_args__ = (
+        db.UniqueConstraint('file_hash', 'extractor_version', name='uq_extracted_text_hash_version'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of the file
+    extractor_version = db.Column(db.String(20), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    char_count = db.Column(db.Integer, default=0)
+    extracted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ExtractedText {self.file_hash[:12]} v{self.extractor_version}>'
+
+
+class DocumentSignature(db.Model):
+    """MinHash signature of one document's extracted text (see minhash_index.py)."""
+    __tablename__ = 'document_signatures'
+
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    signature_version = db.Column(db.String(20), nullable=False)
+    minhash = db.Column(db.LargeBinary, nullable=False)  # NUM_PERM little-endian uint32 values; empty if no text
+    shingle_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DocumentLshBucket(db.Model):
+    """One LSH band bucket of a document signature; documents sharing a bucket are candidates."""
+    __tablename__ = 'document_lsh_buckets'
+
+    bucket = db.Column(db.BigInteger, primary_key=True)  # 64-bit hash of (band number, band values)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'),
+                            primary_key=True, index=True)
+
+
+class DocumentImageHash(db.Model):
+    """Perceptual hashes of a document's image or first PDF page (see image_hash_index.py)."""
+    __tablename__ = 'document_image_hashes'
+
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    phash = db.Column(db.BigInteger)  # 64-bit DCT hash as a signed integer; NULL for blank pages
+    dhash = db.Column(db.BigInteger)  # 64-bit gradient hash
+    # the four 16-bit quarters of phash, for multi-index Hamming search
+    phash_q0 = db.Column(db.Integer, index=True)
+    phash_q1 = db.Column(db.Integer, index=True)
+    phash_q2 = db.Column(db.Integer, index=True)
+    phash_q3 = db.Column(db.Integer, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 class LandParcel(db.Model):
     __tablename__ = 'land_parcels'
@@ -186,6 +254,12 @@ class LandParcel(db.Model):
     valuation = db.Column(db.Float)  # Valuation amount in ZMW
     annual_tax = db.Column(db.Float)  # Annual tax in ZMW
     coordinates = db.Column(Geometry('POLYGON', srid=4326))
+    # quadkey anchor cells for the non-PostGIS prefilter, see spatial_cells.py
+    cell_key = db.Column(db.String(24), index=True)
+    cell_key_coarse = db.Column(db.String(24), index=True)
+    # simplified GeoJSON per display tier, see geometry_tiers.py; deferred so that
+    # ordinary queries (list pages) do not load it
+    display_geometry = db.deferred(db.Column(db.JSON))
     registered_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Foreign Keys
@@ -202,6 +276,26 @@ class LandParcel(db.Model):
     def __repr__(self):
         return f'<LandParcel {self.parcel_number}>'
 
+class ParcelAdjacency(db.Model):
+    """One directed edge of the parcel adjacency graph (each pair is stored both ways)."""
+    __tablename__ = 'parcel_adjacency'
+    __table_args__ = (
+        db.UniqueConstraint('parcel_id', 'neighbour_id', name='uq_parcel_adjacency_pair'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    parcel_id = db.Column(db.Integer, db.ForeignKey('land_parcels.id', ondelete='CASCADE'), nullable=False, index=True)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey('land_parcels.id', ondelete='CASCADE'), nullable=False, index=True)
+    relation = db.Column(db.String(20), nullable=False)  # overlaps, touches, near
+    gap_m = db.Column(db.Float, default=0.0)  # boundary-to-boundary distance in metres
+    shared_edge_m = db.Column(db.Float, default=0.0)  # length of common boundary in metres
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    neighbour = db.relationship('LandParcel', foreign_keys=[neighbour_id], lazy='joined')
+
+    def __repr__(self):
+        return f'<ParcelAdjacency {self.parcel_id}->{self.neighbour_id} {self.relation}>'
+
 class LandConflict(db.Model):
     __tablename__ = 'land_conflicts'
 
@@ -310,3 +404,9 @@ class NotificationLog(db.Model):
     
     def __repr__(self):
         return f'<NotificationLog {self.notification_type} to {self.recipient}>'
+
+
+# Cell keys and display tiers are derived from coordinates by before_insert/before_update
+# listeners; importing the modules here registers them for every writer, not just the app.
+import spatial_cells  # noqa: E402,F401
+import geometry_tiers  # noqa: E402,F401
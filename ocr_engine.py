@@ -0,0 +1,217 @@
+"""
+ocr_engine.py
+
+Shared process pool for OCR of scanned PDFs and images.
+
+Design:
+- one OCREngine per web process (ocr_engine) owns a bounded ProcessPoolExecutor with
+  OCR_WORKERS processes; every caller (request handlers, background detection threads,
+  scripts) submits through it, so concurrent jobs queue for the same workers instead of
+  each starting its own tesseract runs and oversubscribing the CPU
+- at most OCR_MAX_PENDING pages are queued or running at once; further submissions block
+  until a slot frees up, which also bounds the memory held by rasterized pages
+- a PDF is split into one task per page: the worker renders only its own page with
+  PyMuPDF and OCRs it, so pages are never shipped between processes as images; results
+  are reassembled in page order. submit_pdf_page() lets a streaming reader (see
+  document_processing.iter_pdf_pages) OCR just the pages that lack a text layer
+- image files are preprocessed in the worker (image_preprocess) before OCR
+- per-page timeouts are enforced inside the worker (pytesseract kills tesseract after
+  OCR_PAGE_TIMEOUT seconds); a page that fails or times out contributes empty text and
+  the rest of the document is kept
+- workers are started with 'forkserver' ('spawn' on Windows) so they do not inherit the
+  web process's threads or database connections; OCR_WORKERS=0 runs everything inline
+"""
+import atexit
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# leave one core for the web process by default
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+OCR_PAGE_TIMEOUT = int(os.environ.get('OCR_PAGE_TIMEOUT', '120'))
+OCR_MAX_PENDING = int(os.environ.get('OCR_MAX_PENDING', max(4, OCR_WORKERS * 4)))
+OCR_DPI = int(os.environ.get('OCR_DPI', '200'))
+
+
+def open_pdf(file_path):
+    """Open a PDF with PyMuPDF (imported as fitz before 1.24)."""
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    return pymupdf.open(file_path)
+
+
+def _picklable_errors(fn):
+    """Re-raise worker exceptions as RuntimeError.
+
+    Some pytesseract exceptions cannot be unpickled in the parent, which would otherwise
+    mark the whole pool as broken.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            raise RuntimeError(f'{type(e).__name__}: {e}') from None
+    return wrapper
+
+
+@_picklable_errors
+def _ocr_pdf_page(file_path, page_number, dpi, timeout, tesseract_cmd):
+    """Render and OCR one PDF page (1-based). Runs in a worker process."""
+    import pytesseract
+    from PIL import Image
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    with open_pdf(file_path) as pdf:
+        # tesseract works on grayscale anyway; rendering it directly uses a third of the memory
+        pix = pdf[page_number - 1].get_pixmap(dpi=dpi, colorspace='gray', alpha=False)
+    img = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+    return pytesseract.image_to_string(img, timeout=timeout)
+
+
+@_picklable_errors
+def _ocr_image_file(file_path, timeout, tesseract_cmd, profile=None):
+    """OCR one image file, preprocessed with an image_preprocess profile unless None. Runs in a worker process."""
+    import pytesseract
+    from PIL import Image
+    from image_preprocess import preprocess_image
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    with Image.open(file_path) as img:
+        if profile is not None:
+            img = preprocess_image(img, profile)
+        return pytesseract.image_to_string(img, timeout=timeout)
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class _InlineFuture:
+    """Result holder used when OCR_WORKERS=0."""
+
+    def __init__(self, fn, args):
+        try:
+            self._result, self._error = fn(*args), None
+        except Exception as e:
+            self._result, self._error = None, e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def cancel(self):
+        return False
+
+
+class OCREngine:
+    """Bounded, shared process pool for page-level OCR tasks."""
+
+    def __init__(self, workers=OCR_WORKERS, page_timeout=OCR_PAGE_TIMEOUT, max_pending=OCR_MAX_PENDING):
+        self.workers = workers
+        self.page_timeout = page_timeout
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=_mp_context(),
+                )
+            return self._pool
+
+    def _reset(self, pool=None):
+        """Drop a broken pool (the current one by default); the next submit starts a new one."""
+        with self._lock:
+            pool = pool or self._pool
+            if pool is None:
+                return
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args):
+        """Queue one task, blocking while OCR_MAX_PENDING tasks are already in flight."""
+        if self.workers <= 0:
+            return _InlineFuture(fn, args)
+        self._slots.acquire()
+        pool = self._executor()
+        try:
+            future = pool.submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            # a worker died (e.g. killed by the OOM killer), or another thread already
+            # replaced the broken pool; retry once on a fresh pool
+            self._reset(pool)
+            try:
+                future = self._executor().submit(fn, *args)
+            except Exception:
+                self._slots.release()
+                raise
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def text(self, future, label, page=1):
+        """Result of one OCR task; empty text if it failed or timed out."""
+        try:
+            return future.result() or ''
+        except BrokenProcessPool:
+            logger.error('OCR worker pool broke while processing %s page %d', label, page)
+            self._reset()
+        except Exception as e:
+            logger.warning('OCR failed for %s page %d: %s', label, page, e)
+        return ''
+
+    def _collect(self, futures, label):
+        return [self.text(future, label, i) for i, future in enumerate(futures, start=1)]
+
+    def submit_pdf_page(self, file_path, page_number, dpi=OCR_DPI):
+        """Queue OCR of one 1-based PDF page; returns a future for self.text()."""
+        import pytesseract
+
+        return self.submit(_ocr_pdf_page, file_path, page_number, dpi, self.page_timeout,
+                           pytesseract.pytesseract.tesseract_cmd)
+
+    def ocr_pdf(self, file_path, dpi=OCR_DPI, pages=None):
+        """OCR text of a scanned PDF, pages joined in order.
+
+        pages limits the work to the given 1-based page numbers; by default every page is read.
+        """
+        if pages is None:
+            with open_pdf(file_path) as pdf:
+                pages = range(1, pdf.page_count + 1)
+        futures = [self.submit_pdf_page(file_path, n, dpi) for n in pages]
+        return '\n'.join(self._collect(futures, file_path))
+
+    def ocr_image(self, file_path, profile=None):
+        """OCR text of an image file; profile selects image_preprocess settings (None: raw image)."""
+        import pytesseract
+
+        future = self.submit(_ocr_image_file, file_path, self.page_timeout,
+                             pytesseract.pytesseract.tesseract_cmd, profile)
+        return self._collect([future], file_path)[0]
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+ocr_engine = OCREngine()
+atexit.register(ocr_engine.shutdown)
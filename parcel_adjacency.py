@@ -0,0 +1,169 @@
+"""
+parcel_adjacency.py
+
+Persisted adjacency graph over registered parcels, for boundary-dispute analysis.
+
+Design:
+- an edge links two parcels whose boundaries overlap, touch, or come within
+  ADJACENCY_TOLERANCE_M metres of each other; it records the relation, the gap and the
+  length of shared boundary, all measured in geometry_metrics.METRIC_SRID
+- every pair is stored in both directions in parcel_adjacency, so neighbours(parcel_id)
+  is a single indexed lookup that returns exactly the parcel's degree in rows
+- build_adjacency() rebuilds the whole graph with one STRtree 'dwithin' query over the
+  projected parcels; update_parcel_adjacency(parcels) refreshes only the edges of
+  newly added or edited parcels, using the shared parcel_index for candidates
+- scripts/build_parcel_adjacency.py creates the table and runs the bulk build
+"""
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from sqlalchemy import delete, insert, or_, select
+
+from geometry_metrics import to_metric
+from models import db, LandParcel, ParcelAdjacency
+from spatial_index import parcel_index
+
+logger = logging.getLogger(__name__)
+
+# Parcels whose boundaries are closer than this (metres) are recorded as neighbours.
+ADJACENCY_TOLERANCE_M = float(os.environ.get('ADJACENCY_TOLERANCE_M', '2.0'))
+
+# Rows per INSERT statement during a bulk build.
+INSERT_CHUNK_SIZE = 5000
+
+# Metres per degree of latitude, used to widen index lookups done in EPSG:4326.
+_M_PER_DEG = 111320.0
+
+
+def _edge_metrics(a, b, tolerance_m):
+    """Relation, gap and shared boundary length for parallel arrays of projected geometries.
+
+    The shared boundary is the part of a's boundary lying within tolerance_m of b's, so
+    edges that were digitized separately (or drift apart in reprojection) still count.
+    """
+    gap = shapely.distance(a, b)
+    near_b = shapely.buffer(shapely.boundary(b), tolerance_m, quad_segs=2)
+    shared = shapely.length(shapely.intersection(shapely.boundary(a), near_b))
+    # interiors intersect -> the parcels overlap rather than merely touch
+    overlapping = shapely.relate_pattern(a, b, 'T********')
+    relation = np.where(overlapping, 'overlaps', np.where(gap <= 0, 'touches', 'near'))
+    return relation, gap, shared
+
+
+def _edge_rows(left_ids, right_ids, relation, gap, shared, now):
+    """Both directions of every edge, as parameter dicts for insert(ParcelAdjacency)."""
+    rows = []
+    for a, b, rel, g, s in zip(left_ids.tolist(), right_ids.tolist(), relation.tolist(),
+                               gap.tolist(), shared.tolist()):
+        rows.append({'parcel_id': a, 'neighbour_id': b, 'relation': rel,
+                     'gap_m': g, 'shared_edge_m': s, 'updated_at': now})
+        rows.append({'parcel_id': b, 'neighbour_id': a, 'relation': rel,
+                     'gap_m': g, 'shared_edge_m': s, 'updated_at': now})
+    return rows
+
+
+def _insert_rows(rows):
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(insert(ParcelAdjacency), rows[start:start + INSERT_CHUNK_SIZE])
+
+
+def build_adjacency(tolerance_m=ADJACENCY_TOLERANCE_M):
+    """Rebuild the whole adjacency graph. Returns the number of neighbouring pairs."""
+    rows = db.session.execute(
+        select(LandParcel.id, LandParcel.coordinates).where(LandParcel.coordinates.isnot(None))
+    ).all()
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    geoms = to_metric(shapely.from_wkb([bytes(r[1].data) for r in rows])) if rows else np.empty(0, dtype=object)
+
+    left = right = np.empty(0, dtype=np.intp)
+    if len(geoms):
+        tree = STRtree(geoms)
+        left, right = tree.query(geoms, predicate='dwithin', distance=tolerance_m)
+        keep = left < right  # drop self matches and the mirrored copy of each pair
+        left, right = left[keep], right[keep]
+    relation, gap, shared = _edge_metrics(geoms[left], geoms[right], tolerance_m)
+
+    db.session.execute(delete(ParcelAdjacency))
+    _insert_rows(_edge_rows(ids[left], ids[right], relation, gap, shared, datetime.utcnow()))
+    db.session.commit()
+    logger.info('Built parcel adjacency graph: %d parcels, %d neighbouring pairs', len(ids), len(left))
+    return len(left)
+
+
+def update_parcel_adjacency(parcels, tolerance_m=ADJACENCY_TOLERANCE_M):
+    """Recompute the edges of the given (already committed) parcels and commit.
+
+    Call after parcels are inserted or their geometry changes; parcel_index must already
+    know about them (parcel_index.add_parcels). Returns the number of pairs written.
+    """
+    parcels = [p for p in parcels if p.id is not None and p.coordinates is not None]
+    if not parcels:
+        return 0
+    parcel_ids = np.array([p.id for p in parcels], dtype=np.int64)
+    geoms = shapely.from_wkb([bytes(p.coordinates.data) for p in parcels])
+
+    # The shared index works in degrees: widen each parcel by the tolerance (generously,
+    # using the longitude scale at its latitude) and let the metric test below decide.
+    lat = np.abs(shapely.get_y(shapely.centroid(geoms)))
+    widen = tolerance_m / (_M_PER_DEG * np.maximum(np.cos(np.radians(lat)), 0.1))
+    probes = shapely.buffer(shapely.envelope(geoms), widen, join_style='mitre')
+    src_idx, cand_ids, cand_geoms = parcel_index.query_many(probes)
+    keep = cand_ids != parcel_ids[src_idx]
+    src_idx, cand_ids, cand_geoms = src_idx[keep], cand_ids[keep], cand_geoms[keep]
+
+    a = to_metric(geoms[src_idx])
+    b = to_metric(cand_geoms)
+    close = shapely.dwithin(a, b, tolerance_m)
+    src_idx, cand_ids, a, b = src_idx[close], cand_ids[close], a[close], b[close]
+    relation, gap, shared = _edge_metrics(a, b, tolerance_m)
+
+    id_list = parcel_ids.tolist()
+    db.session.execute(
+        delete(ParcelAdjacency).where(
+            or_(ParcelAdjacency.parcel_id.in_(id_list), ParcelAdjacency.neighbour_id.in_(id_list))
+        )
+    )
+    # Two updated parcels next to each other are found from both sides; keep one copy.
+    left, right = parcel_ids[src_idx], cand_ids
+    both_new = np.isin(right, parcel_ids)
+    keep = ~both_new | (left < right)
+    _insert_rows(_edge_rows(left[keep], right[keep], relation[keep], gap[keep], shared[keep], datetime.utcnow()))
+    db.session.commit()
+    return int(keep.sum())
+
+
+def neighbours(parcel_id):
+    """Neighbouring parcels of one parcel, closest relations first."""
+    return neighbours_many([parcel_id]).get(parcel_id, [])
+
+
+def neighbours_many(parcel_ids):
+    """{parcel_id: [neighbour dict, ...]} for several parcels in one query.
+
+    Each neighbour dict has parcel_id, parcel_number, owner_name, relation, gap_m and
+    shared_edge_m, ordered by shared boundary length then gap.
+    """
+    result = {pid: [] for pid in parcel_ids}
+    if not parcel_ids:
+        return result
+    edges = (
+        ParcelAdjacency.query
+        .filter(ParcelAdjacency.parcel_id.in_(list(parcel_ids)))
+        .order_by(ParcelAdjacency.shared_edge_m.desc(), ParcelAdjacency.gap_m.asc())
+        .all()
+    )
+    for e in edges:
+        n = e.neighbour
+        result[e.parcel_id].append({
+            'parcel_id': e.neighbour_id,
+            'parcel_number': n.parcel_number if n else None,
+            'owner_name': n.owner_name if n else None,
+            'relation': e.relation,
+            'gap_m': e.gap_m,
+            'shared_edge_m': e.shared_edge_m,
+        })
+    return result
@@ -0,0 +1,144 @@
+"""
+reanalysis.py
+
+Change-aware (re-)analysis of an application: only detectors whose inputs changed run.
+
+Design:
+- each detector declares the application inputs it reads and the conflict types it
+  produces (DETECTORS); fingerprints of those inputs (geometry WKB hash, identifier set,
+  location text, document hashes) are stored per detector in
+  LandApplication.analysis_fingerprints after the detector succeeds
+- reanalyze_application(app_id) recomputes the fingerprints, and for every detector
+  whose inputs differ from the stored ones it deletes that detector's unresolved AI
+  conflicts and runs it again; the other detectors are skipped and their conflicts are
+  carried forward untouched
+- afterwards status and ai_conflict_score are derived from all unresolved conflicts,
+  so a skipped detector's findings still count
+- force=True reruns everything (for example after other applications changed)
+"""
+import hashlib
+import json
+import logging
+
+from ai_conflict import detect_conflicts
+from ai_conflict_enhanced import detect_conflicts_from_documents
+from duplicate_detector import detect_all_duplicates
+from models import db, LandApplication, LandConflict, Document
+
+logger = logging.getLogger(__name__)
+
+# name -> (fingerprinted inputs, conflict types it owns, detector function)
+DETECTORS = {
+    'parcel': (
+        ('geometry', 'identifiers', 'location'),
+        ('spatial_overlap', 'owner_duplicate', 'location_match'),
+        detect_conflicts,
+    ),
+    'documents': (
+        ('documents',),
+        ('document_duplicate',),
+        detect_conflicts_from_documents,
+    ),
+    'duplicates': (
+        ('documents', 'identifiers'),
+        ('document_duplicate', 'content_duplicate', 'identity_duplicate'),
+        detect_all_duplicates,
+    ),
+}
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def input_fingerprints(application):
+    """Fingerprint of every analyzed input of an application."""
+    wkb = bytes(application.coordinates.data) if application.coordinates is not None else b''
+    identifiers = sorted(
+        (v or '').strip().upper() for v in (application.nrc_number, application.tpin_number)
+    )
+    documents = sorted(
+        d.file_hash or f'id:{d.id}'
+        for d in Document.query.filter_by(application_id=application.id).all()
+    )
+    return {
+        'geometry': hashlib.sha256(wkb).hexdigest()[:16],
+        'identifiers': _digest(identifiers),
+        'location': _digest((application.land_location or '').strip().lower()),
+        'documents': _digest(documents),
+    }
+
+
+def changed_detectors(application, fingerprints=None):
+    """Names of detectors whose inputs differ from the fingerprints stored at their last run."""
+    fingerprints = fingerprints or input_fingerprints(application)
+    stored = application.analysis_fingerprints or {}
+    changed = []
+    for name, (inputs, _, _) in DETECTORS.items():
+        current = {key: fingerprints[key] for key in inputs}
+        if stored.get(name) != current:
+            changed.append(name)
+    return changed
+
+
+def _refresh_status(application):
+    """Derive conflict status and score from every unresolved conflict of the application."""
+    open_conflicts = LandConflict.query.filter_by(application_id=application.id, status='unresolved').all()
+    scores = [c.confidence_score for c in open_conflicts if c.confidence_score is not None]
+    application.ai_conflict_score = max(scores) if scores else 0.0
+    application.ai_processed = True
+    if open_conflicts and application.status in ('pending', 'under_review', 'conflict'):
+        application.status = 'conflict'
+    elif not open_conflicts and application.status == 'conflict':
+        application.status = 'pending'
+
+
+def reanalyze_application(application_id, force=False):
+    """Run the detectors whose inputs changed since their last run.
+
+    Returns {'ran': [...], 'skipped': [...], 'created': {detector: count}}.
+    """
+    summary = {'ran': [], 'skipped': [], 'created': {}}
+    application = db.session.get(LandApplication, application_id)
+    if application is None:
+        return summary
+
+    fingerprints = input_fingerprints(application)
+    to_run = list(DETECTORS) if force else changed_detectors(application, fingerprints)
+    summary['skipped'] = [name for name in DETECTORS if name not in to_run]
+
+    # Conflicts of detectors about to run are stale; a type shared by two detectors is
+    # only dropped when both of them rerun, since either may have produced it.
+    stale_types = set()
+    for name in to_run:
+        stale_types.update(DETECTORS[name][1])
+    for name in summary['skipped']:
+        stale_types.difference_update(DETECTORS[name][1])
+    if stale_types:
+        LandConflict.query.filter(
+            LandConflict.application_id == application_id,
+            LandConflict.status == 'unresolved',
+            LandConflict.detected_by_ai.is_(True),
+            LandConflict.conflict_type.in_(stale_types),
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    stored = dict(application.analysis_fingerprints or {})
+    for name in to_run:
+        inputs, _, detector = DETECTORS[name]
+        try:
+            created = detector(application_id)
+        except Exception:
+            logger.exception('Detector %s failed for application %s', name, application_id)
+            db.session.rollback()
+            continue
+        summary['ran'].append(name)
+        summary['created'][name] = len(created or [])
+        stored[name] = {key: fingerprints[key] for key in inputs}
+
+    application = db.session.get(LandApplication, application_id)
+    application.analysis_fingerprints = stored
+    _refresh_status(application)
+    db.session.commit()
+    logger.info('Re-analysis of application %s ran %s, skipped %s', application_id, summary['ran'], summary['skipped'])
+    return summary
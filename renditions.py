@@ -0,0 +1,148 @@
+"""
+renditions.py
+
+Small image renditions of uploaded documents (first-page thumbnail and a low-resolution
+preview) so review pages do not download the original upload.
+
+Design:
+- get_rendition(doc, kind, fmt) returns the path of a cached rendition, generating it on
+  a miss; RENDITIONS gives each kind's longest side in pixels
+- renditions are content-addressed: RENDITION_CACHE_DIR/<hash[:2]>/<file_hash>-<kind>.<fmt>,
+  so identical uploads share files, nothing ever needs invalidating and responses can be
+  cached by the browser indefinitely
+- PDFs render only their first page with PyMuPDF, at just the resolution the rendition
+  needs; images are EXIF-rotated and downscaled with Pillow; other files have no rendition
+- WebP is used when the browser accepts it and Pillow supports it, PNG otherwise
+- register_land's background thread calls generate_renditions() for new uploads; anything
+  missed is generated on first request
+"""
+import logging
+import os
+import tempfile
+
+from PIL import Image, ImageOps, features
+
+from document_processing import IMAGE_MIME_TYPES, PDF_MIME_TYPES
+from ocr_engine import open_pdf
+from text_cache import document_hash
+
+logger = logging.getLogger(__name__)
+
+RENDITION_CACHE_DIR = os.environ.get('RENDITION_CACHE_DIR', os.path.join(os.getcwd(), 'rendition_cache'))
+
+# kind -> longest side in pixels
+RENDITIONS = {
+    'thumb': 320,
+    'preview': 1280,
+}
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+WEBP_SUPPORTED = features.check('webp')
+
+
+def choose_format(accept_header):
+    """'webp' when the client accepts it and Pillow can write it, else 'png'."""
+    if WEBP_SUPPORTED and 'image/webp' in (accept_header or ''):
+        return 'webp'
+    return 'png'
+
+
+def mime_type(fmt):
+    return FORMATS[fmt][1]
+
+
+def _is_pdf(doc):
+    return doc.mime_type in PDF_MIME_TYPES or doc.file_path.lower().endswith('.pdf')
+
+
+def _is_image(doc):
+    return doc.mime_type in IMAGE_MIME_TYPES or doc.file_path.lower().endswith(('.jpg', '.jpeg', '.png'))
+
+
+def supports_rendition(doc):
+    return _is_pdf(doc) or _is_image(doc)
+
+
+def _cache_path(file_hash, kind, fmt):
+    return os.path.join(RENDITION_CACHE_DIR, file_hash[:2], f'{file_hash}-{kind}.{fmt}')
+
+
+def _render_pdf(path, size):
+    with open_pdf(path) as pdf:
+        if pdf.page_count == 0:
+            return None
+        page = pdf[0]
+        zoom = size / max(page.rect.width, page.rect.height, 1)
+        pix = page.get_pixmap(matrix=(zoom, 0, 0, zoom, 0, 0), alpha=False)
+    return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+
+
+def _render_image(path, size):
+    with Image.open(path) as img:
+        # draft() lets the JPEG decoder skip most of the full-resolution pixels
+        img.draft('RGB', (size, size))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        return img.convert('RGB')
+
+
+def render(doc, kind):
+    """PIL image of a document rendition, or None for unsupported files."""
+    size = RENDITIONS[kind]
+    if _is_pdf(doc):
+        img = _render_pdf(doc.file_path, size)
+    elif _is_image(doc):
+        img = _render_image(doc.file_path, size)
+    else:
+        return None
+    if img is not None and max(img.size) > size:
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return img
+
+
+def get_rendition(doc, kind, fmt='png'):
+    """Path of the cached rendition, generated on a miss; None when there is none."""
+    if kind not in RENDITIONS or fmt not in FORMATS or not supports_rendition(doc):
+        return None
+    file_hash = document_hash(doc)
+    if file_hash is None:
+        return None
+    path = _cache_path(file_hash, kind, fmt)
+    if os.path.exists(path):
+        return path
+
+    img = render(doc, kind)
+    if img is None:
+        return None
+    pil_format, _, options = FORMATS[fmt]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write-then-rename so a concurrent reader never sees a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            img.save(fh, pil_format, **options)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+def generate_renditions(docs, formats=None):
+    """Pre-generate every rendition kind for a batch of Documents; returns the number created or found."""
+    formats = formats or (['webp', 'png'] if WEBP_SUPPORTED else ['png'])
+    count = 0
+    for doc in docs:
+        if not supports_rendition(doc):
+            continue
+        for kind in RENDITIONS:
+            for fmt in formats:
+                try:
+                    if get_rendition(doc, kind, fmt):
+                        count += 1
+                except Exception:
+                    logger.exception('Failed to render %s of document %s', kind, doc.id)
+    return count
@@ -0,0 +1,54 @@
+"""
+Run this script to add the `analysis_fingerprints` JSON column to `land_applications` if it doesn't exist.
+Usage (from repository root, with your venv active):
+    python scripts/add_analysis_fingerprints_column.py
+
+Existing applications start without fingerprints, so the first re-analysis of each one runs every
+detector (see reanalysis.py); later edits only rerun the detectors whose inputs changed.
+Safe to run more than once.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import sys
+
+from flask import Flask
+from sqlalchemy import inspect, text
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from models import db
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+
+def add_column(table='land_applications', column='analysis_fingerprints'):
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if column in columns:
+        print(f'{table}.{column} already exists')
+        return
+    with db.engine.begin() as conn:
+        print(f'Adding {table}.{column}')
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} JSON'))
+
+
+if __name__ == '__main__':
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        try:
+            add_column()
+        except Exception as e:
+            print('Error adding analysis_fingerprints column:', e)
+            raise
@@ -0,0 +1,93 @@
+"""
+Run this script to add the `cell_key` and `cell_key_coarse` quadkey columns to `land_parcels` and `land_applications`
+if they don't exist, index them, and fill them in for existing rows.
+Usage (from repository root, with your venv active):
+    python scripts/add_cell_key_columns.py
+
+The app keeps the cell keys current for rows it writes (see spatial_cells.py); this backfills rows
+created before the column existed. Rows left without a key are still found by spatial checks,
+they just are not prefiltered. Safe to run more than once.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import sys
+
+import shapely
+from flask import Flask
+from sqlalchemy import inspect, text, update
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from models import db, LandApplication, LandParcel
+from spatial_cells import cell_keys_for
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+BATCH_SIZE = 2000
+
+
+def add_columns(table):
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    with db.engine.begin() as conn:
+        for column in ('cell_key', 'cell_key_coarse'):
+            if column not in columns:
+                print(f'Adding {table}.{column}')
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} VARCHAR(24)'))
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})'))
+
+
+def backfill(model):
+    filled = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(model.id, model.coordinates)
+            .where(model.id > last_id)
+            .where(model.cell_key.is_(None))
+            .where(model.cell_key_coarse.is_(None))
+            .where(model.coordinates.isnot(None))
+            .order_by(model.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        geoms = shapely.from_wkb([bytes(r[1].data) for r in rows])
+        params = []
+        for r, g in zip(rows, geoms):
+            fine, coarse = cell_keys_for(g)
+            params.append({'row_id': r[0], 'fine': fine, 'coarse': coarse})
+        db.session.execute(
+            update(model.__table__)
+            .where(model.__table__.c.id == db.bindparam('row_id'))
+            .values(cell_key=db.bindparam('fine'), cell_key_coarse=db.bindparam('coarse')),
+            params
+        )
+        db.session.commit()
+        filled += len(rows)
+        last_id = rows[-1][0]
+    print(f'Backfilled cell keys for {filled} rows of {model.__tablename__}')
+
+
+if __name__ == '__main__':
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        try:
+            for model in (LandParcel, LandApplication):
+                add_columns(model.__tablename__)
+                backfill(model)
+        except Exception as e:
+            print('Error adding cell_key columns:', e)
+            raise
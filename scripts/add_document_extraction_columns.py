@@ -0,0 +1,100 @@
+"""
+Run this script to add the upload-time extraction columns (`extraction_status`, `text_length`, `page_count`,
+`extracted_identifiers`, `extracted_at`) to `documents` if they don't exist, and optionally fill them in for
+documents uploaded before the columns existed.
+Usage (from repository root, with your venv active):
+    python scripts/add_document_extraction_columns.py [--backfill] [--retry-failed]
+
+New uploads are extracted by the app in the background (see document_extraction.py). --backfill extracts
+every document still pending; --retry-failed also retries documents whose extraction failed or found no
+text (e.g. because tesseract was missing when they were uploaded). Detection
+works without the backfill, it just reads those files itself. Safe to run more than once.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+from sqlalchemy import inspect, or_, text
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from document_extraction import extract_documents
+from models import db, Document, ExtractedText
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+COLUMNS = {
+    'extraction_status': "VARCHAR(20) DEFAULT 'pending'",
+    'text_length': 'INTEGER',
+    'page_count': 'INTEGER',
+    'extracted_identifiers': 'JSON',
+    'extracted_at': 'TIMESTAMP',
+}
+BATCH_SIZE = 100
+
+
+def add_columns(table='documents'):
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    with db.engine.begin() as conn:
+        for column, column_type in COLUMNS.items():
+            if column not in columns:
+                print(f'Adding {table}.{column}')
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}'))
+        conn.execute(text(f"UPDATE {table} SET extraction_status = 'pending' WHERE extraction_status IS NULL"))
+    # the extraction stage stores text through the text cache
+    ExtractedText.__table__.create(db.engine, checkfirst=True)
+
+
+def backfill(retry_failed=False):
+    statuses = ['pending', 'failed', 'empty'] if retry_failed else ['pending']
+    started = time.perf_counter()
+    total = 0
+    last_id = 0
+    while True:
+        docs = (
+            Document.query.filter(Document.id > last_id)
+            .filter(or_(Document.extraction_status.in_(statuses), Document.extraction_status.is_(None)))
+            .order_by(Document.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not docs:
+            break
+        counts = extract_documents(docs)
+        total += len(docs)
+        last_id = docs[-1].id
+        print(f'{total} documents extracted ({time.perf_counter() - started:.1f}s): {dict(counts)}')
+    print(f'Backfill finished: {total} documents')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--backfill', action='store_true', help='Extract documents that are still pending')
+    p.add_argument('--retry-failed', action='store_true', help='With --backfill, also retry failed and empty extractions')
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        try:
+            add_columns()
+            if args.backfill:
+                backfill(args.retry_failed)
+        except Exception as e:
+            print('Error adding document extraction columns:', e)
+            raise
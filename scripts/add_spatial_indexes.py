@@ -0,0 +1,55 @@
+"""
+Run this script to add GiST indexes on the parcel and application geometry columns if they don't exist.
+Usage (from repository root, with your venv active):
+    python scripts/add_spatial_indexes.py
+
+The SQL-side overlap query in spatial_index.py relies on these indexes so that ST_Intersects
+only looks at parcels whose bounding boxes overlap. GeoAlchemy2 creates indexes with the same
+names when tables are made through db.create_all(), so running this on such a database is a no-op.
+Requires PostgreSQL with the PostGIS extension.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import sys
+
+from flask import Flask
+from sqlalchemy import text
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from models import db
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_land_parcels_coordinates ON land_parcels USING GIST (coordinates);",
+    "CREATE INDEX IF NOT EXISTS idx_land_applications_coordinates ON land_applications USING GIST (coordinates);",
+    "ANALYZE land_parcels;",
+    "ANALYZE land_applications;",
+]
+
+if __name__ == '__main__':
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                for stmt in INDEX_SQL:
+                    print('Running:', stmt)
+                    conn.execute(text(stmt))
+            print('Spatial indexes are in place.')
+        except Exception as e:
+            print('Error creating spatial indexes:', e)
+            raise
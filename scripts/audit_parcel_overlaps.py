@@ -0,0 +1,282 @@
+"""
+Registry-wide audit: find every pair of registered parcels whose geometries overlap.
+
+Usage (from repository root, with your venv active):
+    python scripts/audit_parcel_overlaps.py [--out overlaps.csv] [--format csv|json]
+        [--tile-deg 0.02] [--workers N] [--min-overlap-m2 1.0] [--create-conflicts]
+
+How it works:
+- parcels are streamed out of land_parcels and bucketed into a grid of square tiles
+  (--tile-deg degrees); a parcel whose bounding box crosses a tile border is put in every
+  tile it touches
+- each tile is an STRtree self-join run in a ProcessPoolExecutor worker (one per core by
+  default); overlap areas are computed in square metres with geometry_metrics
+- a pair that sits in several tiles is only reported by the tile holding the lower-left
+  corner of the intersection of the two bounding boxes, so no global de-duplication is
+  needed and rows can be written as soon as each tile finishes
+- --create-conflicts also records each overlapping pair as a LandConflict
+  (conflict_type 'registry_overlap') as the tiles finish, INSERT_CHUNK_SIZE pairs at a
+  time, skipping (application, conflicting parcel) pairs that already have one
+
+Pairs that only touch, or overlap by less than --min-overlap-m2, are not reported.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import shapely
+from flask import Flask
+from sqlalchemy import insert, select
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from geometry_metrics import areas_m2, intersection_areas_m2
+from models import db, LandParcel, LandConflict
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+FIELDS = ['parcel_a_id', 'parcel_b_id', 'overlap_m2', 'parcel_a_m2', 'parcel_b_m2', 'pct_of_a', 'pct_of_b']
+
+FETCH_SIZE = 10000
+INSERT_CHUNK_SIZE = 1000
+
+
+def load_parcels():
+    """(ids, wkbs) for every parcel with a geometry, fetched in batches."""
+    ids, wkbs = [], []
+    stmt = (
+        select(LandParcel.id, LandParcel.coordinates)
+        .where(LandParcel.coordinates.isnot(None))
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    for pid, coords in db.session.execute(stmt):
+        ids.append(pid)
+        wkbs.append(bytes(coords.data))
+    return np.array(ids, dtype=np.int64), wkbs
+
+
+def partition(bounds, tile_deg):
+    """{(tx, ty): array of row indices} with each row in every tile its bbox touches."""
+    tx0 = np.floor(bounds[:, 0] / tile_deg).astype(np.int64)
+    ty0 = np.floor(bounds[:, 1] / tile_deg).astype(np.int64)
+    tx1 = np.floor(bounds[:, 2] / tile_deg).astype(np.int64)
+    ty1 = np.floor(bounds[:, 3] / tile_deg).astype(np.int64)
+
+    tiles = {}
+    single = (tx0 == tx1) & (ty0 == ty1)
+    rows = np.nonzero(single)[0]
+    keys = np.stack([tx0[rows], ty0[rows]], axis=1)
+    if len(rows):
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        splits = np.cumsum(np.bincount(inverse.ravel(), minlength=len(uniq)))[:-1]
+        for (tx, ty), members in zip(uniq.tolist(), np.split(rows[order], splits)):
+            tiles[(tx, ty)] = [members]
+    for i in np.nonzero(~single)[0].tolist():
+        for tx in range(tx0[i], tx1[i] + 1):
+            for ty in range(ty0[i], ty1[i] + 1):
+                tiles.setdefault((tx, ty), []).append(np.array([i]))
+    return {key: np.concatenate(parts) for key, parts in tiles.items()}
+
+
+def audit_tile(tile, ids, wkbs, tile_deg, min_overlap_m2):
+    """STRtree self-join for one tile. Runs in a worker process; returns report rows."""
+    geoms = shapely.from_wkb(wkbs)
+    tree = shapely.STRtree(geoms)
+    left, right = tree.query(geoms, predicate='intersects')
+    keep = left < right
+    left, right = left[keep], right[keep]
+    if not len(left):
+        return []
+
+    # report the pair only from the tile holding the lower-left corner of the bbox intersection
+    bounds = shapely.bounds(geoms)
+    rx = np.maximum(bounds[left, 0], bounds[right, 0])
+    ry = np.maximum(bounds[left, 1], bounds[right, 1])
+    own = (np.floor(rx / tile_deg) == tile[0]) & (np.floor(ry / tile_deg) == tile[1])
+    left, right = left[own], right[own]
+    if not len(left):
+        return []
+
+    overlap = intersection_areas_m2(geoms[left], geoms[right])
+    hit = overlap >= min_overlap_m2  # also drops NaN from invalid pairs
+    left, right, overlap = left[hit], right[hit], overlap[hit]
+    # stable orientation across tiles: parcel_a_id < parcel_b_id
+    swap = ids[left] > ids[right]
+    left, right = np.where(swap, right, left), np.where(swap, left, right)
+    area = areas_m2(geoms)
+
+    rows = []
+    for a, b, inter in zip(left.tolist(), right.tolist(), overlap.tolist()):
+        area_a, area_b = float(area[a]), float(area[b])
+        rows.append({
+            'parcel_a_id': int(ids[a]),
+            'parcel_b_id': int(ids[b]),
+            'overlap_m2': round(inter, 2),
+            'parcel_a_m2': round(area_a, 2),
+            'parcel_b_m2': round(area_b, 2),
+            'pct_of_a': round(inter / area_a * 100, 2) if area_a > 0 else None,
+            'pct_of_b': round(inter / area_b * 100, 2) if area_b > 0 else None,
+        })
+    return rows
+
+
+def audit_geometries(ids, wkbs, tile_deg, workers=None, min_overlap_m2=1.0):
+    """Yield report rows for all overlapping pairs, tile by tile as workers finish."""
+    if not len(ids):
+        return
+    bounds = shapely.bounds(shapely.from_wkb(wkbs))
+    tiles = partition(bounds, tile_deg)
+    print(f'{len(ids)} parcels in {len(tiles)} tiles of {tile_deg} degrees')
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(audit_tile, tile, ids[members], [wkbs[i] for i in members.tolist()],
+                        tile_deg, min_overlap_m2)
+            for tile, members in tiles.items()
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+class ReportWriter:
+    """Streams rows to CSV, or to a JSON array written element by element."""
+
+    def __init__(self, fh, fmt):
+        self.fh = fh
+        self.fmt = fmt
+        self.count = 0
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(fh, fieldnames=FIELDS)
+            self.writer.writeheader()
+        else:
+            fh.write('[\n')
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.fh.write((',\n' if self.count else '') + json.dumps(row))
+        self.count += 1
+
+    def close(self):
+        if self.fmt == 'json':
+            self.fh.write('\n]\n')
+
+
+class ConflictRecorder:
+    """Records overlapping pairs as LandConflict rows, INSERT_CHUNK_SIZE report rows at a time.
+
+    A pair is skipped when a registry_overlap conflict with the same (application_id,
+    conflicting_parcel_id) already exists, including one inserted earlier in this run.
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= INSERT_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+        parcel_ids = {r['parcel_a_id'] for r in rows} | {r['parcel_b_id'] for r in rows}
+        parcels = {p.id: p for p in LandParcel.query.filter(LandParcel.id.in_(parcel_ids))}
+        seen = set(db.session.execute(
+            select(LandConflict.application_id, LandConflict.conflicting_parcel_id)
+            .where(LandConflict.conflict_type == 'registry_overlap')
+            .where(LandConflict.conflicting_parcel_id.in_({r['parcel_b_id'] for r in rows}))
+        ).all())
+
+        now = datetime.utcnow()
+        values = []
+        for r in rows:
+            a, b = parcels.get(r['parcel_a_id']), parcels.get(r['parcel_b_id'])
+            if a is None or b is None or (a.application_id, b.id) in seen:
+                continue
+            seen.add((a.application_id, b.id))
+            pct = max(p for p in (r['pct_of_a'], r['pct_of_b'], 0.0) if p is not None)
+            values.append({
+                'application_id': a.application_id,
+                'conflicting_parcel_id': b.id,
+                'title': f'Registered parcels overlap: {a.parcel_number} / {b.parcel_number}',
+                'description': (
+                    f"Registry audit: parcel {a.parcel_number} ({a.owner_name or 'Unknown'}) and parcel "
+                    f"{b.parcel_number} ({b.owner_name or 'Unknown'}) overlap by {r['overlap_m2']:,.0f} m² "
+                    f"({r['pct_of_a'] or 0:.1f}% of {a.parcel_number}, {r['pct_of_b'] or 0:.1f}% of {b.parcel_number})."
+                ),
+                'conflict_type': 'registry_overlap',
+                'severity': 'high' if pct >= 10 else 'medium',
+                'overlap_percentage': pct / 100,
+                'confidence_score': 0.95,
+                'detected_by_ai': True,
+                'status': 'unresolved',
+                'created_at': now,
+            })
+        if values:
+            db.session.execute(insert(LandConflict), values)
+        db.session.commit()
+        self.count += len(values)
+
+    def close(self):
+        self.flush()
+
+
+def main(out, fmt, tile_deg, workers, min_overlap_m2, record_conflicts):
+    started = time.perf_counter()
+    ids, wkbs = load_parcels()
+    print(f'Loaded {len(ids)} parcels in {time.perf_counter() - started:.1f}s')
+
+    recorder = ConflictRecorder() if record_conflicts else None
+    with open(out, 'w', newline='', encoding='utf-8') as fh:
+        writer = ReportWriter(fh, fmt)
+        for row in audit_geometries(ids, wkbs, tile_deg, workers, min_overlap_m2):
+            writer.write(row)
+            if recorder is not None:
+                recorder.add(row)
+        writer.close()
+    if recorder is not None:
+        recorder.close()
+    print(f'Found {writer.count} overlapping pairs in {time.perf_counter() - started:.1f}s, report: {out}')
+
+    if recorder is not None:
+        print(f'Created {recorder.count} LandConflict rows')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--out', default=None, help='Report path (default parcel_overlaps.<format>)')
+    p.add_argument('--format', choices=['csv', 'json'], default='csv')
+    p.add_argument('--tile-deg', type=float, default=0.02, help='Tile size in degrees (~2.2 km)')
+    p.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    p.add_argument('--min-overlap-m2', type=float, default=1.0, help='Ignore overlaps smaller than this')
+    p.add_argument('--create-conflicts', action='store_true', help='Also record pairs as LandConflict rows')
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        main(args.out or f'parcel_overlaps.{args.format}', args.format, args.tile_deg, args.workers,
+             args.min_overlap_m2, args.create_conflicts)
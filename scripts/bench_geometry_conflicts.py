@@ -0,0 +1,183 @@
+"""Benchmark the live overlap check used by /api/geometry_conflicts.
+
+Times spatial_index live_parcel_overlaps for random polygons the size of a drawn plot,
+including JSON serialization of the response body, on either path used without PostGIS:
+
+- --backend cells (the default path): the cell_key prefilter against the land_parcels
+  table of DATABASE_URL, read-only. Probes are drawn around randomly chosen existing
+  parcels; --parcels is ignored
+- --backend strtree: a synthetic registry of --parcels parcels around Ndola in an
+  in-process STRtree (no database needed); the path used with SPATIAL_BACKEND=strtree
+
+The endpoint adds one primary-key lookup for parcel numbers/owners on top of this.
+
+Usage:
+  python scripts/bench_geometry_conflicts.py [--backend cells|strtree] [--parcels 100000]
+      [--queries 1000] [--target-ms 50]
+
+Exits with status 1 when the p95 latency is above --target-ms.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import shapely
+from dotenv import load_dotenv
+from flask import Flask
+from sqlalchemy import func, select
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import spatial_index
+from models import db, LandParcel
+from spatial_index import (
+    ParcelSpatialIndex, _live_overlaps_cells, _live_overlaps_strtree, LIVE_MAX_RESULTS, LIVE_SIMPLIFY_TOLERANCE,
+)
+
+# Probes are centred on this many randomly chosen parcels for --backend cells.
+SAMPLE_PARCELS = 2000
+
+# Ndola town centre
+CENTER_LON, CENTER_LAT = 28.6369, -12.9714
+# ~33 m plots on a ~35 m pitch
+PLOT_DEG = 0.0003
+PITCH_DEG = 0.00032
+
+
+def make_parcels(n, rng):
+    """Jittered grid of small, slightly irregular quadrilaterals."""
+    side = int(np.ceil(np.sqrt(n)))
+    ix, iy = np.divmod(np.arange(n), side)
+    x0 = CENTER_LON - side * PITCH_DEG / 2 + ix * PITCH_DEG + rng.uniform(0, 0.00004, n)
+    y0 = CENTER_LAT - side * PITCH_DEG / 2 + iy * PITCH_DEG + rng.uniform(0, 0.00004, n)
+    w = PLOT_DEG * rng.uniform(0.8, 1.2, n)
+    h = PLOT_DEG * rng.uniform(0.8, 1.2, n)
+    skew = rng.uniform(-0.00003, 0.00003, n)
+    coords = np.stack([
+        np.stack([x0, y0], axis=1),
+        np.stack([x0 + w, y0 + skew], axis=1),
+        np.stack([x0 + w + skew, y0 + h], axis=1),
+        np.stack([x0, y0 + h], axis=1),
+        np.stack([x0, y0], axis=1),
+    ], axis=1)
+    return shapely.polygons(coords)
+
+
+def make_queries(cx, cy, rng):
+    """Random drawn plots centred on (cx, cy): rotated rectangles between ~20 m and ~150 m across."""
+    n = len(cx)
+    size = rng.uniform(0.0002, 0.0014, n)
+    angle = rng.uniform(0, np.pi, n)
+    corners = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5], [-0.5, -0.5]])
+    cos, sin = np.cos(angle)[:, None], np.sin(angle)[:, None]
+    x = cx[:, None] + size[:, None] * (corners[:, 0] * cos - corners[:, 1] * sin)
+    y = cy[:, None] + size[:, None] * (corners[:, 0] * sin + corners[:, 1] * cos)
+    return shapely.polygons(np.stack([x, y], axis=2))
+
+
+def synthetic_lookup(parcels, queries, rng):
+    """(lookup function, probes) over a synthetic in-process STRtree."""
+    # The synthetic index never talks to the database.
+    spatial_index.STALE_CHECK_INTERVAL = float('inf')
+
+    started = time.perf_counter()
+    geoms = make_parcels(parcels, rng)
+    index = ParcelSpatialIndex()
+    index.build_from_arrays(np.arange(1, parcels + 1), geoms)
+    print(f'Built index over {parcels} parcels in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+    extent = np.sqrt(parcels) * PITCH_DEG
+    cx = rng.uniform(CENTER_LON - extent / 2, CENTER_LON + extent / 2, queries)
+    cy = rng.uniform(CENTER_LAT - extent / 2, CENTER_LAT + extent / 2, queries)
+
+    def lookup(g):
+        return _live_overlaps_strtree(g, LIVE_MAX_RESULTS, LIVE_SIMPLIFY_TOLERANCE, index=index)
+    return lookup, make_queries(cx, cy, rng)
+
+
+def database_lookup(queries, rng):
+    """(lookup function, probes) for the cell_key prefilter over the stored parcels."""
+    rows = db.session.execute(
+        select(LandParcel.coordinates)
+        .where(LandParcel.coordinates.isnot(None))
+        .where(LandParcel.cell_key.isnot(None) | LandParcel.cell_key_coarse.isnot(None))
+        .order_by(func.random())
+        .limit(SAMPLE_PARCELS)
+    ).scalars().all()
+    if not rows:
+        return None, None
+    total = db.session.query(func.count(LandParcel.id)).scalar()
+    print(f'Sampled {len(rows)} of {total} stored parcels for probe centres')
+    centroids = shapely.centroid(shapely.from_wkb([bytes(r.data) for r in rows]))
+    pick = rng.integers(0, len(centroids), queries)
+    cx, cy = shapely.get_x(centroids[pick]), shapely.get_y(centroids[pick])
+
+    def lookup(g):
+        return _live_overlaps_cells(g, LIVE_MAX_RESULTS, LIVE_SIMPLIFY_TOLERANCE)
+    return lookup, make_queries(cx, cy, rng)
+
+
+def main(backend, parcels, queries, target_ms, seed):
+    rng = np.random.default_rng(seed)
+    if backend == 'strtree':
+        lookup, probes = synthetic_lookup(parcels, queries, rng)
+    else:
+        lookup, probes = database_lookup(queries, rng)
+        if lookup is None:
+            print('No parcels with cell keys found (see scripts/add_cell_key_columns.py).')
+            return 1
+
+    # warm-up
+    for g in probes[:20]:
+        lookup(g)
+
+    timings = []
+    hits = []
+    for g in probes:
+        t0 = time.perf_counter()
+        results, total = lookup(g)
+        json.dumps(results)
+        timings.append((time.perf_counter() - t0) * 1000)
+        hits.append(total)
+
+    timings = np.array(timings)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(f'Queries: {queries}, intersecting parcels per query: mean {np.mean(hits):.1f}, max {max(hits)}')
+    print(f'Backend: {backend}')
+    print(f'Latency ms: p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}  max {timings.max():.2f}')
+    if p95 > target_ms:
+        print(f'FAIL: p95 {p95:.2f} ms is above the {target_ms} ms target')
+        return 1
+    print(f'OK: p95 is under the {target_ms} ms target')
+    return 0
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--backend', choices=['cells', 'strtree'], default='cells',
+                   help='cells: cell_key prefilter on DATABASE_URL (default path); strtree: synthetic STRtree')
+    p.add_argument('--parcels', type=int, default=100000, help='Number of synthetic parcels (strtree only)')
+    p.add_argument('--queries', type=int, default=1000, help='Number of timed lookups')
+    p.add_argument('--target-ms', type=float, default=50.0, help='p95 latency target in milliseconds')
+    p.add_argument('--seed', type=int, default=42)
+    args = p.parse_args()
+
+    if args.backend == 'strtree':
+        sys.exit(main(args.backend, args.parcels, args.queries, args.target_ms, args.seed))
+
+    load_dotenv()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+    db.init_app(app)
+    with app.app_context():
+        sys.exit(main(args.backend, args.parcels, args.queries, args.target_ms, args.seed))
@@ -0,0 +1,155 @@
+"""
+Benchmark OCR wall time and identifier recall with and without image preprocessing.
+
+Usage (from repository root, with your venv active):
+    python scripts/benchmark_ocr_preprocessing.py [paths ...] [--profile auto|document|id_card|map]
+        [--truth truth.csv] [--out results.csv]
+
+paths are image files or directories searched recursively for .jpg/.jpeg/.png (default:
+uploads/). With --profile auto the profile comes from the upload field key at the start of
+the file name (nrc_copy-..., survey_map-...), as the app does from Document.document_type.
+
+Recall counts NRC and TPIN numbers (duplicate_detector.extract_identifiers_from_text). With
+--truth, a CSV with columns file,nrc,tpin (file name only; several values separated by ';')
+is the reference; without it, the union of what either run found is. Each image is OCR'd
+in this process, one after the other, so the timings are not affected by the worker pool.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+
+import pytesseract
+from PIL import Image
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import document_processing  # noqa: F401  (configures the tesseract path)
+from duplicate_detector import extract_identifiers_from_text
+from image_preprocess import PROFILES, preprocess_image, profile_for
+from validation_utils import normalize_identifier
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+FIELDS = ['file', 'profile', 'raw_s', 'prep_s', 'ocr_s', 'speedup',
+          'raw_found', 'prep_found', 'expected', 'raw_recall', 'prep_recall']
+
+
+def find_images(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for name in sorted(filenames):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(dirpath, name)
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            yield path
+
+
+def load_truth(path):
+    """{file name: set of normalized NRC/TPIN values}."""
+    truth = {}
+    with open(path, newline='', encoding='utf-8') as fh:
+        for row in csv.DictReader(fh):
+            values = set()
+            for kind in ('nrc', 'tpin'):
+                for value in (row.get(kind) or '').split(';'):
+                    if value.strip():
+                        values.add(normalize_identifier(value.strip(), kind))
+            truth[os.path.basename(row['file'])] = values
+    return truth
+
+
+def identifiers(text):
+    found = extract_identifiers_from_text(text)
+    return {normalize_identifier(v, kind) for kind in ('nrc', 'tpin') for v in found[kind]}
+
+
+def run(path, profile):
+    """(raw seconds, preprocess seconds, OCR-after-preprocess seconds, raw ids, preprocessed ids)."""
+    started = time.perf_counter()
+    with Image.open(path) as img:
+        raw_text = pytesseract.image_to_string(img)
+    raw_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with Image.open(path) as img:
+        prepared = preprocess_image(img, profile)
+    prep_s = time.perf_counter() - started
+    started = time.perf_counter()
+    prep_text = pytesseract.image_to_string(prepared)
+    ocr_s = time.perf_counter() - started
+    return raw_s, prep_s, ocr_s, identifiers(raw_text), identifiers(prep_text)
+
+
+def recall(found, expected):
+    if not expected:
+        return None
+    return len(found & expected) / len(expected)
+
+
+def main(paths, profile_name, truth_path, out):
+    truth = load_truth(truth_path) if truth_path else None
+    rows = []
+    for path in find_images(paths):
+        name = os.path.basename(path)
+        profile = profile_for(name.split('-', 1)[0]) if profile_name == 'auto' else profile_name
+        try:
+            raw_s, prep_s, ocr_s, raw_ids, prep_ids = run(path, profile)
+        except Exception as e:
+            print(f'{name}: skipped ({e})')
+            continue
+        expected = truth.get(name, set()) if truth is not None else raw_ids | prep_ids
+        rows.append({
+            'file': name,
+            'profile': profile,
+            'raw_s': round(raw_s, 3),
+            'prep_s': round(prep_s, 3),
+            'ocr_s': round(ocr_s, 3),
+            'speedup': round(raw_s / (prep_s + ocr_s), 2) if prep_s + ocr_s > 0 else None,
+            'raw_found': len(raw_ids),
+            'prep_found': len(prep_ids),
+            'expected': len(expected),
+            'raw_recall': recall(raw_ids, expected),
+            'prep_recall': recall(prep_ids, expected),
+        })
+        r = rows[-1]
+        print(f"{name}: raw {r['raw_s']:.2f}s, preprocessed {r['prep_s'] + r['ocr_s']:.2f}s "
+              f"({r['profile']}), identifiers {r['raw_found']} -> {r['prep_found']} of {r['expected']}")
+
+    if not rows:
+        print('No images benchmarked.')
+        return
+
+    raw_total = sum(r['raw_s'] for r in rows)
+    prep_total = sum(r['prep_s'] + r['ocr_s'] for r in rows)
+    expected_total = sum(r['expected'] for r in rows)
+    raw_hits = sum((r['raw_recall'] or 0) * r['expected'] for r in rows)
+    prep_hits = sum((r['prep_recall'] or 0) * r['expected'] for r in rows)
+    print(f'\n{len(rows)} images: OCR wall time {raw_total:.1f}s raw vs {prep_total:.1f}s preprocessed '
+          f'({raw_total / max(prep_total, 1e-9):.2f}x)')
+    if expected_total:
+        print(f'Identifier recall: {raw_hits / expected_total:.1%} raw vs {prep_hits / expected_total:.1%} preprocessed '
+              f'({expected_total} expected NRC/TPIN values)')
+
+    if out:
+        with open(out, 'w', newline='', encoding='utf-8') as fh:
+            writer = csv.DictWriter(fh, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f'Per-image results: {out}')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('paths', nargs='*', default=[os.path.join(ROOT, 'uploads')],
+                   help='Image files or directories (default: uploads/)')
+    p.add_argument('--profile', choices=['auto'] + list(PROFILES), default='auto',
+                   help='Preprocessing profile (default: from the upload file name)')
+    p.add_argument('--truth', default=None, help='CSV of expected identifiers: file,nrc,tpin')
+    p.add_argument('--out', default=None, help='Write per-image results to this CSV')
+    args = p.parse_args()
+    main(args.paths, args.profile, args.truth, args.out)
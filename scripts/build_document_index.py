@@ -0,0 +1,63 @@
+"""
+Run this script to (re)build the persistent TF-IDF document index from every uploaded document.
+Usage (from repository root, with your venv active):
+    python scripts/build_document_index.py [--refit]
+
+The index lives in DOC_INDEX_DIR (default doc_index/) and is kept current by the app: new uploads
+are appended as they arrive and /admin/retrain_ai rebuilds it with the new vectorizer. Run this once
+after deploying, or after restoring the database. --refit also trains a new vectorizer on the current
+corpus first (what retrain_ai does); without it the existing tfidf_vectorizer.pkl is reused, and one
+is trained only if there is none. Text comes from the text cache, so only uncached files are read.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from document_index import document_index
+from models import db, Document, ExtractedText
+from text_cache import document_texts
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+
+def main(refit):
+    ExtractedText.__table__.create(db.engine, checkfirst=True)
+    started = time.perf_counter()
+    vectorizer = None
+    if refit:
+        texts = document_texts(Document.query.all())
+        vectorizer = TfidfVectorizer(stop_words='english')
+        vectorizer.fit(list(texts.values()) or [''])
+        print(f'Fitted vectorizer on {len(texts)} documents ({len(vectorizer.vocabulary_)} terms)')
+    count = document_index.rebuild(vectorizer)
+    print(f'Indexed {count} documents in {time.perf_counter() - started:.1f}s: {document_index.directory}')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--refit', action='store_true', help='Train a new vectorizer on the current corpus first')
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        main(args.refit)
@@ -0,0 +1,85 @@
+"""
+Run this script to add the `display_geometry` column to `land_parcels` and `land_applications`
+if it doesn't exist and fill in the simplified display tiers for every stored geometry.
+Usage (from repository root, with your venv active):
+    python scripts/build_geometry_tiers.py [--all] [--batch-size 2000]
+
+The app rebuilds the tiers whenever it writes a geometry (see geometry_tiers.py); by default
+this only fills rows that have none. Pass --all after changing DETAIL_TIERS.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import os
+import sys
+
+import shapely
+from flask import Flask
+from sqlalchemy import bindparam, inspect, select, text, update
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from models import db, LandApplication, LandParcel
+from geometry_tiers import build_tiers
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+
+def add_column(table):
+    columns = {c['name'] for c in inspect(db.engine).get_columns(table)}
+    if 'display_geometry' not in columns:
+        print(f'Adding {table}.display_geometry')
+        with db.engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN display_geometry JSON'))
+
+
+def fill(model, batch_size, rebuild_all):
+    table = model.__table__
+    stmt = update(table).where(table.c.id == bindparam('row_id')).values(display_geometry=bindparam('tiers'))
+    filled = 0
+    last_id = 0
+    while True:
+        query = (
+            select(model.id, model.coordinates)
+            .where(model.id > last_id)
+            .where(model.coordinates.isnot(None))
+            .order_by(model.id)
+            .limit(batch_size)
+        )
+        if not rebuild_all:
+            query = query.where(model.display_geometry.is_(None))
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        geoms = shapely.from_wkb([bytes(r[1].data) for r in rows])
+        params = [{'row_id': r[0], 'tiers': tiers} for r, tiers in zip(rows, build_tiers(geoms))]
+        db.session.execute(stmt, params)
+        db.session.commit()
+        filled += len(rows)
+    print(f'{model.__tablename__}: display tiers built for {filled} rows')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--all', action='store_true', help='Rebuild tiers for every row, not only missing ones')
+    p.add_argument('--batch-size', type=int, default=2000)
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        for model in (LandParcel, LandApplication):
+            add_column(model.__tablename__)
+            fill(model, args.batch_size, args.all)
@@ -0,0 +1,76 @@
+"""
+Run this script to create the document_image_hashes table if it doesn't exist and compute the
+perceptual hashes of every uploaded image and PDF that has none yet.
+Usage (from repository root, with your venv active):
+    python scripts/build_image_hash_index.py [--rebuild]
+
+The duplicate detector hashes an application's documents when it checks them, so new uploads are
+indexed as they arrive; run this once after deploying so older documents can be matched. Hashes
+are computed from the cached thumbnails, which are generated for documents that have none.
+--rebuild re-hashes every document. Safe to run more than once.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from image_hash_index import index_documents
+from models import db, Document, DocumentImageHash
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+BATCH_SIZE = 200
+
+
+def main(rebuild):
+    DocumentImageHash.__table__.create(db.engine, checkfirst=True)
+    started = time.perf_counter()
+    total = hashed = 0
+    last_id = 0
+    while True:
+        docs = (
+            Document.query.filter(Document.id > last_id)
+            .order_by(Document.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not docs:
+            break
+        hashed += index_documents(docs, force=rebuild)
+        total += len(docs)
+        last_id = docs[-1].id
+        print(f'{total} documents processed ({time.perf_counter() - started:.1f}s)')
+    blank = DocumentImageHash.query.filter(DocumentImageHash.phash.is_(None)).count()
+    print(f'{hashed} of {total} documents hashed; {blank} blank pages are not matched')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--rebuild', action='store_true', help='Re-hash documents that already have hashes')
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        try:
+            main(args.rebuild)
+        except Exception as e:
+            print('Error building image hash index:', e)
+            raise
@@ -0,0 +1,77 @@
+"""
+Run this script to create the document_signatures and document_lsh_buckets tables if they don't
+exist and sign every uploaded document that has no current MinHash signature.
+Usage (from repository root, with your venv active):
+    python scripts/build_minhash_index.py [--rebuild]
+
+The duplicate detector signs an application's documents when it checks them, so new uploads are
+indexed as they arrive; run this once after deploying so older documents can be found as
+near-duplicates. --rebuild re-signs every document (e.g. after restoring the database). Text comes
+from the text cache, so only uncached files are read. Safe to run more than once.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from minhash_index import index_documents
+from models import db, Document, DocumentLshBucket, DocumentSignature, ExtractedText
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+BATCH_SIZE = 200
+
+
+def main(rebuild):
+    for model in (ExtractedText, DocumentSignature, DocumentLshBucket):
+        model.__table__.create(db.engine, checkfirst=True)
+    started = time.perf_counter()
+    total = signed = 0
+    last_id = 0
+    while True:
+        docs = (
+            Document.query.filter(Document.id > last_id)
+            .order_by(Document.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not docs:
+            break
+        signed += index_documents(docs, force=rebuild)
+        total += len(docs)
+        last_id = docs[-1].id
+        print(f'{total} documents processed ({time.perf_counter() - started:.1f}s)')
+    buckets = DocumentLshBucket.query.count()
+    print(f'{signed} of {total} documents signed; {buckets} LSH bucket rows')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--rebuild', action='store_true', help='Re-sign documents that already have a signature')
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        try:
+            main(args.rebuild)
+        except Exception as e:
+            print('Error building MinHash index:', e)
+            raise
@@ -0,0 +1,50 @@
+"""
+Run this script to create the parcel_adjacency table if it doesn't exist and (re)build the
+parcel adjacency graph from every registered parcel.
+Usage (from repository root, with your venv active):
+    python scripts/build_parcel_adjacency.py [--tolerance 2.0]
+
+--tolerance is the largest boundary gap, in metres, at which two parcels still count as
+neighbours. The app keeps the graph current for parcels registered afterwards, so this only
+needs to run once, or again after bulk edits made outside the app.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from models import db, ParcelAdjacency
+from parcel_adjacency import build_adjacency, ADJACENCY_TOLERANCE_M
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--tolerance', type=float, default=ADJACENCY_TOLERANCE_M,
+                   help='Maximum boundary gap in metres for two parcels to be neighbours')
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        ParcelAdjacency.__table__.create(db.engine, checkfirst=True)
+        started = time.perf_counter()
+        pairs = build_adjacency(tolerance_m=args.tolerance)
+        print(f'Adjacency graph built: {pairs} neighbouring pairs in {time.perf_counter() - started:.1f}s')
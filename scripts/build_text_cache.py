@@ -0,0 +1,73 @@
+"""
+Run this script to create the extracted_texts table if it doesn't exist and fill it with the text
+of every uploaded document that is not cached yet for the current extractor version.
+Usage (from repository root, with your venv active):
+    python scripts/build_text_cache.py
+
+The detectors fill the cache as they go (see text_cache.py), so this is optional; running it once
+after deploying, or after bumping EXTRACTOR_VERSION, moves the OCR cost out of the first detection
+runs. Safe to run more than once.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import sys
+import time
+
+from flask import Flask
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from document_processing import EXTRACTOR_VERSION
+from models import db, Document, ExtractedText
+from text_cache import document_texts
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+BATCH_SIZE = 200
+
+
+def main():
+    ExtractedText.__table__.create(db.engine, checkfirst=True)
+    started = time.perf_counter()
+    total = extracted = 0
+    last_id = 0
+    while True:
+        docs = (
+            Document.query.filter(Document.id > last_id)
+            .order_by(Document.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not docs:
+            break
+        texts = document_texts(docs)
+        total += len(docs)
+        extracted += sum(1 for t in texts.values() if t.strip())
+        last_id = docs[-1].id
+        print(f'{total} documents processed ({time.perf_counter() - started:.1f}s)')
+    cached = ExtractedText.query.filter_by(extractor_version=EXTRACTOR_VERSION).count()
+    print(f'{extracted} of {total} documents have text; {cached} distinct files cached '
+          f'for extractor version {EXTRACTOR_VERSION}')
+
+
+if __name__ == '__main__':
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        try:
+            main()
+        except Exception as e:
+            print('Error building text cache:', e)
+            raise
@@ -1,9 +1,10 @@
 """Import AI training JSON into the application's DB.
 
 Usage:
-  python scripts/import_ai_training_data.py [--files path1 path2 ...] [--limit N] [--commit]
+  python scripts/import_ai_training_data.py [--files path1 path2 ...] [--limit N] [--commit] [--detect]
 
 By default this performs a dry-run and will print counts. Use `--commit` to persist rows.
+`--detect` runs batch spatial conflict detection over the imported applications afterwards.
 """
 import argparse
 import json
@@ -19,7 +20,12 @@ if proj_root not in sys.path:
     sys.path.insert(0, proj_root)
 
 from models import db, LandApplication, LandParcel, LandConflict
-from geoalchemy2.shape import from_shape
+from spatial_index import parcel_index
+from parcel_adjacency import update_parcel_adjacency
+import vector_tiles
+from ai_conflict import detect_conflicts_batch
+from geoalchemy2.shape import from_shape, to_shape
+from geometry_normalize import normalize_geometry
 
 # Create a minimal Flask app here using the project's DATABASE_URL so we don't
 # import the top-level `app.py` (which pulls many optional dependencies).
@@ -69,7 +75,7 @@ def parse_record(rec):
     if coords and isinstance(coords, list) and len(coords) >= 3:
         try:
             # JSON uses [lon, lat] pairs; shapely expects same ordering
-            polygon = Polygon(coords)
+            polygon = normalize_geometry(Polygon(coords))
             parcel_geom = from_shape(polygon, srid=4326)
             application.coordinates = parcel_geom
         except Exception:
@@ -78,7 +84,7 @@ def parse_record(rec):
     return application, parcel_geom
 
 
-def main(files, limit=None, commit=False, create_conflicts=False):
+def main(files, limit=None, commit=False, create_conflicts=False, detect=False):
     imported = 0
     skipped = 0
     created_app_ids = []
@@ -148,6 +154,11 @@ def main(files, limit=None, commit=False, create_conflicts=False):
                             db.session.add(cf)
 
                         db.session.commit()
+                        parcel_index.add_parcels([parcel])
+                        if parcel_geom is not None:
+                            update_parcel_adjacency([parcel])
+                            vector_tiles.invalidate_geometry('parcels', to_shape(parcel_geom))
+                            vector_tiles.invalidate_geometry('applications', to_shape(parcel_geom))
                         imported += 1
                         created_app_ids.append(application.id)
                     else:
@@ -161,6 +172,10 @@ def main(files, limit=None, commit=False, create_conflicts=False):
                     except Exception:
                         pass
 
+        if commit and detect and created_app_ids:
+            created = detect_conflicts_batch(created_app_ids)
+            print('Detected conflicts:', sum(len(ids) for ids in created.values()))
+
     print('Files processed:', files)
     print('Imported (count):', imported)
     print('Skipped (existing refs):', skipped)
@@ -174,6 +189,7 @@ if __name__ == '__main__':
     p.add_argument('--limit', type=int, help='Maximum number of records to import')
     p.add_argument('--commit', action='store_true', help='Persist changes to the DB (default is dry-run)')
     p.add_argument('--create-conflicts', action='store_true', help='Also create LandConflict rows for records with has_conflict')
+    p.add_argument('--detect', action='store_true', help='Run batch spatial conflict detection on imported applications')
     args = p.parse_args()
 
     if not args.files:
@@ -183,4 +199,4 @@ if __name__ == '__main__':
     else:
         files = args.files
 
-    main(files, limit=args.limit, commit=args.commit, create_conflicts=args.create_conflicts)
+    main(files, limit=args.limit, commit=args.commit, create_conflicts=args.create_conflicts, detect=args.detect)
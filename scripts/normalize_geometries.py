@@ -0,0 +1,121 @@
+"""
+Run this script to rewrite every stored parcel and application geometry in canonical form
+(repaired, snapped to the normalization grid, duplicate vertices removed, rings oriented),
+refreshing the cell keys and display tiers derived from it.
+Usage (from repository root, with your venv active):
+    python scripts/normalize_geometries.py [--dry-run] [--batch-size 2000]
+
+New geometries are normalized on ingest (see geometry_normalize.py); this brings rows
+stored before that in line. Only rows whose WKB actually changes are written, so it is
+safe to run again. Rows that normalize to nothing are reported and left untouched.
+
+After each batch the cached vector tiles around the old and new outlines are deleted
+(run from the repository root, or with the app's TILE_CACHE_DIR) and the adjacency edges
+of the rewritten parcels are recomputed. Running app workers cannot notice geometries
+rewritten in place: their STRtree only checks the parcel count and highest id. Restart
+them afterwards, or call spatial_index.parcel_index.mark_stale() in each.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+import argparse
+import os
+import sys
+
+import shapely
+from flask import Flask
+from geoalchemy2.shape import from_shape
+from sqlalchemy import bindparam, select, update
+
+# Ensure project root is first on sys.path so local modules are preferred over installed packages
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from models import db, LandApplication, LandParcel
+from geometry_normalize import normalize_geometries
+from geometry_tiers import build_tiers
+from spatial_cells import cell_keys_for
+from parcel_adjacency import update_parcel_adjacency
+from spatial_index import parcel_index
+import vector_tiles
+
+# create minimal Flask app using your app configuration
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# initialize db
+db.init_app(app)
+
+TILE_LAYERS = {LandParcel: 'parcels', LandApplication: 'applications'}
+
+
+def normalize_table(model, batch_size, dry_run):
+    table = model.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam('row_id'))
+        .values(coordinates=bindparam('geom'), cell_key=bindparam('fine'),
+                cell_key_coarse=bindparam('coarse'), display_geometry=bindparam('tiers'))
+    )
+    seen = changed = unusable = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(model.id, model.coordinates)
+            .where(model.id > last_id)
+            .where(model.coordinates.isnot(None))
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        seen += len(rows)
+
+        wkbs = [bytes(r[1].data) for r in rows]
+        before = shapely.from_wkb(wkbs)
+        after = normalize_geometries(before)
+
+        params = []
+        outlines = []
+        for r, old_wkb, old, new in zip(rows, wkbs, before, after):
+            if new is None:
+                unusable += 1
+                print(f'  {model.__tablename__} id={r[0]}: geometry is degenerate, left unchanged')
+                continue
+            if shapely.to_wkb(new) == old_wkb or new.equals_exact(old, 0):
+                continue
+            fine, coarse = cell_keys_for(new)
+            params.append({'row_id': r[0], 'geom': from_shape(new, srid=4326), 'fine': fine, 'coarse': coarse,
+                           'tiers': build_tiers([new])[0]})
+            outlines.extend([old, new])
+        changed += len(params)
+        if params and not dry_run:
+            db.session.execute(stmt, params)
+            db.session.commit()
+            # tiles are dropped after the commit, so nothing re-renders the old outline
+            for geom in outlines:
+                vector_tiles.invalidate_geometry(TILE_LAYERS[model], geom)
+            if model is LandParcel:
+                # rewritten in place: the index cannot see that, so rebuild it first
+                parcel_index.mark_stale()
+                ids = [prm['row_id'] for prm in params]
+                update_parcel_adjacency(LandParcel.query.filter(LandParcel.id.in_(ids)).all())
+    print(f'{model.__tablename__}: {seen} geometries checked, {changed} '
+          f'{"would change" if dry_run else "rewritten"}, {unusable} degenerate')
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+    p.add_argument('--batch-size', type=int, default=2000)
+    args = p.parse_args()
+
+    if not app.config['SQLALCHEMY_DATABASE_URI']:
+        print('ERROR: DATABASE_URL environment variable is not set. Please set it in your .env or environment.')
+        raise SystemExit(1)
+
+    with app.app_context():
+        for model in (LandParcel, LandApplication):
+            normalize_table(model, args.batch_size, args.dry_run)
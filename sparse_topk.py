@@ -0,0 +1,62 @@
+"""
+sparse_topk.py
+
+Thresholded top-k sparse matrix product, computed over the corpus in fixed-size row chunks
+(the approach of sparse_dot_topn, in NumPy/SciPy).
+
+Design:
+- chunked_top_k(query, corpus) multiplies the query rows with CHUNK_ROWS corpus rows at a
+  time, so the intermediate product is at most (query rows x CHUNK_ROWS) whatever the corpus
+  size; for a memory-mapped corpus only the chunk being multiplied is paged in
+- entries not above the threshold are dropped from each chunk product straight away, and
+  the survivors are merged with the running result, keeping at most top_k per query row;
+  peak memory is bounded by the chunk product plus query rows x top_k triples
+- selection and merging are vectorized (lexsort + per-row rank), with no Python loop over
+  matrix cells
+- the result is COO triples (query row, corpus row, value), best first within each query row
+"""
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+CHUNK_ROWS = int(os.environ.get('SIMILARITY_CHUNK_ROWS', '5000'))
+
+
+def _keep_top_k(rows, cols, values, top_k):
+    """Keep the top_k largest values of each row; returns triples sorted by row, then value descending."""
+    order = np.lexsort((cols, -values, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    if top_k is not None and len(rows):
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side='left')
+        keep = rank < top_k
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+    return rows, cols, values
+
+
+def chunked_top_k(query, corpus, threshold=0.0, top_k=None, chunk_rows=CHUNK_ROWS, row_mask=None):
+    """(query rows, corpus rows, values) of the entries of query @ corpus.T above threshold.
+
+    query is (k x f) and corpus (n x f), both sparse; at most top_k entries are kept per query
+    row (all of them when top_k is None). Corpus rows where row_mask is False are skipped.
+    """
+    query = sp.csr_matrix(query)
+    rows = np.zeros(0, dtype=np.int64)
+    cols = np.zeros(0, dtype=np.int64)
+    values = np.zeros(0, dtype=np.float32)
+    n = corpus.shape[0]
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        if row_mask is not None and not row_mask[start:stop].any():
+            continue
+        chunk = (query @ corpus[start:stop].T).tocoo()
+        keep = chunk.data > threshold
+        if row_mask is not None:
+            keep &= row_mask[start:stop][chunk.col]
+        if not keep.any():
+            continue
+        rows = np.concatenate([rows, chunk.row[keep].astype(np.int64)])
+        cols = np.concatenate([cols, chunk.col[keep].astype(np.int64) + start])
+        values = np.concatenate([values, chunk.data[keep].astype(np.float32)])
+        rows, cols, values = _keep_top_k(rows, cols, values, top_k)
+    return _keep_top_k(rows, cols, values, top_k)
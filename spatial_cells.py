@@ -0,0 +1,127 @@
+"""
+spatial_cells.py
+
+Quadkey cell keys for spatial prefiltering on databases without PostGIS.
+
+Design:
+- a geometry is anchored at the Web Mercator tile holding the top-left corner of its
+  bounding box, at the finest of two zoom levels (FINE_ZOOM, COARSE_ZOOM) where the box
+  spans at most two tiles each way; the anchor's quadkey is stored in cell_key (fine) or
+  cell_key_coarse (coarse), and geometries too large for either keep both NULL
+- a geometry anchored at tile (x, y) lies inside tiles x..x+1, y..y+1, so anything
+  overlapping a probe is anchored in the probe's tile span widened by one tile to the
+  left and top: cell_filter() turns that span into IN lists on both indexed columns
+  (or, for very large probes, into quadkey prefix ranges [key, key + '4')), which are
+  plain B-tree lookups
+- cell keys are filled in by before_insert/before_update listeners whenever coordinates
+  change (registered by importing models); scripts/add_cell_key_columns.py adds the
+  columns and backfills old rows
+"""
+import math
+
+import shapely
+from geoalchemy2.elements import WKBElement, WKTElement
+from sqlalchemy import and_, event, inspect, or_
+
+from models import LandApplication, LandParcel
+
+# Around Ndola a z18 tile is ~150 m across (plots), a z14 tile ~2.4 km (farms).
+FINE_ZOOM = 18
+COARSE_ZOOM = 14
+
+# Probes covering more anchor tiles than this switch to prefix ranges at a coarser zoom.
+MAX_PROBE_CELLS = 64
+
+
+def _lonlat_to_tile(lon, lat, z):
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_span(bounds, z):
+    """(x0, y0, x1, y1) of the zoom-z tiles covering (minx, miny, maxx, maxy) in EPSG:4326."""
+    minx, miny, maxx, maxy = bounds
+    x0, y0 = _lonlat_to_tile(minx, maxy, z)
+    x1, y1 = _lonlat_to_tile(maxx, miny, z)
+    return x0, y0, x1, y1
+
+
+def quadkey(x, y, z):
+    """Bing-style quadkey of tile (x, y) at zoom z."""
+    digits = []
+    for i in range(z, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return ''.join(digits)
+
+
+def cell_keys_for(geom):
+    """(cell_key, cell_key_coarse) for an EPSG:4326 geometry; at most one is set."""
+    if geom is None or geom.is_empty:
+        return None, None
+    for z in (FINE_ZOOM, COARSE_ZOOM):
+        x0, y0, x1, y1 = tile_span(geom.bounds, z)
+        if x1 - x0 <= 1 and y1 - y0 <= 1:
+            key = quadkey(x0, y0, z)
+            return (key, None) if z == FINE_ZOOM else (None, key)
+    return None, None
+
+
+def _probe(column, bounds, z):
+    x0, y0, x1, y1 = tile_span(bounds, z)
+    x0, y0 = max(x0 - 1, 0), max(y0 - 1, 0)
+    zoom = z
+    while (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_PROBE_CELLS:
+        x0, y0, x1, y1 = x0 >> 1, y0 >> 1, x1 >> 1, y1 >> 1
+        zoom -= 1
+    keys = [quadkey(x, y, zoom) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+    if zoom == z:
+        return column.in_(keys)
+    return or_(*[and_(column >= k, column < k + '4') for k in keys])
+
+
+def cell_filter(model, geom):
+    """WHERE clause selecting rows of model whose geometry may intersect geom.
+
+    Rows without cell keys (too large, or not backfilled yet) always match.
+    """
+    if geom is None or geom.is_empty:
+        return and_(model.cell_key.is_(None), model.cell_key_coarse.is_(None))
+    return or_(
+        _probe(model.cell_key, geom.bounds, FINE_ZOOM),
+        _probe(model.cell_key_coarse, geom.bounds, COARSE_ZOOM),
+        and_(model.cell_key.is_(None), model.cell_key_coarse.is_(None)),
+    )
+
+
+def _to_shape(coordinates):
+    """Shapely geometry from whatever was assigned to a coordinates attribute."""
+    if coordinates is None:
+        return None
+    if isinstance(coordinates, WKBElement):
+        return shapely.from_wkb(bytes(coordinates.data))
+    if isinstance(coordinates, WKTElement):
+        return shapely.from_wkt(coordinates.data)
+    if isinstance(coordinates, str):
+        # 'SRID=4326;POLYGON(...)' or plain WKT
+        return shapely.from_wkt(coordinates.split(';', 1)[-1])
+    return None
+
+
+def _set_cell_keys(mapper, connection, target):
+    state = inspect(target)
+    if state.persistent and not state.attrs.coordinates.history.has_changes():
+        return
+    try:
+        target.cell_key, target.cell_key_coarse = cell_keys_for(_to_shape(target.coordinates))
+    except Exception:
+        # an unparseable geometry just falls back to "always a candidate"
+        target.cell_key, target.cell_key_coarse = None, None
+
+
+for _model in (LandParcel, LandApplication):
+    event.listen(_model, 'before_insert', _set_cell_keys)
+    event.listen(_model, 'before_update', _set_cell_keys)
@@ -0,0 +1,546 @@
+"""
+spatial_index.py
+
+Process-level STRtree index over registered parcel geometries.
+
+Design:
+- ParcelSpatialIndex holds a Shapely STRtree built from every LandParcel with coordinates
+- add_parcels(parcels) registers newly inserted parcels without rebuilding the tree
+- the tree is rebuilt lazily on the next query once it is marked stale, once too many
+  parcels are pending, or once the land_parcels table changed underneath it (for
+  example rows inserted by another worker process or by the importer)
+- query(geom) returns (parcel_id, parcel_geom) pairs that really intersect geom:
+  the tree does the bounding-box lookup and the exact test only runs on its hits
+- find_parcel_overlaps(geom) is what callers use: on PostgreSQL with PostGIS the whole
+  overlap computation runs in SQL against the GiST index on land_parcels.coordinates
+  (see scripts/add_spatial_indexes.py), otherwise it falls back to the STRtree
+- find_parcel_overlaps_many(application_ids, geoms) does the same for many applications
+  as one spatial join (a SQL join in PostGIS, an array query against the STRtree otherwise)
+- live_parcel_overlaps(geom) is the latency-bounded variant for the drawing map: it only
+  returns the largest overlaps, capped, with simplified parcel outlines
+  (scripts/bench_geometry_conflicts.py measures it, on the cell_key path by default and
+  with --backend strtree on the STRtree)
+- without PostGIS, single-geometry lookups (find_parcel_overlaps, live_parcel_overlaps)
+  prefilter candidates in SQL through the indexed quadkey cell_key columns (see
+  spatial_cells.py) and run the exact test in Shapely; batch lookups use the STRtree
+- the PostGIS queries intersect ST_MakeValid'd geometries, and run in a savepoint: if one
+  still fails (a GEOS error on some malformed legacy parcel) only that query is rolled
+  back and the lookup is answered by the Shapely path, which skips just the bad parcel
+- every area figure is in square metres: SQL reprojects with ST_Transform to
+  geometry_metrics.METRIC_SRID, the STRtree paths go through geometry_metrics
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from sqlalchemy import case, func, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from geometry_metrics import METRIC_SRID, overlap_metrics
+from models import db, LandApplication, LandParcel
+from spatial_cells import cell_filter
+
+logger = logging.getLogger(__name__)
+
+# Parcels added after the last build are tested one by one until there are this many,
+# at which point the next query rebuilds the tree.
+MAX_PENDING = 256
+
+# How often (seconds) the index compares itself against the parcel table.
+STALE_CHECK_INTERVAL = 5.0
+
+# 'auto' uses PostGIS when the database has it and the cell_key prefilter otherwise;
+# 'postgis', 'cells' or 'strtree' force a backend.
+SPATIAL_BACKEND = os.environ.get('SPATIAL_BACKEND', 'auto').lower()
+
+# Defaults for live_parcel_overlaps: result cap and simplification tolerance in degrees
+# (1e-5 degrees is roughly a metre around Ndola).
+LIVE_MAX_RESULTS = 25
+LIVE_SIMPLIFY_TOLERANCE = 1e-5
+
+_postgis_by_url = {}
+
+
+def _area_m2(geom):
+    """SQL expression for the area of an EPSG:4326 geometry in square metres."""
+    return func.ST_Area(func.ST_Transform(geom, METRIC_SRID))
+
+
+def _decode(coordinates):
+    """Decode a GeoAlchemy2 WKB element into a Shapely geometry."""
+    return shapely.from_wkb(bytes(coordinates.data))
+
+
+class ParcelSpatialIndex:
+    """STRtree over parcel geometries with incremental inserts and lazy rebuilds."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tree = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._geoms = np.empty(0, dtype=object)
+        self._known_ids = set()
+        self._pending_ids = []
+        self._pending_geoms = []
+        self._stale = True
+        # (row count, max id) of parcels with coordinates as last seen by this index
+        self._signature = None
+        self._last_check = 0.0
+
+    def build_from_arrays(self, ids, geoms):
+        """Build the tree from parallel arrays of parcel ids and Shapely geometries."""
+        ids = np.asarray(ids, dtype=np.int64)
+        geoms = np.asarray(geoms, dtype=object)
+        tree = STRtree(geoms) if len(geoms) else None
+        with self._lock:
+            self._tree = tree
+            self._ids = ids
+            self._geoms = geoms
+            self._known_ids = set(ids.tolist())
+            self._pending_ids = []
+            self._pending_geoms = []
+            self._stale = False
+            self._signature = (len(ids), int(ids.max()) if len(ids) else None)
+            self._last_check = time.monotonic()
+
+    def rebuild(self):
+        """Reload every parcel geometry from the database and rebuild the tree."""
+        started = time.monotonic()
+        rows = (
+            db.session.query(LandParcel.id, LandParcel.coordinates)
+            .filter(LandParcel.coordinates.isnot(None))
+            .all()
+        )
+        ids = [r.id for r in rows]
+        geoms = shapely.from_wkb([bytes(r.coordinates.data) for r in rows]) if rows else []
+        self.build_from_arrays(ids, geoms)
+        logger.info('Parcel spatial index rebuilt with %s parcels in %.1f ms',
+                    len(ids), (time.monotonic() - started) * 1000)
+
+    def mark_stale(self):
+        """Force a rebuild on the next query (e.g. after a parcel geometry was edited)."""
+        with self._lock:
+            self._stale = True
+
+    def add_parcels(self, parcels):
+        """Register freshly committed parcels without rebuilding the tree."""
+        with self._lock:
+            if self._stale:
+                # The next query reloads everything anyway.
+                return
+            for p in parcels:
+                if p is None or p.id is None or p.coordinates is None:
+                    continue
+                if p.id in self._known_ids:
+                    # Geometry of an indexed parcel changed; the tree cannot be patched.
+                    self._stale = True
+                    return
+                try:
+                    geom = _decode(p.coordinates)
+                except Exception:
+                    logger.exception('Failed to decode geometry for parcel id=%s', p.id)
+                    continue
+                self._pending_ids.append(p.id)
+                self._pending_geoms.append(geom)
+                self._known_ids.add(p.id)
+                count, max_id = self._signature or (0, None)
+                self._signature = (count + 1, p.id if max_id is None else max(max_id, p.id))
+            if len(self._pending_ids) > MAX_PENDING:
+                self._stale = True
+
+    def _table_changed(self):
+        """Cheap check whether land_parcels no longer matches what the index holds."""
+        now = time.monotonic()
+        if now - self._last_check < STALE_CHECK_INTERVAL:
+            return False
+        self._last_check = now
+        count, max_id = (
+            db.session.query(func.count(LandParcel.id), func.max(LandParcel.id))
+            .filter(LandParcel.coordinates.isnot(None))
+            .one()
+        )
+        return (count, max_id) != self._signature
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._stale or self._table_changed():
+                self.rebuild()
+
+    def query(self, geom):
+        """Return (parcel_id, parcel_geom) pairs for parcels intersecting geom."""
+        self._ensure_fresh()
+        with self._lock:
+            tree, ids, geoms = self._tree, self._ids, self._geoms
+            pending = list(zip(self._pending_ids, self._pending_geoms))
+
+        hits = []
+        if tree is not None:
+            idx = tree.query(geom, predicate='intersects')
+            hits.extend(zip(ids[idx].tolist(), geoms[idx]))
+        for pid, pgeom in pending:
+            if pgeom.intersects(geom):
+                hits.append((pid, pgeom))
+        return hits
+
+    def query_many(self, geoms):
+        """Vectorized query for an array of geometries.
+
+        Returns three parallel arrays (input_index, parcel_ids, parcel_geoms), one entry
+        per intersecting (input geometry, parcel) pair. Missing inputs (None) match nothing.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            tree, ids, tree_geoms = self._tree, self._ids, self._geoms
+            pending_ids = np.asarray(self._pending_ids, dtype=np.int64)
+            pending_geoms = np.asarray(self._pending_geoms, dtype=object)
+
+        geoms = np.asarray(geoms, dtype=object)
+        left = [np.empty(0, dtype=np.intp)]
+        right_ids = [np.empty(0, dtype=np.int64)]
+        right_geoms = [np.empty(0, dtype=object)]
+        if tree is not None and len(geoms):
+            pairs = tree.query(geoms, predicate='intersects')
+            left.append(pairs[0])
+            right_ids.append(ids[pairs[1]])
+            right_geoms.append(tree_geoms[pairs[1]])
+        for pid, pgeom in zip(pending_ids, pending_geoms):
+            hit = np.nonzero(shapely.intersects(pgeom, geoms))[0]
+            left.append(hit)
+            right_ids.append(np.full(len(hit), pid, dtype=np.int64))
+            right_geoms.append(np.full(len(hit), pgeom, dtype=object))
+        return np.concatenate(left), np.concatenate(right_ids), np.concatenate(right_geoms)
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending_ids)
+
+
+# Shared by every request handled in this process.
+parcel_index = ParcelSpatialIndex()
+
+
+def postgis_available():
+    """True when the bound database is PostgreSQL with the PostGIS extension installed."""
+    if SPATIAL_BACKEND in ('strtree', 'cells'):
+        return False
+    if SPATIAL_BACKEND == 'postgis':
+        return True
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _postgis_by_url:
+        available = False
+        if engine.dialect.name == 'postgresql':
+            try:
+                available = db.session.execute(
+                    text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+                ).first() is not None
+            except Exception:
+                logger.exception('Could not check for the PostGIS extension')
+                db.session.rollback()
+        _postgis_by_url[key] = available
+    return _postgis_by_url[key]
+
+
+def _postgis_rows(stmt):
+    """Run a PostGIS statement in a savepoint, so a failure leaves the caller's session usable."""
+    with db.session.begin_nested():
+        return db.session.execute(stmt).mappings().all()
+
+
+def _overlaps_postgis(geom=None, application_id=None, with_geojson=False):
+    """Compute intersecting parcels and overlap figures inside PostgreSQL.
+
+    When application_id is given the stored application geometry is used directly,
+    so no polygon travels to or from the database apart from optional GeoJSON.
+    """
+    if application_id is not None:
+        target = (
+            select(LandApplication.coordinates)
+            .where(LandApplication.id == application_id)
+            .scalar_subquery()
+        )
+    else:
+        target = func.ST_GeomFromText(geom.wkt, 4326)
+
+    columns = [
+        LandParcel.id.label('parcel_id'),
+        _area_m2(LandParcel.coordinates).label('parcel_area'),
+        _area_m2(func.ST_Intersection(func.ST_MakeValid(LandParcel.coordinates),
+                                      func.ST_MakeValid(target))).label('overlap_area'),
+    ]
+    if with_geojson:
+        columns.append(func.ST_AsGeoJSON(LandParcel.coordinates).label('geojson'))
+    # ST_Intersects is index-assisted: the GiST bbox test runs before the exact one
+    matches = (
+        select(*columns)
+        .where(LandParcel.coordinates.isnot(None))
+        .where(func.ST_Intersects(LandParcel.coordinates, target))
+        .subquery()
+    )
+    ratio = case((matches.c.parcel_area > 0, matches.c.overlap_area / matches.c.parcel_area), else_=None)
+    rows = _postgis_rows(select(matches, ratio.label('overlap_pct')))
+
+    results = []
+    for r in rows:
+        item = {
+            'parcel_id': r['parcel_id'],
+            'overlap_area': float(r['overlap_area'] or 0.0),
+            'parcel_area': float(r['parcel_area'] or 0.0),
+            'overlap_pct': float(r['overlap_pct']) if r['overlap_pct'] is not None else None,
+        }
+        if with_geojson:
+            item['geojson'] = json.loads(r['geojson']) if r['geojson'] else None
+        results.append(item)
+    return results
+
+
+def _cell_candidates(geom):
+    """Parcels intersecting geom, prefiltered in SQL on cell_key and tested exactly here.
+
+    Returns parallel (parcel_ids, parcel_geoms) arrays like ParcelSpatialIndex.query_many.
+    """
+    rows = db.session.execute(
+        select(LandParcel.id, LandParcel.coordinates)
+        .where(LandParcel.coordinates.isnot(None))
+        .where(cell_filter(LandParcel, geom))
+    ).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+    parcel_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    parcel_geoms = shapely.from_wkb([bytes(r[1].data) for r in rows])
+    hit = shapely.intersects(parcel_geoms, geom)
+    return parcel_ids[hit], parcel_geoms[hit]
+
+
+def _overlap_rows(geom, parcel_ids, parcel_geoms, with_geojson=False):
+    """find_parcel_overlaps dicts for candidate parcels already known to intersect geom."""
+    if not len(parcel_ids):
+        return []
+    overlap_area, parcel_area, ratio = overlap_metrics(parcel_geoms, geom)
+
+    results = []
+    for pid, parcel_geom, inter, area, pct in zip(parcel_ids.tolist(), parcel_geoms, overlap_area.tolist(),
+                                                  parcel_area.tolist(), ratio.tolist()):
+        if inter != inter:  # NaN from a failed pair
+            logger.error('Error processing parcel geometry id=%s', pid)
+            continue
+        item = {
+            'parcel_id': pid,
+            'overlap_area': inter,
+            'parcel_area': area,
+            'overlap_pct': pct if area > 0 else None,
+        }
+        if with_geojson:
+            item['geojson'] = parcel_geom.__geo_interface__
+        results.append(item)
+    return results
+
+
+def _overlaps_strtree(geom, with_geojson=False):
+    """Same result shape as _overlaps_postgis, computed from the in-process STRtree."""
+    _, parcel_ids, parcel_geoms = parcel_index.query_many([geom])
+    return _overlap_rows(geom, parcel_ids, parcel_geoms, with_geojson)
+
+
+def _overlaps_cells(geom, with_geojson=False):
+    """Same result shape as _overlaps_postgis, using the cell_key B-tree prefilter."""
+    parcel_ids, parcel_geoms = _cell_candidates(geom)
+    return _overlap_rows(geom, parcel_ids, parcel_geoms, with_geojson)
+
+
+def find_parcel_overlaps(geom=None, application_id=None, with_geojson=False):
+    """Return overlap figures for every parcel intersecting a geometry.
+
+    Pass either a Shapely geometry or the id of a stored application (the geometry is
+    still needed without PostGIS). Each result is a dict with parcel_id,
+    overlap_area, parcel_area, overlap_pct (overlap relative to the parcel area, None for
+    degenerate parcels) and, if requested, the parcel geojson.
+    """
+    if postgis_available():
+        try:
+            return _overlaps_postgis(geom=geom, application_id=application_id, with_geojson=with_geojson)
+        except SQLAlchemyError:
+            logger.exception('PostGIS overlap query failed; using Shapely instead')
+    if geom is None:
+        application = db.session.get(LandApplication, application_id)
+        if application is None or application.coordinates is None:
+            return []
+        geom = _decode(application.coordinates)
+    if SPATIAL_BACKEND == 'strtree':
+        return _overlaps_strtree(geom, with_geojson=with_geojson)
+    return _overlaps_cells(geom, with_geojson=with_geojson)
+
+
+def _overlaps_many_postgis(application_ids):
+    """One SQL spatial join between the given applications and every parcel."""
+    parcel_area = _area_m2(LandParcel.coordinates)
+    overlap_area = _area_m2(func.ST_Intersection(func.ST_MakeValid(LandParcel.coordinates),
+                                                 func.ST_MakeValid(LandApplication.coordinates)))
+    stmt = (
+        select(
+            LandApplication.id.label('application_id'),
+            LandParcel.id.label('parcel_id'),
+            parcel_area.label('parcel_area'),
+            overlap_area.label('overlap_area'),
+        )
+        .select_from(LandApplication)
+        .join(LandParcel, func.ST_Intersects(LandParcel.coordinates, LandApplication.coordinates))
+        .where(LandApplication.id.in_(application_ids))
+    )
+    results = []
+    for r in _postgis_rows(stmt):
+        parcel_area = float(r['parcel_area'] or 0.0)
+        overlap_area = float(r['overlap_area'] or 0.0)
+        results.append({
+            'application_id': r['application_id'],
+            'parcel_id': r['parcel_id'],
+            'overlap_area': overlap_area,
+            'parcel_area': parcel_area,
+            'overlap_pct': overlap_area / parcel_area if parcel_area > 0 else None,
+        })
+    return results
+
+
+def _overlaps_many_strtree(application_ids, geoms):
+    """Array query against the STRtree followed by vectorized intersection areas."""
+    geoms = np.asarray(geoms, dtype=object)
+    app_idx, parcel_ids, parcel_geoms = parcel_index.query_many(geoms)
+    if not len(app_idx):
+        return []
+    app_ids = np.asarray(application_ids)[app_idx]
+    overlap_area, parcel_area, ratio = overlap_metrics(parcel_geoms, geoms[app_idx])
+
+    results = []
+    for aid, pid, inter, area, pct in zip(app_ids.tolist(), parcel_ids.tolist(), overlap_area.tolist(),
+                                          parcel_area.tolist(), ratio.tolist()):
+        if inter != inter:  # NaN from a failed pair
+            logger.error('Error processing parcel geometry id=%s', pid)
+            continue
+        results.append({
+            'application_id': aid,
+            'parcel_id': pid,
+            'overlap_area': inter,
+            'parcel_area': area,
+            'overlap_pct': pct if area > 0 else None,
+        })
+    return results
+
+
+def _application_geoms(application_ids):
+    """Decoded geometries of stored applications, parallel to application_ids (None if missing)."""
+    stored = dict(db.session.execute(
+        select(LandApplication.id, LandApplication.coordinates).where(LandApplication.id.in_(application_ids))
+    ).all())
+    return [_decode(stored[aid]) if stored.get(aid) is not None else None for aid in application_ids]
+
+
+def find_parcel_overlaps_many(application_ids, geoms=None):
+    """Batch version of find_parcel_overlaps for stored applications.
+
+    geoms, if given, are parallel to application_ids and save re-reading the stored
+    outlines when PostGIS is unavailable. Returns the same dicts as find_parcel_overlaps,
+    each with an extra application_id key.
+    """
+    if not application_ids:
+        return []
+    if postgis_available():
+        try:
+            return _overlaps_many_postgis(application_ids)
+        except SQLAlchemyError:
+            logger.exception('PostGIS batch overlap query failed; using Shapely instead')
+    if geoms is None:
+        geoms = _application_geoms(application_ids)
+    return _overlaps_many_strtree(application_ids, geoms)
+
+
+def _live_overlaps_postgis(geom, max_results, tolerance):
+    target = func.ST_GeomFromText(geom.wkt, 4326)
+    overlap_area = _area_m2(func.ST_Intersection(func.ST_MakeValid(LandParcel.coordinates),
+                                                 func.ST_MakeValid(target)))
+    parcel_area = _area_m2(LandParcel.coordinates)
+    stmt = (
+        select(
+            LandParcel.id.label('parcel_id'),
+            parcel_area.label('parcel_area'),
+            overlap_area.label('overlap_area'),
+            func.ST_AsGeoJSON(func.ST_SimplifyPreserveTopology(LandParcel.coordinates, tolerance), 7).label('geojson'),
+            func.count().over().label('total'),
+        )
+        .where(LandParcel.coordinates.isnot(None))
+        .where(func.ST_Intersects(LandParcel.coordinates, target))
+        .order_by(overlap_area.desc())
+        .limit(max_results)
+    )
+    rows = _postgis_rows(stmt)
+    results = []
+    for r in rows:
+        area = float(r['parcel_area'] or 0.0)
+        inter = float(r['overlap_area'] or 0.0)
+        results.append({
+            'parcel_id': r['parcel_id'],
+            'overlap_area': inter,
+            'parcel_area': area,
+            'overlap_pct': inter / area if area > 0 else None,
+            'geojson': json.loads(r['geojson']) if r['geojson'] else None,
+        })
+    total = rows[0]['total'] if rows else 0
+    return results, total
+
+
+def _live_overlaps_strtree(geom, max_results, tolerance, index=None):
+    index = index or parcel_index
+    _, parcel_ids, parcel_geoms = index.query_many([geom])
+    return _rank_overlaps(geom, parcel_ids, parcel_geoms, max_results, tolerance)
+
+
+def _live_overlaps_cells(geom, max_results, tolerance):
+    parcel_ids, parcel_geoms = _cell_candidates(geom)
+    return _rank_overlaps(geom, parcel_ids, parcel_geoms, max_results, tolerance)
+
+
+def _rank_overlaps(geom, parcel_ids, parcel_geoms, max_results, tolerance):
+    """Largest max_results overlaps among intersecting candidates, with simplified outlines."""
+    total = len(parcel_ids)
+    if not total:
+        return [], 0
+    overlap_area, parcel_area, ratio = overlap_metrics(parcel_geoms, geom)
+    overlap_area = np.nan_to_num(overlap_area)
+    if total > max_results:
+        top = np.argpartition(-overlap_area, max_results - 1)[:max_results]
+    else:
+        top = np.arange(total)
+    top = top[np.argsort(-overlap_area[top], kind='stable')]
+    simplified = shapely.simplify(parcel_geoms[top], tolerance, preserve_topology=True)
+
+    results = []
+    for pid, inter, area, pct, outline in zip(parcel_ids[top].tolist(), overlap_area[top].tolist(),
+                                              parcel_area[top].tolist(), ratio[top].tolist(), simplified):
+        results.append({
+            'parcel_id': pid,
+            'overlap_area': inter,
+            'parcel_area': area,
+            'overlap_pct': pct if area > 0 and pct == pct else None,
+            'geojson': outline.__geo_interface__,
+        })
+    return results, total
+
+
+def live_parcel_overlaps(geom, max_results=LIVE_MAX_RESULTS, tolerance=LIVE_SIMPLIFY_TOLERANCE):
+    """Latency-bounded overlap check for geometries being drawn on the map.
+
+    The index (or the cell_key prefilter) narrows the candidates, overlap areas are
+    computed in one vectorized pass, and only the max_results largest overlaps are
+    returned, with parcel outlines simplified to tolerance. Returns (results, total_intersecting).
+    """
+    if postgis_available():
+        try:
+            return _live_overlaps_postgis(geom, max_results, tolerance)
+        except SQLAlchemyError:
+            logger.exception('PostGIS live overlap query failed; using Shapely instead')
+    if SPATIAL_BACKEND == 'strtree':
+        return _live_overlaps_strtree(geom, max_results, tolerance)
+    return _live_overlaps_cells(geom, max_results, tolerance)
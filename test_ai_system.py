@@ -16,13 +16,16 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import app
 from models import db, LandApplication, LandConflict, User
-from ai_conflict import detect_conflicts
+from ai_conflict import detect_conflicts, detect_conflicts_batch
 from ai_conflict_enhanced import detect_conflicts_from_documents
 from duplicate_detector import detect_all_duplicates
 
 
-def test_single_application(app_id):
-    """Test AI detection for a single application."""
+def test_single_application(app_id, run_spatial=True):
+    """Test AI detection for a single application.
+
+    run_spatial=False skips TEST 1 (used when spatial detection already ran in batch).
+    """
     print(f"\n{'='*70}")
     print(f"TESTING APPLICATION ID: {app_id}")
     print(f"{'='*70}")
@@ -44,20 +47,21 @@ def test_single_application(app_id):
         print(f"   Documents: {len(application.documents)}")
         
         # Test 1: Spatial Conflicts
-        print(f"\n🗺️  TEST 1: Spatial Conflict Detection")
-        print(f"   {'.'*60}")
-        try:
-            spatial = detect_conflicts(app_id)
-            print(f"   ✅ Found {len(spatial)} spatial conflicts")
-            for i, conflict in enumerate(spatial, 1):
-                print(f"      {i}. Type: {conflict.conflict_type}")
-                print(f"         Confidence: {conflict.confidence_score*100:.1f}%")
-                if conflict.overlap_percentage:
-                    print(f"         Overlap: {conflict.overlap_percentage*100:.2f}%")
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-            import traceback
-            traceback.print_exc()
+        if run_spatial:
+            print(f"\n🗺️  TEST 1: Spatial Conflict Detection")
+            print(f"   {'.'*60}")
+            try:
+                spatial = detect_conflicts(app_id)
+                print(f"   ✅ Found {len(spatial)} spatial conflicts")
+                for i, conflict in enumerate(spatial, 1):
+                    print(f"      {i}. Type: {conflict.conflict_type}")
+                    print(f"         Confidence: {conflict.confidence_score*100:.1f}%")
+                    if conflict.overlap_percentage:
+                        print(f"         Overlap: {conflict.overlap_percentage*100:.2f}%")
+            except Exception as e:
+                print(f"   ❌ Error: {e}")
+                import traceback
+                traceback.print_exc()
         
         # Test 2: Document Similarity
         print(f"\n📄 TEST 2: Document Similarity Detection")
@@ -126,11 +130,21 @@ def test_all_applications():
         ).all()
         
         print(f"\nFound {len(applications)} applications")
+
+        # Spatial detection for every application in one batch instead of N full scans
+        print(f"\n🗺️  Spatial Conflict Detection (batch)")
+        try:
+            created = detect_conflicts_batch([a.id for a in applications])
+            print(f"   ✅ Created {sum(len(ids) for ids in created.values())} spatial conflicts")
+        except Exception as e:
+            print(f"   ❌ Error: {e}")
+            import traceback
+            traceback.print_exc()
         
         for i, application in enumerate(applications, 1):
             print(f"\n[{i}/{len(applications)}] Testing {application.reference_number}...")
             try:
-                test_single_application(application.id)
+                test_single_application(application.id, run_spatial=False)
             except Exception as e:
                 print(f"❌ Failed: {e}")
                 import traceback
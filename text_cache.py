@@ -0,0 +1,117 @@
+"""
+text_cache.py
+
+Content-addressed store of extracted document text, so OCR runs at most once per distinct file.
+
+Design:
+- text is stored once per distinct file in extracted_texts, keyed by the SHA-256 file_hash
+  plus document_processing.EXTRACTOR_VERSION; the same upload in several applications shares
+  one row, and bumping the extractor version retires every older row without a migration
+- document_texts(docs) answers a whole batch with one IN query per chunk and only calls
+  extract_document_text for hashes that have no row yet (once per hash, not per document);
+  document_text(doc) is the single-document form
+- documents without a stored file_hash are hashed from disk
+- image preprocessing depends on document_type; when one file is uploaded under several
+  types, the extraction of whichever is read first is the one cached
+- rows are written on their own connection, one short transaction per row, so the caller's
+  session is never committed or rolled back here; a concurrent writer of the same hash hits
+  the unique constraint and is ignored
+- callers that stream a file's pages themselves (duplicate_detector.document_identifiers)
+  hand a complete read to store_text(), so the file is not read again
+- empty extractions are not stored: an empty result usually means a missing file or OCR
+  binary, and should be retried once that is fixed
+- scripts/build_text_cache.py creates the table and fills it for existing documents
+"""
+import hashlib
+import logging
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from document_processing import EXTRACTOR_VERSION, extract_document_text
+from models import db, ExtractedText
+
+logger = logging.getLogger(__name__)
+
+QUERY_CHUNK_SIZE = 500
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_hash(doc):
+    """SHA-256 of a document's file: the stored file_hash, or computed from disk (None if unreadable)."""
+    if doc.file_hash:
+        return doc.file_hash
+    try:
+        return _hash_file(doc.file_path)
+    except OSError:
+        return None
+
+
+def cached_texts(file_hashes, version=EXTRACTOR_VERSION):
+    """{file_hash: text} for the hashes that already have a stored extraction."""
+    file_hashes = list(file_hashes)
+    found = {}
+    for start in range(0, len(file_hashes), QUERY_CHUNK_SIZE):
+        chunk = file_hashes[start:start + QUERY_CHUNK_SIZE]
+        found.update(db.session.execute(
+            select(ExtractedText.file_hash, ExtractedText.text)
+            .where(ExtractedText.file_hash.in_(chunk))
+            .where(ExtractedText.extractor_version == version)
+        ).all())
+    return found
+
+
+def store_text(file_hash, text, version=EXTRACTOR_VERSION):
+    """Store the complete extracted text of a file; empty text is not stored."""
+    if not text.strip():
+        return
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(ExtractedText).values(
+                file_hash=file_hash,
+                extractor_version=version,
+                text=text,
+                char_count=len(text),
+            ))
+    except IntegrityError:
+        pass  # stored concurrently by another worker
+    except SQLAlchemyError:
+        logger.warning('Could not store extracted text for %s', file_hash, exc_info=True)
+
+
+def document_texts(docs):
+    """{document id: extracted text} for a batch of Documents, extracting only uncached files."""
+    docs = list(docs)
+    hashes = {doc.id: document_hash(doc) for doc in docs}
+    texts = cached_texts({h for h in hashes.values() if h})
+    hits = len(texts)
+
+    result = {}
+    for doc in docs:
+        file_hash = hashes[doc.id]
+        if file_hash is None:
+            result[doc.id] = ''
+            continue
+        if file_hash not in texts:
+            # Postgres text columns reject NUL, which some PDF text layers contain
+            text = (extract_document_text(doc.file_path, doc.mime_type, doc.document_type) or '').replace('\x00', '')
+            texts[file_hash] = text
+            store_text(file_hash, text)
+        result[doc.id] = texts[file_hash]
+
+    if docs:
+        logger.debug('Text cache: %d documents, %d cached files, %d extracted',
+                     len(docs), hits, len(texts) - hits)
+    return result
+
+
+def document_text(doc):
+    """Extracted text of one Document, from the cache when possible."""
+    return document_texts([doc])[doc.id]
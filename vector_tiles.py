@@ -0,0 +1,160 @@
+"""
+vector_tiles.py
+
+Mapbox Vector Tiles for parcels and open applications, with an on-disk tile cache.
+
+Design:
+- get_tile(layer, z, x, y) returns MVT bytes, rendering through PostGIS (ST_AsMVT with a
+  zoom-dependent ST_SimplifyPreserveTopology) on a cache miss and writing the result to
+  TILE_CACHE_DIR/<layer>/<z>/<x>/<y>.mvt
+- invalidate_bounds(layer, bounds) deletes only the cached tiles, at every zoom level,
+  that a changed geometry's bounding box touches; call it with both the old and the
+  new geometry when a parcel or application is inserted, edited or changes status
+- without PostGIS get_tile returns None and nothing is cached
+"""
+import logging
+import os
+import tempfile
+
+from sqlalchemy import text
+
+from models import db
+from spatial_cells import tile_span
+from spatial_index import postgis_available
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', os.path.join(os.getcwd(), 'tile_cache'))
+
+MAX_ZOOM = 22
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# layer name -> (table, feature properties, extra WHERE clause)
+LAYERS = {
+    'parcels': (
+        'land_parcels',
+        ['id', 'parcel_number', 'status', 'land_use'],
+        'TRUE',
+    ),
+    'applications': (
+        'land_applications',
+        ['id', 'reference_number', 'status', 'land_use'],
+        "t.status IN ('pending', 'under_review', 'conflict')",
+    ),
+}
+
+MVT_MIME_TYPE = 'application/vnd.mapbox-vector-tile'
+
+
+def _tile_sql(layer):
+    table, props, where = LAYERS[layer]
+    columns = ', '.join(f't.{c}' for c in props)
+    return f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+        ),
+        features AS (
+            SELECT ST_AsMVTGeom(
+                       ST_Transform(ST_SimplifyPreserveTopology(t.coordinates, :tolerance), 3857),
+                       bounds.geom, {TILE_EXTENT}, {TILE_BUFFER}, true
+                   ) AS geom,
+                   {columns}
+            FROM {table} t, bounds
+            WHERE t.coordinates && ST_Transform(bounds.geom, 4326)
+              AND {where}
+        )
+        SELECT ST_AsMVT(features.*, :layer, {TILE_EXTENT}, 'geom')
+        FROM features
+        WHERE features.geom IS NOT NULL
+    """
+
+
+def simplify_tolerance(z):
+    """Simplification tolerance in degrees: about one tile unit at zoom z."""
+    return 360.0 / ((2 ** z) * TILE_EXTENT)
+
+
+def valid_tile(layer, z, x, y):
+    return layer in LAYERS and 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _cache_path(layer, z, x, y):
+    return os.path.join(TILE_CACHE_DIR, layer, str(z), str(x), f'{y}.mvt')
+
+
+def render_tile(layer, z, x, y):
+    """Render one tile from the database, or None when PostGIS is unavailable."""
+    if not postgis_available():
+        return None
+    row = db.session.execute(
+        text(_tile_sql(layer)),
+        {'z': z, 'x': x, 'y': y, 'tolerance': simplify_tolerance(z), 'layer': layer}
+    ).first()
+    return bytes(row[0]) if row and row[0] is not None else b''
+
+
+def get_tile(layer, z, x, y):
+    """Return MVT bytes for a tile, serving from the disk cache when possible."""
+    path = _cache_path(layer, z, x, y)
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read()
+    except FileNotFoundError:
+        pass
+
+    data = render_tile(layer, z, x, y)
+    if data is None:
+        return None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write-then-rename so a concurrent reader never sees a partial tile
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        logger.exception('Failed to cache tile %s/%s/%s/%s', layer, z, x, y)
+    return data
+
+
+def invalidate_bounds(layer, bounds):
+    """Delete cached tiles of a layer that intersect (minx, miny, maxx, maxy) in EPSG:4326.
+
+    Tiles are padded by one on every side to cover the render buffer. Returns the number
+    of files removed.
+    """
+    if bounds is None:
+        return 0
+    removed = 0
+    layer_dir = os.path.join(TILE_CACHE_DIR, layer)
+    if not os.path.isdir(layer_dir):
+        return 0
+    for z in range(MAX_ZOOM + 1):
+        z_dir = os.path.join(layer_dir, str(z))
+        if not os.path.isdir(z_dir):
+            continue
+        x0, y0, x1, y1 = tile_span(bounds, z)
+        x0, y0, x1, y1 = x0 - 1, y0 - 1, x1 + 1, y1 + 1
+        # walk only the cached directories instead of the full tile range
+        for x_name in os.listdir(z_dir):
+            if not x_name.isdigit() or not (x0 <= int(x_name) <= x1):
+                continue
+            x_dir = os.path.join(z_dir, x_name)
+            for y_name in os.listdir(x_dir):
+                stem = y_name[:-4] if y_name.endswith('.mvt') else None
+                if stem is None or not stem.isdigit() or not (y0 <= int(stem) <= y1):
+                    continue
+                try:
+                    os.remove(os.path.join(x_dir, y_name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+
+def invalidate_geometry(layer, geom):
+    """invalidate_bounds for a Shapely geometry (None is ignored)."""
+    if geom is None or geom.is_empty:
+        return 0
+    return invalidate_bounds(layer, geom.bounds)